@@ -11,28 +11,93 @@
 # ANY KIND, either express or implied. See the License for the specific
 # language governing permissions and limitations under the License.
 
+import os
+import threading
+
 import boto3
+from botocore.config import Config
+
+import kappa.executor
+import kappa.instrument
+
+# Each client keeps its own HTTP connection pool.  Size it so every
+# worker thread of kappa.executor can have a request in flight.
+DEFAULT_MAX_POOL_CONNECTIONS = int(os.environ.get(
+    'KAPPA_MAX_POOL_CONNECTIONS',
+    max(10, kappa.executor.DEFAULT_MAX_WORKERS)))
+
+
+class ClientPool(object):
+    """
+    Thread-safe cache of boto3 clients keyed by (profile, region, service).
+
+    One boto3 session is kept per profile, so credentials are resolved
+    once per profile and shared by the clients of every region.
+    """
+
+    def __init__(self, max_pool_connections=None):
+        if max_pool_connections is None:
+            max_pool_connections = DEFAULT_MAX_POOL_CONNECTIONS
+        self._config = Config(max_pool_connections=max_pool_connections)
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._clients = {}
+
+    def _get_session(self, profile_name):
+        # Caller holds self._lock; boto3 sessions are not thread-safe.
+        if profile_name not in self._sessions:
+            self._sessions[profile_name] = boto3.session.Session(
+                profile_name=profile_name)
+        return self._sessions[profile_name]
+
+    def get_client(self, service_name, profile_name=None, region_name=None):
+        key = (profile_name, region_name, service_name)
+        with self._lock:
+            if key not in self._clients:
+                session = self._get_session(profile_name)
+                client = session.client(
+                    service_name, region_name=region_name,
+                    config=self._config)
+                recorder = kappa.instrument.get_recorder()
+                if recorder is not None:
+                    recorder.attach(client)
+                self._clients[key] = client
+            return self._clients[key]
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+            self._clients.clear()
 
 
 class __AWS(object):
 
-    def __init__(self, profile_name=None, region_name=None):
-        self._client_cache = {}
-        self._session = boto3.session.Session(
-            region_name=region_name, profile_name=profile_name)
+    def __init__(self, pool, profile_name=None, region_name=None):
+        self._pool = pool
+        self.profile_name = profile_name
+        self.region_name = region_name
 
     def create_client(self, client_name):
-        if client_name not in self._client_cache:
-            self._client_cache[client_name] = self._session.client(
-                client_name)
-        return self._client_cache[client_name]
+        return self._pool.get_client(
+            client_name, self.profile_name, self.region_name)
+
+
+__Pool = ClientPool()
+
+
+def get_pool():
+    return __Pool
 
 
-__Singleton_AWS = None
+def configure(max_pool_connections=None):
+    """
+    Replace the shared client pool, e.g. to change its connection-pool
+    size.  Clients created before this keep working but are not reused.
+    """
+    global __Pool
+    __Pool = ClientPool(max_pool_connections=max_pool_connections)
+    return __Pool
 
 
 def get_aws(context):
-    global __Singleton_AWS
-    if __Singleton_AWS is None:
-        __Singleton_AWS = __AWS(context.profile, context.region)
-    return __Singleton_AWS
+    return __AWS(__Pool, context.profile, context.region)
@@ -0,0 +1,182 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+Canary releases through weighted alias routing.
+
+A new version first receives ``weight`` percent of the alias's traffic.
+Once ``window`` seconds have passed, its Duration and Errors metrics are
+compared with those of the stable version, and the alias is either moved
+to the new version entirely or routed back to the stable one.
+"""
+
+import datetime
+import logging
+import time
+
+import kappa.aws
+import kappa.metrics
+
+LOG = logging.getLogger(__name__)
+
+DefaultWeight = 10
+DefaultWindow = 600
+DefaultInterval = 60
+DefaultMaxLatencyIncrease = 0.2
+DefaultMaxErrorRateIncrease = 0.01
+DefaultMinInvocations = 20
+
+
+class Canary(object):
+
+    def __init__(self, function, weight=DefaultWeight, window=DefaultWindow,
+                 interval=DefaultInterval,
+                 max_latency_increase=DefaultMaxLatencyIncrease,
+                 max_error_rate_increase=DefaultMaxErrorRateIncrease,
+                 min_invocations=DefaultMinInvocations,
+                 on_no_data='rollback'):
+        if not 0 < weight < 100:
+            raise ValueError(
+                'canary weight must be between 0 and 100, got %r' % weight)
+        if interval <= 0 or interval % 60:
+            raise ValueError(
+                'canary interval must be a multiple of 60, got %r' % interval)
+        self.function = function
+        self.weight = weight
+        self.window = window
+        self.interval = interval
+        self.max_latency_increase = max_latency_increase
+        self.max_error_rate_increase = max_error_rate_increase
+        self.min_invocations = min_invocations
+        self.on_no_data = on_no_data
+        aws = kappa.aws.get_aws(function._context)
+        self._cloudwatch = aws.create_client('cloudwatch')
+
+    @classmethod
+    def from_config(cls, function, config):
+        if config is True:
+            config = {}
+        return cls(
+            function,
+            weight=config.get('weight', DefaultWeight),
+            window=config.get('window', DefaultWindow),
+            interval=config.get('interval', DefaultInterval),
+            max_latency_increase=config.get(
+                'max_latency_increase', DefaultMaxLatencyIncrease),
+            max_error_rate_increase=config.get(
+                'max_error_rate_increase', DefaultMaxErrorRateIncrease),
+            min_invocations=config.get(
+                'min_invocations', DefaultMinInvocations),
+            on_no_data=config.get('on_no_data', 'rollback'))
+
+    def version_stats(self, versions, start_time, end_time):
+        """
+        Return ``{version: {'invocations', 'errors', 'error_rate',
+        'p99'}}`` for the versions served through the alias.
+        """
+        resource = '%s:%s' % (self.function.name, self.function.alias)
+        queries = []
+        for version in versions:
+            dimensions = {'FunctionName': self.function.name,
+                          'Resource': resource,
+                          'ExecutedVersion': version}
+            for name, metric, stat in (('invocations', 'Invocations', 'Sum'),
+                                       ('errors', 'Errors', 'Sum'),
+                                       ('p99', 'Duration', 'p99')):
+                queries.append(kappa.metrics.metric_query(
+                    kappa.metrics.query_id(name, version), metric,
+                    dimensions, stat, period=self.interval))
+        results = kappa.metrics.get_metric_data(
+            self._cloudwatch, queries, start_time, end_time)
+        stats = {}
+        for version in versions:
+            def values(name):
+                return results[kappa.metrics.query_id(name, version)]['values']
+            invocations = sum(values('invocations'))
+            errors = sum(values('errors'))
+            p99 = values('p99')
+            stats[version] = {
+                'invocations': invocations,
+                'errors': errors,
+                'error_rate': errors / invocations if invocations else 0.0,
+                # The worst per-period p99 is a conservative stand-in for
+                # the p99 of the whole window.
+                'p99': max(p99) if p99 else None,
+            }
+        return stats
+
+    def evaluate(self, baseline, canary):
+        """
+        Return ``(promote, reason)`` for the stats of the two versions.
+        """
+        if canary['invocations'] < self.min_invocations:
+            return (self.on_no_data == 'promote',
+                    'only %d invocations of the new version' %
+                    canary['invocations'])
+        if canary['error_rate'] > \
+                baseline['error_rate'] + self.max_error_rate_increase:
+            return False, 'error rate %.2f%% vs %.2f%%' % (
+                canary['error_rate'] * 100, baseline['error_rate'] * 100)
+        if baseline['p99'] and canary['p99'] and canary['p99'] > \
+                baseline['p99'] * (1 + self.max_latency_increase):
+            return False, 'p99 duration %.1f ms vs %.1f ms' % (
+                canary['p99'], baseline['p99'])
+        return True, 'new version is within limits'
+
+    def run(self, stable, version):
+        """
+        Send part of the alias traffic to ``version``, watch it and then
+        promote or roll back.  Returns a dict with the ``decision``
+        (``promoted`` or ``rolled_back``), the ``reason`` and the
+        ``stats`` of both versions.
+        """
+        LOG.info('routing %d%% of %s to version %s', self.weight,
+                 self.function.alias, version)
+        self.function.update_alias(
+            stable, current=True,
+            weights={version: self.weight / 100.0})
+        start = datetime.datetime.utcnow()
+        deadline = time.time() + self.window
+        promote, reason, stats = None, None, {}
+        try:
+            while True:
+                time.sleep(min(self.interval,
+                               max(deadline - time.time(), 0)))
+                stats = self.version_stats(
+                    [stable, version], start, datetime.datetime.utcnow())
+                promote, reason = self.evaluate(
+                    stats[stable], stats[version])
+                if time.time() >= deadline:
+                    break
+                if not promote and stats[version]['invocations'] >= \
+                        self.min_invocations:
+                    # Clear regressions roll back without waiting out the
+                    # whole window.
+                    break
+        except BaseException:
+            # Never leave the alias split between versions.
+            LOG.warning('canary interrupted, routing %s back to version %s',
+                        self.function.alias, stable)
+            self.function.update_alias(stable, current=True, weights={})
+            raise
+        if promote:
+            LOG.info('promoting version %s: %s', version, reason)
+            self.function.update_alias(version, current=True, weights={})
+        else:
+            LOG.warning('rolling back to version %s: %s', stable, reason)
+            self.function.update_alias(stable, current=True, weights={})
+        return {'decision': 'promoted' if promote else 'rolled_back',
+                'reason': reason,
+                'stable': stable,
+                'version': version,
+                'stats': stats}
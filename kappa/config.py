@@ -0,0 +1,345 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+Finding, loading and validating ``kappa.yaml``.
+
+A config file may pull in other files and carry per-environment
+overrides::
+
+    include:
+      - common.yaml
+    lambda:
+      memory_size: 128
+    environments:
+      prod:
+        lambda:
+          memory_size: 1024
+
+Included files are merged first and the file itself on top; the selected
+environment (``--env`` or ``KAPPA_ENV``) is merged last.  The result is
+validated and then cached on disk, keyed on the path, environment and the
+modification times of every file involved, so an unchanged config is
+loaded without parsing YAML at all.
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import os
+import re
+
+import yaml
+
+LOG = logging.getLogger(__name__)
+
+ConfigNames = ['kappa.yaml', 'kappa.yml']
+
+# The libyaml based loader is an order of magnitude faster when present.
+YAMLLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+CacheVersion = 1
+
+ArnRegex = re.compile(r'^arn:aws[a-z-]*:([a-z0-9-]+):')
+
+
+class ConfigError(ValueError):
+
+    def __init__(self, path, errors):
+        self.path = path
+        self.errors = errors
+        super(ConfigError, self).__init__(
+            '%s:\n  %s' % (path, '\n  '.join(errors)))
+
+
+def cache_dir():
+    return os.environ.get('KAPPA_CACHE_DIR', os.path.join(
+        os.path.expanduser('~'), '.kappa', 'cache'))
+
+
+def find_config(config=None, start=None):
+    """
+    Return the absolute path of the config file, or None.
+
+    ``config`` may be a path (used as is) or a bare file name, which is
+    looked for in ``start`` (the current directory by default) and then
+    in each of its parents, as are the default names if it is None.
+    """
+    if config is not None and os.path.dirname(config):
+        path = os.path.abspath(config)
+        return path if os.path.isfile(path) else None
+    names = [config] if config else ConfigNames
+    directory = os.path.abspath(start or os.getcwd())
+    while True:
+        for name in names:
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                return path
+        parent = os.path.dirname(directory)
+        if not parent or parent == directory:
+            return None
+        directory = parent
+
+
+def merge(base, overlay):
+    """
+    Recursively merge ``overlay`` into a copy of ``base``.  Dicts are
+    merged key by key; anything else in ``overlay`` replaces ``base``.
+    """
+    result = dict(base)
+    for key, value in overlay.items():
+        if isinstance(value, dict) and isinstance(result.get(key), dict):
+            result[key] = merge(result[key], value)
+        else:
+            result[key] = copy.deepcopy(value)
+    return result
+
+
+def _read(path, files, seen):
+    path = os.path.abspath(path)
+    if path in seen:
+        raise ConfigError(path, ['include cycle: %s' % ' -> '.join(
+            seen + [path])])
+    with open(path, 'rb') as fp:
+        data = yaml.load(fp, Loader=YAMLLoader) or {}
+    if not isinstance(data, dict):
+        raise ConfigError(path, ['top level must be a mapping'])
+    files.append(path)
+    includes = data.pop('include', [])
+    if not isinstance(includes, list):
+        includes = [includes]
+    config = {}
+    for include in includes:
+        include_path = os.path.join(os.path.dirname(path), include)
+        config = merge(config, _read(include_path, files, seen + [path]))
+    return merge(config, data)
+
+
+def _fingerprint(files):
+    result = []
+    for path in files:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        result.append([path, st.st_mtime, st.st_size])
+    return result
+
+
+def _cache_path(path, env):
+    key = hashlib.sha1(
+        ('%s\0%s' % (path, env or '')).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir(), 'config', key + '.json')
+
+
+def _load_cached(path, env):
+    try:
+        with open(_cache_path(path, env)) as fp:
+            cached = json.load(fp)
+    except (IOError, OSError, ValueError):
+        return None
+    if cached.get('version') != CacheVersion:
+        return None
+    if _fingerprint(cached.get('files', [])) != cached.get('fingerprint'):
+        return None
+    return cached['config']
+
+
+def _store_cached(path, env, files, config):
+    cache_path = _cache_path(path, env)
+    try:
+        data = json.dumps({'version': CacheVersion,
+                           'files': files,
+                           'fingerprint': _fingerprint(files),
+                           'config': config})
+    except (TypeError, ValueError):
+        # YAML can express things JSON can't (dates, say); such configs
+        # are simply not cached.
+        LOG.debug('config %s is not cacheable', path)
+        return
+    try:
+        if not os.path.isdir(os.path.dirname(cache_path)):
+            os.makedirs(os.path.dirname(cache_path))
+        tmp_path = '%s.%d.tmp' % (cache_path, os.getpid())
+        with open(tmp_path, 'w') as fp:
+            fp.write(data)
+        getattr(os, 'replace', os.rename)(tmp_path, cache_path)
+    except (IOError, OSError):
+        LOG.debug('unable to write config cache %s', cache_path)
+
+
+def load(path, env=None, use_cache=True):
+    """
+    Load, merge and validate the config file at ``path`` and return it as
+    a dict.  Raises ConfigError listing every problem found.
+    """
+    path = os.path.abspath(path)
+    if env is None:
+        env = os.environ.get('KAPPA_ENV') or None
+    if use_cache:
+        config = _load_cached(path, env)
+        if config is not None:
+            LOG.debug('loaded %s from cache', path)
+            return config
+    files = []
+    config = _read(path, files, [])
+    environments = config.pop('environments', {}) or {}
+    if env is not None:
+        if env not in environments:
+            raise ConfigError(path, ['unknown environment: %s (known: %s)' % (
+                env, ', '.join(sorted(environments)) or 'none')])
+        config = merge(config, environments[env])
+    errors = validate(config)
+    if errors:
+        raise ConfigError(path, errors)
+    if use_cache:
+        _store_cached(path, env, files, config)
+    return config
+
+
+def _check_type(errors, value, types, where):
+    if not isinstance(value, types):
+        if not isinstance(types, tuple):
+            types = (types,)
+        names = ' or '.join(
+            'string' if t in (str, type(u'')) else t.__name__ for t in types)
+        errors.append('%s: expected %s, got %r' % (where, names, value))
+        return False
+    return True
+
+
+def _check_keys(errors, config, required, optional, where):
+    for key in required:
+        if key not in config:
+            errors.append('%s: missing required key %r' % (where, key))
+    known = set(required) | set(optional)
+    for key in sorted(config):
+        if key not in known:
+            LOG.warning('%s: unknown key %r', where, key)
+
+
+String = (str, type(u''))
+
+TopLevelKeys = {'profile': String, 'region': String, 'regions': list,
+                'iam': dict, 'lambda': dict}
+
+LambdaKeys = {'name': String, 'description': String, 'handler': String,
+              'runtime': String, 'memory_size': int, 'timeout': int,
+              'path': String, 'zipfile_name': String, 'test_data': String,
+              'permissions': list, 'event_sources': list, 's3': dict,
+              'reserved_concurrency': int, 'provisioned_concurrency': int,
+              'alias': String, 'canary': (bool, dict),
+              'dependencies': String + (dict,)}
+
+PermissionKeys = ['statement_id', 'action', 'principal']
+
+EventSourceKeys = {'batch_size': int, 'batching_window': int,
+                   'starting_position': String, 'enabled': bool,
+                   'parallelization_factor': int,
+                   'bisect_batch_on_function_error': bool,
+                   'maximum_retry_attempts': int,
+                   'maximum_record_age': int, 'tumbling_window': int,
+                   'template': String, 'keys': list}
+
+
+def validate(config):
+    """
+    Return a list of human readable problems with ``config``; empty if
+    it is valid.
+    """
+    import kappa.event_source
+
+    errors = []
+    _check_keys(errors, config, ['lambda'], TopLevelKeys, 'config')
+    for key, types in TopLevelKeys.items():
+        if key in config:
+            _check_type(errors, config[key], types, key)
+    for region in config.get('regions') or []:
+        _check_type(errors, region, String, 'regions[]')
+
+    iam = config.get('iam')
+    if isinstance(iam, dict):
+        policies = iam.get('policy', [])
+        if not isinstance(policies, list):
+            policies = [policies]
+        for i, policy in enumerate(policies):
+            where = 'iam.policy[%d]' % i
+            if _check_type(errors, policy, dict, where) and \
+                    'name' not in policy:
+                errors.append('%s: missing required key %r' % (where, 'name'))
+        if 'role' in iam:
+            _check_type(errors, iam['role'], (bool, dict), 'iam.role')
+
+    function = config.get('lambda')
+    if not isinstance(function, dict):
+        return errors
+    _check_keys(errors, function, ['handler'], LambdaKeys, 'lambda')
+    for key, types in LambdaKeys.items():
+        if key in function:
+            _check_type(errors, function[key], types, 'lambda.' + key)
+    handler = function.get('handler')
+    if isinstance(handler, String) and '.' not in handler:
+        errors.append('lambda.handler: expected module.function, got %r' % (
+            handler,))
+    memory_size = function.get('memory_size')
+    if isinstance(memory_size, int) and not 128 <= memory_size <= 10240:
+        errors.append('lambda.memory_size: must be between 128 and 10240')
+    timeout = function.get('timeout')
+    if isinstance(timeout, int) and not 1 <= timeout <= 900:
+        errors.append('lambda.timeout: must be between 1 and 900')
+    canary = function.get('canary')
+    if isinstance(canary, dict):
+        weight = canary.get('weight')
+        if isinstance(weight, (int, float)) and not 0 < weight < 100:
+            errors.append('lambda.canary.weight: must be between 0 and 100')
+        interval = canary.get('interval')
+        if isinstance(interval, int) and (interval <= 0 or interval % 60):
+            errors.append('lambda.canary.interval: must be a multiple of 60')
+    if isinstance(function.get('s3'), dict) and \
+            'bucket' not in function['s3']:
+        errors.append('lambda.s3: missing required key %r' % 'bucket')
+
+    for i, permission in enumerate(function.get('permissions') or []):
+        where = 'lambda.permissions[%d]' % i
+        if _check_type(errors, permission, dict, where):
+            for key in PermissionKeys:
+                if key not in permission:
+                    errors.append('%s: missing required key %r' % (
+                        where, key))
+
+    for i, source in enumerate(function.get('event_sources') or []):
+        where = 'lambda.event_sources[%d]' % i
+        if not _check_type(errors, source, dict, where):
+            continue
+        for key, types in EventSourceKeys.items():
+            if key in source:
+                _check_type(errors, source[key], types, where + '.' + key)
+        factor = source.get('parallelization_factor')
+        if isinstance(factor, int) and not 1 <= factor <= 10:
+            errors.append('%s.parallelization_factor: must be between 1 '
+                          'and 10' % where)
+        if 'arn' not in source:
+            errors.append('%s: missing required key %r' % (where, 'arn'))
+            continue
+        service_name = source.get('type')
+        if service_name is None:
+            match = ArnRegex.match(str(source['arn']))
+            if not match:
+                errors.append('%s: not an ARN: %r' % (where, source['arn']))
+                continue
+            service_name = match.group(1)
+        if service_name not in kappa.event_source.EventSourceTypes:
+            errors.append('%s: unsupported event source type %r' % (
+                where, service_name))
+    return errors
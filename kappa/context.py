@@ -16,10 +16,21 @@ import yaml
 import time
 import os
 
+import kappa.aws
+import kappa.emulator
+import kappa.executor
 import kappa.function
+import kappa.imports
+import kappa.latency
+import kappa.log
+import kappa.metrics
 import kappa.event_source
 import kappa.policy
+import kappa.profiler
 import kappa.role
+import kappa.trace
+import kappa.tune
+import kappa.watch
 
 LOG = logging.getLogger(__name__)
 
@@ -35,6 +46,7 @@ class Context(object):
         else:
             self.set_logger('kappa', logging.INFO)
         self.name = name
+        self._debug = debug
         LOG.debug('Name: %s', name)
 
         self.config = config
@@ -67,7 +79,25 @@ class Context(object):
 
     @property
     def region(self):
-        return self.config.get('region', None)
+        # Single region commands use the first of ``regions`` when no
+        # ``region`` is given.
+        region = self.config.get('region')
+        if region is None and self.config.get('regions'):
+            region = self.config['regions'][0]
+        return region
+
+    @property
+    def regions(self):
+        return self.config.get('regions') or [self.region]
+
+    def for_region(self, region):
+        """
+        Return a copy of this context that targets a single ``region``.
+        """
+        config = dict(self.config)
+        config.pop('regions', None)
+        config['region'] = region
+        return Context(self.name, config, self._debug)
 
     @property
     def lambda_config(self):
@@ -100,7 +130,14 @@ class Context(object):
         log = logging.getLogger(logger_name)
         log.setLevel(level)
 
+        # Replace the handler a previous Context installed rather than
+        # stacking another one, which would print every message twice.
+        for handler in list(log.handlers):
+            if getattr(handler, '_kappa_console', False):
+                log.removeHandler(handler)
+
         ch = logging.StreamHandler(None)
+        ch._kappa_console = True
         ch.setLevel(level)
 
         # create formatter
@@ -118,37 +155,30 @@ class Context(object):
     def _create_event_sources(self):
         if 'event_sources' in self.config['lambda']:
             for event_source_cfg in self.config['lambda']['event_sources']:
-                _, _, svc, _ = event_source_cfg['arn'].split(':', 3)
-                if svc == 'kinesis':
-                    self.event_sources.append(
-                        kappa.event_source.KinesisEventSource(
-                            self, event_source_cfg))
-                elif svc == 's3':
-                    self.event_sources.append(kappa.event_source.S3EventSource(
-                        self, event_source_cfg))
-                elif svc == 'sns':
-                    self.event_sources.append(
-                        kappa.event_source.SNSEventSource(
-                            self, event_source_cfg))
-                elif svc == 'dynamodb':
-                    self.event_sources.append(
-                        kappa.event_source.DynamoDBStreamEventSource(
-                            self, event_source_cfg))
-                else:
-                    msg = 'Unknown event source: %s' % event_source_cfg['arn']
-                    raise ValueError(msg)
+                event_source = kappa.event_source.create_event_source(
+                    self, event_source_cfg)
+                self.function.external_statement_ids.update(
+                    event_source.statement_ids)
+                self.event_sources.append(event_source)
+
+    def _map_event_sources(self, func):
+        # Sources that share an ARN read-modify-write the same resource
+        # (a bucket's notification configuration, for example) so they are
+        # kept in order; everything else runs concurrently.
+        return kappa.executor.map(
+            func, self.event_sources, key=lambda event_source: event_source.arn)
 
     def add_event_sources(self):
-        for event_source in self.event_sources:
-            event_source.add(self.function)
+        self._map_event_sources(
+            lambda event_source: event_source.add(self.function))
 
     def update_event_sources(self):
-        for event_source in self.event_sources:
-            event_source.update(self.function)
+        self._map_event_sources(
+            lambda event_source: event_source.update(self.function))
 
     def create(self):
         if self.policies:
-            [policy.create() for policy in self.policies]
+            kappa.executor.map(lambda policy: policy.create(), self.policies)
         if self.role:
             self.role.create()
         # There is a consistency problem here.
@@ -159,35 +189,148 @@ class Context(object):
         self.function.create()
 
     def deploy(self):
+        with kappa.trace.span('deploy', project=self.name):
+            self._deploy_iam()
+            self.function.deploy()
+
+    def _deploy_iam(self):
         if self.policies:
-            [policy.deploy() for policy in self.policies]
+            with kappa.trace.span('policies'):
+                kappa.executor.map(
+                    lambda policy: policy.deploy(), self.policies)
         if self.role:
-            self.role.create()
+            with kappa.trace.span('role'):
+                self.role.create()
         # There is a consistency problem here.
         # If you don't wait for a bit, the function.create call
         # will fail because the policy has not been attached to the role.
         LOG.debug('Waiting for policy/role propogation')
-        time.sleep(5)
-        self.function.deploy()
+        with kappa.trace.span('propagation_wait'):
+            time.sleep(5)
+
+    def deploy_regions(self, code_only=False):
+        """
+        Deploy the function to every region in ``regions`` concurrently.
+
+        IAM is global so policies and the role are deployed once, and the
+        package is built once and shared by all regions.  Returns one
+        dict per region with its ``status`` (``ok`` or ``failed``), any
+        ``error`` and the ``seconds`` it took.
+        """
+        contexts = [self.for_region(region) for region in self.regions]
+        with kappa.trace.span('deploy_regions', project=self.name,
+                              regions=len(contexts)):
+            if not code_only:
+                self._deploy_iam()
+            zipdata = self.function.build_package()
+
+            def deploy_region(context):
+                result = {'region': context.region, 'error': None}
+                start = time.time()
+                context.function.set_package(zipdata)
+                try:
+                    with kappa.trace.span('region', region=context.region):
+                        if code_only:
+                            ok = context.function.update()
+                        else:
+                            ok = context.function.deploy()
+                except Exception as e:
+                    LOG.exception('Unable to deploy to %s', context.region)
+                    ok = False
+                    result['error'] = str(e)
+                result['status'] = 'ok' if ok else 'failed'
+                result['seconds'] = time.time() - start
+                return result
+            return kappa.executor.map(
+                deploy_region, contexts, max_workers=len(contexts))
 
     def update_code(self):
         self.function.update()
 
+    def watch(self, debounce=0.3, poll_interval=0.5, follow_logs=False,
+              echo=None, use_inotify=True):
+        watcher = kappa.watch.Watcher(
+            self.function, debounce=debounce, poll_interval=poll_interval,
+            follow_logs=follow_logs, echo=echo, use_inotify=use_inotify)
+        watcher.run()
+
     def invoke(self, input, dry_run=False):
         return self.function.invoke(test_data=input, dry_run=dry_run)
 
+    def measure_latency(self, input, invocations=10, batches=1,
+                        force_cold=False):
+        probe = kappa.latency.LatencyProbe(
+            self.function, invocations=invocations, batches=batches,
+            force_cold=force_cold, test_data=input)
+        return probe.run()
+
     def invoke_async(self, input):
         return self.function.invoke_async(test_data=input)
 
     def invoke_local(self, input):
         return self.function.invoke_local(test_data=input)
 
+    def profile_local(self, input, mode='cprofile', output=None, top=20,
+                      interval=kappa.profiler.DefaultInterval):
+        """
+        Invoke the handler in-process under the profiler.  The profile is
+        written to ``output`` if given.
+        """
+        profiler = kappa.profiler.Profiler(
+            mode=mode, interval=interval, top=top,
+            memory_size=self.function.memory_size)
+        profile = self.function.invoke_local(
+            test_data=input, profiler=profiler)
+        profile['output'] = profiler.write(output) if output else None
+        return profile
+
+    def analyze_imports(self, input=None, repeat=3, invoke=True):
+        analyzer = kappa.imports.ImportAnalyzer(
+            self.function, repeat=repeat, invoke=invoke, test_data=input)
+        return analyzer.run()
+
+    def invoke_emulated(self, input=None):
+        return self.function.invoke_emulated(test_data=input)
+
+    def emulator_server(self, host='127.0.0.1', port=9001, concurrency=10):
+        emulator = self.function.emulator(concurrency=concurrency)
+        return kappa.emulator.EmulatorServer(emulator, host=host, port=port)
+
     def tail(self):
         return self.function.tail()
 
+    def log_stats(self, start_time, end_time):
+        return self.function.log.stats(start_time, end_time)
+
+    def metrics(self, start_time, end_time, function_names=None,
+                period=300):
+        """
+        Return the CloudWatch metrics of this function, or of each of
+        ``function_names``, over the window (epoch milliseconds).
+        """
+        aws = kappa.aws.get_aws(self)
+        return kappa.metrics.function_metrics(
+            aws.create_client('cloudwatch'),
+            function_names or [self.function.name],
+            kappa.metrics.to_datetime(start_time),
+            kappa.metrics.to_datetime(end_time), period=period)
+
+    def export_logs(self, directory, start_time, end_time, max_workers=None):
+        exporter = kappa.log.LogExporter(
+            self.function.log, directory, start_time, end_time,
+            max_workers=max_workers)
+        return exporter.run()
+
+    def tune(self, memory_sizes=None, invocations=10, strategy='cost',
+             restore=True):
+        tuner = kappa.tune.PowerTuner(
+            self.function, memory_sizes=memory_sizes,
+            invocations=invocations, strategy=strategy)
+        return tuner.run(restore=restore)
+
     def delete(self):
-        for event_source in self.event_sources:
-            event_source.remove(self.function)
+        self._map_event_sources(
+            lambda event_source: event_source.remove(self.function))
         self.function.log.delete()
         self.function.delete()
         time.sleep(5)
@@ -195,22 +338,19 @@ class Context(object):
             self.role.delete()
         time.sleep(5)
         if self.policies:
-            [policy.delete() for policy in self.policies]
+            kappa.executor.map(lambda policy: policy.delete(), self.policies)
 
     def status(self):
         status = {}
-        if self.policies:
-            status['policies'] = [policy.status() for policy in self.policies]
-        else:
-            status['policies'] = None
-        if self.role:
-            status['role'] = self.role.status()
-        else:
-            status['role'] = None
-        status['function'] = self.function.status()
-        status['event_sources'] = []
-        if self.event_sources:
-            for event_source in self.event_sources:
-                status['event_sources'].append(
-                    event_source.status(self.function))
+        policies, role, function, event_sources = kappa.executor.call(
+            lambda: kappa.executor.map(
+                lambda policy: policy.status(), self.policies or []),
+            lambda: self.role.status() if self.role else None,
+            self.function.status,
+            lambda: self._map_event_sources(
+                lambda event_source: event_source.status(self.function)))
+        status['policies'] = policies if self.policies else None
+        status['role'] = role
+        status['function'] = function
+        status['event_sources'] = event_sources
         return status
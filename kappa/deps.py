@@ -0,0 +1,202 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+Installing a function's third party dependencies.
+
+The dependencies listed in a ``requirements.txt`` or ``package.json`` /
+``package-lock.json`` are installed once into a cache directory named
+after a hash of the lockfile and the runtime.  Every build after that
+only hardlinks the cached files, together with the function source,
+into a staging directory which is then zipped.
+
+Python dependencies are installed as manylinux wheels for the function's
+runtime, not for the interpreter running kappa, so packages with
+compiled extensions work on Lambda whatever machine builds them.  A
+package without a suitable wheel fails to install.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import kappa.config
+
+LOG = logging.getLogger(__name__)
+
+CompleteMarker = '.kappa-complete'
+
+# The platform Lambda's python runtimes run on.
+LambdaPlatform = 'manylinux2014_x86_64'
+
+
+class DependencyError(Exception):
+    pass
+
+
+def link_tree(source, destination):
+    """
+    Recreate the files under ``source`` in ``destination`` as hardlinks,
+    copying when a link is not possible (e.g. across filesystems).
+    Existing files in ``destination`` are replaced.
+    """
+    for root, dirs, files in os.walk(source):
+        relroot = os.path.relpath(root, source)
+        target_root = os.path.normpath(os.path.join(destination, relroot))
+        if not os.path.isdir(target_root):
+            os.makedirs(target_root)
+        for filename in files:
+            if filename == CompleteMarker:
+                continue
+            src = os.path.join(root, filename)
+            dst = os.path.join(target_root, filename)
+            if os.path.lexists(dst):
+                os.remove(dst)
+            try:
+                os.link(src, dst)
+            except OSError:
+                shutil.copy2(src, dst)
+
+
+class DependencyCache(object):
+
+    def __init__(self, lockfile, runtime, local_cache=None, offline=False,
+                 root=None):
+        self.lockfile = os.path.abspath(lockfile)
+        self.runtime = runtime or ''
+        self.local_cache = local_cache
+        self.offline = offline
+        self.root = root or os.path.join(kappa.config.cache_dir(), 'deps')
+
+    @property
+    def kind(self):
+        name = os.path.basename(self.lockfile)
+        if name in ('package.json', 'package-lock.json'):
+            return 'node'
+        return 'python'
+
+    def _inputs(self):
+        if self.kind == 'node':
+            directory = os.path.dirname(self.lockfile)
+            return [os.path.join(directory, name)
+                    for name in ('package.json', 'package-lock.json')
+                    if os.path.exists(os.path.join(directory, name))]
+        return [self.lockfile]
+
+    @property
+    def key(self):
+        sha = hashlib.sha256()
+        sha.update(('%s\0%s\0' % (self.kind, self.runtime)).encode('utf-8'))
+        for path in self._inputs():
+            sha.update(os.path.basename(path).encode('utf-8') + b'\0')
+            with open(path, 'rb') as fp:
+                sha.update(fp.read())
+        return sha.hexdigest()[:32]
+
+    @property
+    def path(self):
+        return os.path.join(self.root, '%s-%s' % (self.kind, self.key))
+
+    def _install_python(self, target):
+        command = [sys.executable, '-m', 'pip', 'install', '--quiet',
+                   '--disable-pip-version-check', '--no-compile',
+                   '--target', target, '-r', self.lockfile]
+        version = self.runtime[len('python'):]
+        if self.runtime.startswith('python') and version:
+            command += ['--platform', LambdaPlatform,
+                        '--implementation', 'cp',
+                        '--python-version', version,
+                        '--only-binary=:all:']
+        if self.local_cache:
+            command += ['--find-links', self.local_cache]
+        if self.offline:
+            command += ['--no-index']
+        return command
+
+    def _install_node(self, target):
+        for path in self._inputs():
+            shutil.copy2(path, target)
+        if os.path.exists(os.path.join(target, 'package-lock.json')):
+            command = ['npm', 'ci']
+        else:
+            command = ['npm', 'install']
+        command += ['--production', '--no-audit', '--no-fund',
+                    '--prefix', target]
+        if self.local_cache:
+            command += ['--cache', self.local_cache]
+        if self.offline:
+            command += ['--offline']
+        return command
+
+    def ensure(self):
+        """
+        Return the directory holding the installed dependencies, installing
+        them first if this lockfile and runtime have not been seen before.
+        """
+        path = self.path
+        if os.path.exists(os.path.join(path, CompleteMarker)):
+            LOG.debug('using cached dependencies in %s', path)
+            return path
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+        # Install somewhere private and move into place when done so a
+        # failed or concurrent build never leaves a half-filled cache.
+        target = tempfile.mkdtemp(prefix='build-', dir=self.root)
+        try:
+            if self.kind == 'node':
+                command = self._install_node(target)
+            else:
+                command = self._install_python(target)
+            LOG.info('installing dependencies from %s', self.lockfile)
+            LOG.debug('running %s', ' '.join(command))
+            try:
+                subprocess.check_call(command)
+            except (OSError, subprocess.CalledProcessError) as e:
+                raise DependencyError('Unable to install %s: %s' % (
+                    self.lockfile, e))
+            if self.kind == 'node':
+                for path_name in self._inputs():
+                    os.remove(os.path.join(
+                        target, os.path.basename(path_name)))
+            open(os.path.join(target, CompleteMarker), 'w').close()
+            try:
+                os.rename(target, path)
+            except OSError:
+                # Another build of the same key won the race.
+                if not os.path.exists(os.path.join(path, CompleteMarker)):
+                    raise
+            return path
+        finally:
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+
+
+def stage(source, dependencies, staging):
+    """
+    Fill ``staging`` with hardlinks to the installed ``dependencies`` and
+    the function ``source`` (which wins where names collide) and return
+    it.
+    """
+    if os.path.isdir(staging):
+        shutil.rmtree(staging)
+    os.makedirs(staging)
+    link_tree(dependencies, staging)
+    if os.path.isdir(source):
+        link_tree(source, staging)
+    else:
+        shutil.copy2(source, staging)
+    return staging
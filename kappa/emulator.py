@@ -0,0 +1,451 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+A local stand-in for the Lambda service.
+
+Each execution environment is a worker subprocess that imports the handler
+once and then serves invocations over a line-oriented JSON protocol on its
+stdin/stdout, so warm invocations reuse the imported module just like Lambda
+does.  Workers run with an address-space limit derived from ``memory_size``
+and are killed when an invocation runs past ``timeout``.  Everything the
+handler writes to stdout/stderr is captured and returned with a START/END/
+REPORT block in the same format CloudWatch Logs shows.
+
+``EmulatorServer`` exposes the Lambda Invoke API on localhost so boto3
+clients (``endpoint_url='http://127.0.0.1:<port>'``) and load generators can
+drive the emulator concurrently.
+"""
+
+import base64
+import json
+import logging
+import math
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+LOG = logging.getLogger(__name__)
+
+InvokePathRegex = re.compile(
+    r'^/2015-03-31/functions/(?P<name>[^/]+)/invocations')
+
+# The Invoke API only returns the last 4KB of the log in X-Amz-Log-Result.
+LogTailSize = 4096
+
+
+class _Worker(object):
+
+    def __init__(self, path, handler, function_name, memory_size, timeout):
+        self.function_name = function_name
+        self.memory_size = memory_size
+        self.timeout = timeout
+        self.init_duration = None
+        self.invocations = 0
+        # Make sure the worker can import kappa even if it is not installed.
+        env = dict(os.environ)
+        kappa_root = os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__)))
+        env['PYTHONPATH'] = os.pathsep.join(
+            [kappa_root] + [p for p in [env.get('PYTHONPATH')] if p])
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'kappa.emulator', path, handler,
+             function_name, str(memory_size), str(timeout)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env)
+        ready = self._read()
+        if ready is None:
+            raise RuntimeError('worker for %s failed to start' % handler)
+        self.init_error = ready.get('error')
+        self.init_duration = ready['init_duration']
+
+    def _read(self):
+        line = self.process.stdout.readline()
+        if not line:
+            return None
+        return json.loads(line.decode('utf-8'))
+
+    def invoke(self, event, request_id):
+        request = json.dumps({'event': event, 'request_id': request_id})
+        timed_out = []
+
+        def kill():
+            timed_out.append(True)
+            self.process.kill()
+
+        timer = threading.Timer(self.timeout, kill)
+        timer.start()
+        try:
+            self.process.stdin.write(request.encode('utf-8') + b'\n')
+            self.process.stdin.flush()
+            response = self._read()
+        except (IOError, OSError):
+            response = None
+        finally:
+            timer.cancel()
+        if timed_out:
+            # Reap the killed worker so it is never handed out again.
+            self.process.wait()
+        self.invocations += 1
+        if response is None:
+            if timed_out:
+                message = 'Task timed out after %.2f seconds' % self.timeout
+            else:
+                message = 'Runtime exited with error: exit status %s' % (
+                    self.process.poll(),)
+            response = {
+                'error': {'errorMessage': message,
+                          'errorType': 'Runtime.ExitError'},
+                'logs': '',
+                'duration': self.timeout * 1000.0 if timed_out else 0.0,
+                'max_memory_used': self.memory_size if not timed_out else 0}
+            response['timed_out'] = bool(timed_out)
+        return response
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def stop(self):
+        if self.alive:
+            self.process.stdin.close()
+            self.process.wait()
+
+
+class Emulator(object):
+    """
+    Run a Python handler locally with Lambda's timeout, memory and logging
+    behavior.  Up to ``concurrency`` invocations run at once; each uses
+    an idle warm worker if there is one and starts a new one otherwise.
+    """
+
+    def __init__(self, path, handler, function_name='FunctionName',
+                 memory_size=128, timeout=3, concurrency=10):
+        self.path = os.path.abspath(path)
+        self.handler = handler
+        self.function_name = function_name
+        self.memory_size = memory_size
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self._idle = []
+        self._busy = 0
+        self._cond = threading.Condition()
+
+    def _acquire(self):
+        with self._cond:
+            while not self._idle and self._busy >= self.concurrency:
+                self._cond.wait()
+            self._busy += 1
+            if self._idle:
+                return self._idle.pop()
+        try:
+            return _Worker(self.path, self.handler, self.function_name,
+                           self.memory_size, self.timeout)
+        except Exception:
+            self._release(None)
+            raise
+
+    def _release(self, worker):
+        with self._cond:
+            self._busy -= 1
+            if worker is not None and worker.alive:
+                self._idle.append(worker)
+            self._cond.notify()
+
+    def invoke(self, event):
+        """
+        Invoke the handler with ``event`` and return a dict with the
+        ``result`` (or ``error``), the captured ``log`` including the
+        START/END/REPORT lines, and the parsed ``report`` fields.
+        """
+        request_id = str(uuid.uuid4())
+        worker = self._acquire()
+        cold = worker.invocations == 0
+        try:
+            if worker.init_error:
+                response = {'error': worker.init_error, 'logs': '',
+                            'duration': 0.0, 'max_memory_used': 0}
+                worker.stop()
+            else:
+                response = worker.invoke(event, request_id)
+        finally:
+            self._release(worker)
+        report = {
+            'duration': response['duration'],
+            'billed_duration': float(math.ceil(response['duration'])),
+            'memory_size': float(self.memory_size),
+            'max_memory_used': float(response['max_memory_used']),
+        }
+        if cold:
+            report['init_duration'] = worker.init_duration
+        return {
+            'request_id': request_id,
+            'result': response.get('result'),
+            'error': response.get('error'),
+            'log': self._format_log(request_id, response, report),
+            'report': report,
+        }
+
+    def _format_log(self, request_id, response, report):
+        lines = ['START RequestId: %s Version: $LATEST\n' % request_id]
+        lines.append(response['logs'])
+        if response.get('timed_out'):
+            lines.append('%s %s %s\n' % (
+                time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime()),
+                request_id, response['error']['errorMessage']))
+        lines.append('END RequestId: %s\n' % request_id)
+        fields = ['REPORT RequestId: %s' % request_id,
+                  'Duration: %.2f ms' % report['duration'],
+                  'Billed Duration: %d ms' % report['billed_duration'],
+                  'Memory Size: %d MB' % report['memory_size'],
+                  'Max Memory Used: %d MB' % report['max_memory_used']]
+        if 'init_duration' in report:
+            fields.append('Init Duration: %.2f ms' % report['init_duration'])
+        lines.append('\t'.join(fields) + '\t\n')
+        return ''.join(lines)
+
+    def shutdown(self):
+        with self._cond:
+            workers, self._idle = self._idle, []
+        for worker in workers:
+            worker.stop()
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+
+class _InvokeHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, fmt, *args):
+        LOG.debug(fmt, *args)
+
+    def _send(self, status, body, headers=None):
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, error_type, message):
+        self._send(status, json.dumps({'Type': 'User', 'message': message}),
+                   {'X-Amzn-ErrorType': error_type})
+
+    def do_POST(self):
+        emulator = self.server.emulator
+        match = InvokePathRegex.match(self.path)
+        if not match:
+            return self._send_error(404, 'UnknownOperationException',
+                                    'Unknown operation')
+        name = match.group('name').split(':')[-1]
+        if name not in (emulator.function_name, 'function'):
+            return self._send_error(
+                404, 'ResourceNotFoundException',
+                'Function not found: %s' % match.group('name'))
+        length = int(self.headers.get('Content-Length') or 0)
+        payload = self.rfile.read(length).decode('utf-8') if length else ''
+        try:
+            event = json.loads(payload) if payload else None
+        except ValueError:
+            return self._send_error(400, 'InvalidRequestContentException',
+                                    'Could not parse request body into json')
+        invocation_type = self.headers.get(
+            'X-Amz-Invocation-Type', 'RequestResponse')
+        if invocation_type == 'DryRun':
+            return self._send(204, b'')
+        if invocation_type == 'Event':
+            thread = threading.Thread(target=emulator.invoke, args=(event,))
+            thread.daemon = True
+            thread.start()
+            return self._send(202, b'')
+        response = emulator.invoke(event)
+        headers = {'X-Amz-Executed-Version': '$LATEST'}
+        if self.headers.get('X-Amz-Log-Type') == 'Tail':
+            tail = response['log'].encode('utf-8')[-LogTailSize:]
+            headers['X-Amz-Log-Result'] = base64.b64encode(tail).decode(
+                'ascii')
+        if response['error']:
+            headers['X-Amz-Function-Error'] = 'Unhandled'
+            body = json.dumps(response['error'])
+        else:
+            body = json.dumps(response['result'])
+        self._send(200, body, headers)
+
+
+class EmulatorServer(object):
+    """
+    Serve the Lambda Invoke API for ``emulator`` on ``host``:``port``.
+    Pass ``port=0`` to let the OS pick a free port.
+    """
+
+    def __init__(self, emulator, host='127.0.0.1', port=9001):
+        self.emulator = emulator
+        self._server = _ThreadingHTTPServer((host, port), _InvokeHandler)
+        self._server.emulator = emulator
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    @property
+    def endpoint_url(self):
+        return 'http://%s:%d' % self.address
+
+    def serve_forever(self):
+        try:
+            self._server.serve_forever()
+        finally:
+            self.emulator.shutdown()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self.emulator.shutdown()
+
+
+def _virtual_memory_size():
+    try:
+        with open('/proc/self/statm') as fp:
+            pages = int(fp.read().split()[0])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _max_memory_used():
+    try:
+        import resource
+    except ImportError:
+        return 0
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return max_rss // (1024 * 1024)
+    return max_rss // 1024
+
+
+def _limit_memory(memory_size):
+    # The interpreter's own footprint is not charged to the handler, so
+    # the limit is memory_size on top of the address space in use now.
+    try:
+        import resource
+    except ImportError:
+        return
+    baseline = _virtual_memory_size()
+    if baseline is None:
+        return
+    limit = baseline + memory_size * 1024 * 1024
+    try:
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ValueError, resource.error):
+        LOG.debug('unable to set memory limit')
+
+
+def _format_error(exc_info):
+    exc_type, exc_value, tb = exc_info
+    return {'errorMessage': str(exc_value),
+            'errorType': exc_type.__name__,
+            'stackTrace': traceback.format_tb(tb)}
+
+
+def _worker_main(args):
+    path, handler, function_name, memory_size, timeout = args
+    memory_size = int(memory_size)
+    timeout = float(timeout)
+    # Keep a private copy of stdout for the protocol and point fds 1 and 2
+    # at a capture file for the duration of each invocation.
+    out = os.fdopen(os.dup(1), 'wb')
+    stderr_fd = os.dup(2)
+    capture = tempfile.TemporaryFile()
+
+    def send(message):
+        out.write(json.dumps(message).encode('utf-8') + b'\n')
+        out.flush()
+
+    def redirect(fd):
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(fd, 1)
+        os.dup2(fd, 2)
+
+    redirect(stderr_fd)
+    sys.path.insert(0, path)
+    from kappa.function import _FakeLambdaContext
+    _limit_memory(memory_size)
+    start = time.time()
+    try:
+        import importlib
+        module_name, func_name = handler.rsplit('.', 1)
+        func = getattr(importlib.import_module(module_name), func_name)
+        error = None
+    except Exception:
+        func = None
+        error = _format_error(sys.exc_info())
+    send({'init_duration': (time.time() - start) * 1000.0, 'error': error})
+    if func is None:
+        return
+    for line in iter(sys.stdin.readline, ''):
+        request = json.loads(line)
+        capture.seek(0)
+        capture.truncate()
+        redirect(capture.fileno())
+        start = time.time()
+        context = _FakeLambdaContext(
+            function_name=function_name, memory_size=memory_size,
+            timeout=timeout, start=start)
+        context.aws_request_id = request['request_id']
+        response = {}
+        try:
+            response['result'] = func(request['event'], context)
+        except Exception:
+            response['error'] = _format_error(sys.exc_info())
+        response['duration'] = (time.time() - start) * 1000.0
+        redirect(stderr_fd)
+        capture.seek(0)
+        response['logs'] = capture.read().decode('utf-8', 'replace')
+        response['max_memory_used'] = _max_memory_used()
+        try:
+            send(response)
+        except (TypeError, ValueError):
+            send({'error': {'errorMessage': 'Unable to marshal response',
+                            'errorType': 'Runtime.MarshalError'},
+                  'logs': response['logs'],
+                  'duration': response['duration'],
+                  'max_memory_used': response['max_memory_used']})
+
+
+if __name__ == '__main__':
+    _worker_main(sys.argv[1:])
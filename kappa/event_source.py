@@ -11,11 +11,16 @@
 # ANY KIND, either express or implied. See the License for the specific
 # language governing permissions and limitations under the License.
 
+import datetime
+import json
 import logging
+import threading
+import time
 
 from botocore.exceptions import ClientError
 
 import kappa.aws
+import kappa.metrics
 
 LOG = logging.getLogger(__name__)
 
@@ -38,17 +43,45 @@ class EventSource(object):
     def batch_size(self):
         return self._config.get('batch_size', 100)
 
+    @property
+    def batching_window(self):
+        return self._config.get('batching_window', None)
+
     @property
     def enabled(self):
         return self._config.get('enabled', True)
 
+    @property
+    def statement_ids(self):
+        """
+        Ids of the statements this source adds to the function's resource
+        policy, so they are not removed as stale permissions.
+        """
+        return []
+
 
 class KinesisEventSource(EventSource):
 
+    # Optional mapping settings as (config key, API field).  They are
+    # only sent when set in the config, so anything left out keeps the
+    # service default (or whatever was set on the mapping by hand).
+    Settings = [
+        ('batching_window', 'MaximumBatchingWindowInSeconds'),
+        ('parallelization_factor', 'ParallelizationFactor'),
+        ('bisect_batch_on_function_error', 'BisectBatchOnFunctionError'),
+        ('maximum_retry_attempts', 'MaximumRetryAttempts'),
+        ('maximum_record_age', 'MaximumRecordAgeInSeconds'),
+        ('tumbling_window', 'TumblingWindowInSeconds'),
+    ]
+
+    # How far back status looks for IteratorAge datapoints.
+    IteratorAgeWindow = 900
+
     def __init__(self, context, config):
         super(KinesisEventSource, self).__init__(context, config)
         aws = kappa.aws.get_aws(context)
         self._lambda = aws.create_client('lambda')
+        self._cloudwatch = aws.create_client('cloudwatch')
 
     def _get_uuid(self, function):
         uuid = None
@@ -60,31 +93,82 @@ class KinesisEventSource(EventSource):
             uuid = response['EventSourceMappings'][0]['UUID']
         return uuid
 
+    def _get_mapping(self, function):
+        uuid = self._get_uuid(function)
+        if not uuid:
+            LOG.debug('No UUID for event source %s', self.arn)
+            return None
+        try:
+            response = self._lambda.get_event_source_mapping(UUID=uuid)
+            LOG.debug(response)
+        except ClientError:
+            LOG.debug('event source %s does not exist', self.arn)
+            return None
+        return response
+
+    def _settings(self):
+        settings = {}
+        for key, field in self.Settings:
+            if self._config.get(key) is not None:
+                settings[field] = self._config[key]
+        return settings
+
+    def _create_args(self, function):
+        kwargs = {
+            'FunctionName': function.name,
+            'EventSourceArn': self.arn,
+            'BatchSize': self.batch_size,
+            'StartingPosition': self.starting_position,
+            'Enabled': self.enabled}
+        kwargs.update(self._settings())
+        return kwargs
+
+    def _update_args(self, function, current=None):
+        """
+        Return the arguments for updating the mapping.  Given the
+        ``current`` mapping, only the settings that differ from it are
+        included.
+        """
+        kwargs = {'BatchSize': self.batch_size,
+                  'Enabled': self.enabled}
+        kwargs.update(self._settings())
+        if current is not None:
+            state = current.get('State')
+            for field in list(kwargs):
+                if field == 'Enabled':
+                    same = state in (('Enabled', 'Enabling')
+                                     if self.enabled else
+                                     ('Disabled', 'Disabling'))
+                else:
+                    same = current.get(field) == kwargs[field]
+                if same:
+                    del kwargs[field]
+        kwargs['FunctionName'] = function.name
+        return kwargs
+
     def add(self, function):
         try:
             response = self._lambda.create_event_source_mapping(
-                FunctionName=function.name,
-                EventSourceArn=self.arn,
-                BatchSize=self.batch_size,
-                StartingPosition=self.starting_position,
-                Enabled=self.enabled
-            )
+                **self._create_args(function))
             LOG.debug(response)
         except Exception:
             LOG.exception('Unable to add event source')
 
     def update(self, function):
         response = None
-        uuid = self._get_uuid(function)
-        if uuid:
+        mapping = self._get_mapping(function)
+        if mapping:
+            kwargs = self._update_args(function, mapping)
+            if len(kwargs) == 1:
+                LOG.debug('event source %s is up to date', self.arn)
+                return None
             try:
                 response = self._lambda.update_event_source_mapping(
-                    BatchSize=self.batch_size,
-                    Enabled=self.enabled,
-                    FunctionName=function.arn)
+                    UUID=mapping['UUID'], **kwargs)
                 LOG.debug(response)
             except Exception:
                 LOG.exception('Unable to update event source')
+        return response
 
     def remove(self, function):
         response = None
@@ -95,20 +179,32 @@ class KinesisEventSource(EventSource):
             LOG.debug(response)
         return response
 
+    def iterator_age(self, function):
+        """
+        Return the latest maximum IteratorAge (milliseconds) of the
+        function, or None if there are no recent datapoints.
+        """
+        end = datetime.datetime.utcnow()
+        start = end - datetime.timedelta(seconds=self.IteratorAgeWindow)
+        query_id = kappa.metrics.query_id('iterator_age')
+        try:
+            results = kappa.metrics.get_metric_data(
+                self._cloudwatch,
+                [kappa.metrics.metric_query(
+                    query_id, 'IteratorAge',
+                    {'FunctionName': function.name}, 'Maximum')],
+                start, end)
+        except ClientError:
+            LOG.debug('unable to get IteratorAge for %s', function.name)
+            return None
+        values = results[query_id]['values']
+        return values[-1] if values else None
+
     def status(self, function):
-        response = None
         LOG.debug('getting status for event source %s', self.arn)
-        uuid = self._get_uuid(function)
-        if uuid:
-            try:
-                response = self._lambda.get_event_source_mapping(
-                    UUID=self._get_uuid(function))
-                LOG.debug(response)
-            except ClientError:
-                LOG.debug('event source %s does not exist', self.arn)
-                response = None
-        else:
-            LOG.debug('No UUID for event source %s', self.arn)
+        response = self._get_mapping(function)
+        if response is not None:
+            response['IteratorAge'] = self.iterator_age(function)
         return response
 
 
@@ -117,6 +213,31 @@ class DynamoDBStreamEventSource(KinesisEventSource):
     pass
 
 
+class SQSEventSource(KinesisEventSource):
+
+    Settings = [
+        ('batching_window', 'MaximumBatchingWindowInSeconds'),
+    ]
+
+    @property
+    def batch_size(self):
+        return self._config.get('batch_size', 10)
+
+    def _create_args(self, function):
+        kwargs = {
+            'FunctionName': function.name,
+            'EventSourceArn': self.arn,
+            'BatchSize': self.batch_size,
+            'Enabled': self.enabled}
+        kwargs.update(self._settings())
+        return kwargs
+
+    def status(self, function):
+        # Queues have no iterator to fall behind on.
+        LOG.debug('getting status for event source %s', self.arn)
+        return self._get_mapping(function)
+
+
 class S3EventSource(EventSource):
 
     def __init__(self, context, config):
@@ -179,6 +300,12 @@ class S3EventSource(EventSource):
 
 class SNSEventSource(EventSource):
 
+    # Maps topic ARN -> {endpoint: subscription}.  This is shared by all
+    # SNS event sources so a topic is only listed once per run no matter
+    # how many functions or sources refer to it.
+    _subscription_index = {}
+    _subscription_index_lock = threading.Lock()
+
     def __init__(self, context, config):
         super(SNSEventSource, self).__init__(context, config)
         aws = kappa.aws.get_aws(context)
@@ -187,24 +314,64 @@ class SNSEventSource(EventSource):
     def _make_notification_id(self, function_name):
         return 'Kappa-%s-notification' % function_name
 
-    def exists(self, function):
-        try:
+    @classmethod
+    def clear_subscription_index(cls):
+        with cls._subscription_index_lock:
+            cls._subscription_index.clear()
+
+    def _list_all_subscriptions(self):
+        # Topics with a large number of subscribers span many pages
+        # so we have to follow NextToken ourselves.
+        subscriptions = []
+        response = self._sns.list_subscriptions_by_topic(TopicArn=self.arn)
+        LOG.debug(response)
+        subscriptions += response['Subscriptions']
+        while response.get('NextToken'):
+            LOG.debug('getting another page of subscriptions')
             response = self._sns.list_subscriptions_by_topic(
-                TopicArn=self.arn)
+                TopicArn=self.arn, NextToken=response['NextToken'])
             LOG.debug(response)
-            for subscription in response['Subscriptions']:
-                if subscription['Endpoint'] == function.arn:
-                    return subscription
-            return None
+            subscriptions += response['Subscriptions']
+        return subscriptions
+
+    def _get_index(self):
+        with self._subscription_index_lock:
+            index = self._subscription_index.get(self.arn)
+        if index is None:
+            # Listing happens outside the lock so different topics can be
+            # listed concurrently; if two sources race on the same topic
+            # the first index stored wins.
+            index = {}
+            for subscription in self._list_all_subscriptions():
+                index[subscription['Endpoint']] = subscription
+            with self._subscription_index_lock:
+                index = self._subscription_index.setdefault(self.arn, index)
+        return index
+
+    def exists(self, function):
+        try:
+            return self._get_index().get(function.arn)
         except Exception:
             LOG.exception('Unable to find event source %s', self.arn)
 
     def add(self, function):
+        if self.exists(function):
+            LOG.debug('function %s already subscribed to %s',
+                      function.name, self.arn)
+            return
         try:
             response = self._sns.subscribe(
                 TopicArn=self.arn, Protocol='lambda',
                 Endpoint=function.arn)
             LOG.debug(response)
+            with self._subscription_index_lock:
+                index = self._subscription_index.get(self.arn)
+            if index is not None:
+                index[function.arn] = {
+                    'SubscriptionArn': response['SubscriptionArn'],
+                    'TopicArn': self.arn,
+                    'Protocol': 'lambda',
+                    'Endpoint': function.arn}
         except Exception:
             LOG.exception('Unable to add SNS event source')
 
@@ -219,9 +386,167 @@ class SNSEventSource(EventSource):
                 response = self._sns.unsubscribe(
                     SubscriptionArn=subscription['SubscriptionArn'])
                 LOG.debug(response)
+                with self._subscription_index_lock:
+                    self._subscription_index[self.arn].pop(function.arn, None)
         except Exception:
             LOG.exception('Unable to remove event source %s', self.arn)
 
     def status(self, function):
         LOG.debug('status for SNS notification for %s', function.name)
         return self.exists(function)
+
+
+class CloudWatchEventSource(EventSource):
+
+    PERMISSION_RETRIES = 5
+
+    def __init__(self, context, config):
+        super(CloudWatchEventSource, self).__init__(context, config)
+        aws = kappa.aws.get_aws(context)
+        self._events = aws.create_client('events')
+        self._lambda = aws.create_client('lambda')
+
+    @property
+    def rule_name(self):
+        return self.arn.split('/')[-1]
+
+    @property
+    def schedule(self):
+        return self._config.get('schedule', None)
+
+    @property
+    def pattern(self):
+        return self._config.get('pattern', None)
+
+    @property
+    def description(self):
+        return self._config.get('description', '')
+
+    def _make_statement_id(self):
+        return 'kappa-events-%s' % self.rule_name
+
+    @property
+    def statement_ids(self):
+        return [self._make_statement_id()]
+
+    def _put_rule(self):
+        kwargs = {
+            'Name': self.rule_name,
+            'State': 'ENABLED' if self.enabled else 'DISABLED',
+            'Description': self.description}
+        if self.schedule:
+            kwargs['ScheduleExpression'] = self.schedule
+        if self.pattern:
+            pattern = self.pattern
+            if isinstance(pattern, dict):
+                pattern = json.dumps(pattern)
+            kwargs['EventPattern'] = pattern
+        response = self._events.put_rule(**kwargs)
+        LOG.debug(response)
+        return response['RuleArn']
+
+    def _add_permission(self, function, rule_arn):
+        # Event sources are added concurrently, so other edits of the
+        # function's policy can collide with this one; Lambda then asks
+        # us to try again.
+        for attempt in range(self.PERMISSION_RETRIES):
+            try:
+                response = self._lambda.add_permission(
+                    FunctionName=function.name,
+                    StatementId=self._make_statement_id(),
+                    Action='lambda:InvokeFunction',
+                    Principal='events.amazonaws.com',
+                    SourceArn=rule_arn)
+                LOG.debug(response)
+                return
+            except ClientError as e:
+                error = e.response['Error']
+                if error['Code'] == 'ResourceConflictException' and \
+                        'already exists' in error.get('Message', ''):
+                    LOG.debug('permission for rule %s already exists',
+                              self.rule_name)
+                    return
+                if (error['Code'] not in ('ResourceConflictException',
+                                          'PreconditionFailedException') or
+                        attempt == self.PERMISSION_RETRIES - 1):
+                    raise
+                time.sleep(0.5 * (attempt + 1))
+
+    def add(self, function):
+        try:
+            rule_arn = self._put_rule()
+            self._add_permission(function, rule_arn)
+            response = self._events.put_targets(
+                Rule=self.rule_name,
+                Targets=[{'Id': function.name, 'Arn': function.arn}])
+            LOG.debug(response)
+        except Exception:
+            LOG.exception('Unable to add CloudWatch Events event source')
+
+    def update(self, function):
+        self.add(function)
+
+    def remove(self, function):
+        LOG.debug('removing CloudWatch Events event source')
+        try:
+            response = self._events.remove_targets(
+                Rule=self.rule_name, Ids=[function.name])
+            LOG.debug(response)
+            response = self._events.list_targets_by_rule(
+                Rule=self.rule_name)
+            LOG.debug(response)
+            if not response['Targets']:
+                response = self._events.delete_rule(Name=self.rule_name)
+                LOG.debug(response)
+            response = self._lambda.remove_permission(
+                FunctionName=function.name,
+                StatementId=self._make_statement_id())
+            LOG.debug(response)
+        except ClientError:
+            LOG.exception('Unable to remove event source %s', self.arn)
+
+    def status(self, function):
+        LOG.debug('status for CloudWatch Events rule %s', self.rule_name)
+        try:
+            response = self._events.list_targets_by_rule(
+                Rule=self.rule_name)
+            LOG.debug(response)
+            arns = [target['Arn'] for target in response['Targets']]
+            if function.arn not in arns:
+                return None
+            response = self._events.describe_rule(Name=self.rule_name)
+            LOG.debug(response)
+        except ClientError:
+            LOG.debug('rule %s does not exist', self.rule_name)
+            return None
+        # Report the rule the way Lambda reports its event source mappings.
+        response['EventSourceArn'] = self.arn
+        response['State'] = response.get('State', '').capitalize()
+        return response
+
+
+# Maps the service portion of an event source ARN (or an explicit
+# ``type`` in the event source config) to the class that manages it.
+EventSourceTypes = {}
+
+
+def register_event_source(service_name, cls):
+    EventSourceTypes[service_name] = cls
+
+
+def create_event_source(context, config):
+    service_name = config.get('type')
+    if service_name is None:
+        _, _, service_name, _ = config['arn'].split(':', 3)
+    if service_name not in EventSourceTypes:
+        msg = 'Unknown event source: %s' % config['arn']
+        raise ValueError(msg)
+    return EventSourceTypes[service_name](context, config)
+
+
+register_event_source('kinesis', KinesisEventSource)
+register_event_source('dynamodb', DynamoDBStreamEventSource)
+register_event_source('sqs', SQSEventSource)
+register_event_source('s3', S3EventSource)
+register_event_source('sns', SNSEventSource)
+register_event_source('events', CloudWatchEventSource)
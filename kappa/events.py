@@ -0,0 +1,346 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+Synthetic events in the shape Lambda delivers them.
+
+A generator turns a record number into one record for its event source
+(a Kinesis record with base64 data, an S3 ObjectCreated notification, a
+DynamoDB stream image, an SNS notification) and groups records into
+``{"Records": [...]}`` events of ``batch_size``.  Events are produced one
+at a time, so any number of them can be written with constant memory.
+
+The payload of each record comes from a template: any JSON value whose
+strings may contain these placeholders::
+
+    {n}     the record number, starting at 0
+    {uuid}  a random UUID
+    {rand}  a random integer between 0 and 999999
+    {now}   the record's timestamp, ISO 8601
+
+A placeholder may carry a format spec, as in ``{n:03d}``.  Any other text
+in braces, such as a JSON document inside a string, is left as it is.
+"""
+
+import base64
+import datetime
+import hashlib
+import json
+import logging
+import random
+import re
+import time
+import uuid
+
+LOG = logging.getLogger(__name__)
+
+DefaultTemplate = {'id': '{uuid}', 'sequence': '{n}', 'value': '{rand}'}
+
+# Synthetic records arrive this many milliseconds apart.
+RecordInterval = 10
+
+
+PlaceholderRegex = re.compile(r'\{(n|uuid|rand|now)(?::([^{}]*))?\}')
+
+
+class EventGenerator(object):
+
+    DefaultBatchSize = 100
+
+    def __init__(self, config, template=None, seed=None, start_time=None):
+        self._config = config
+        self.template = DefaultTemplate if template is None else template
+        self._random = random.Random(seed)
+        self.start_time = time.time() if start_time is None else start_time
+
+    @property
+    def arn(self):
+        return self._config['arn']
+
+    @property
+    def region(self):
+        return self.arn.split(':')[3]
+
+    @property
+    def batch_size(self):
+        return self._config.get('batch_size', self.DefaultBatchSize)
+
+    def _uuid(self):
+        return str(uuid.UUID(int=self._random.getrandbits(128), version=4))
+
+    def timestamp(self, n):
+        return self.start_time + n * RecordInterval / 1000.0
+
+    def isoformat(self, n):
+        return datetime.datetime.utcfromtimestamp(
+            self.timestamp(n)).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+    def _render(self, value, values):
+        if isinstance(value, dict):
+            return dict((k, self._render(v, values))
+                        for k, v in value.items())
+        if isinstance(value, list):
+            return [self._render(v, values) for v in value]
+        if isinstance(value, (str, type(u''))):
+            # A string that is only a number placeholder stays a number.
+            if value in ('{n}', '{rand}'):
+                return values[value[1:-1]]
+            return PlaceholderRegex.sub(
+                lambda m: format(values[m.group(1)], m.group(2) or ''), value)
+        return value
+
+    def payload(self, n):
+        values = dict(n=n, uuid=self._uuid(),
+                      rand=self._random.randint(0, 999999),
+                      now=self.isoformat(n))
+        return self._render(self.template, values)
+
+    def events(self, count):
+        """
+        Yield events holding ``count`` records in total.
+        """
+        batch = []
+        for n in range(count):
+            batch.append(self.record(n))
+            if len(batch) >= self.batch_size:
+                yield {'Records': batch}
+                batch = []
+        if batch:
+            yield {'Records': batch}
+
+    def write(self, fp, count):
+        """
+        Write the events for ``count`` records to the binary file ``fp``
+        as JSON lines and return the number of events written.
+        """
+        written = 0
+        for event in self.events(count):
+            line = json.dumps(event, separators=(',', ':')) + '\n'
+            fp.write(line.encode('utf-8'))
+            written += 1
+        return written
+
+
+class KinesisEvents(EventGenerator):
+
+    # Kinesis sequence numbers are 56 digit decimal strings.
+    SequenceBase = 49545115243490985018280067714973144582180062593244200961
+
+    def sequence_number(self, n):
+        return str(self.SequenceBase + n)
+
+    def record(self, n):
+        payload = self.payload(n)
+        data = json.dumps(payload).encode('utf-8')
+        sequence_number = self.sequence_number(n)
+        partition_key = payload.get('id', str(n)) \
+            if isinstance(payload, dict) else str(n)
+        return {
+            'kinesis': {
+                'kinesisSchemaVersion': '1.0',
+                'partitionKey': str(partition_key),
+                'sequenceNumber': sequence_number,
+                'data': base64.b64encode(data).decode('ascii'),
+                'approximateArrivalTimestamp': self.timestamp(n)},
+            'eventSource': 'aws:kinesis',
+            'eventVersion': '1.0',
+            'eventID': 'shardId-000000000000:%s' % sequence_number,
+            'eventName': 'aws:kinesis:record',
+            'awsRegion': self.region,
+            'eventSourceARN': self.arn}
+
+
+def attribute_value(value):
+    """
+    Convert a plain JSON value to DynamoDB's typed attribute format.
+    """
+    if value is None:
+        return {'NULL': True}
+    if isinstance(value, bool):
+        return {'BOOL': value}
+    if isinstance(value, (int, float)):
+        return {'N': str(value)}
+    if isinstance(value, list):
+        return {'L': [attribute_value(v) for v in value]}
+    if isinstance(value, dict):
+        return {'M': dict((k, attribute_value(v))
+                          for k, v in value.items())}
+    return {'S': value}
+
+
+class DynamoDBEvents(EventGenerator):
+
+    SequenceBase = 111000000000000000000000
+
+    @property
+    def keys(self):
+        keys = self._config.get('keys')
+        if keys:
+            return keys
+        if isinstance(self.template, dict) and self.template:
+            return [sorted(self.template)[0]]
+        return []
+
+    def record(self, n):
+        payload = self.payload(n)
+        if not isinstance(payload, dict):
+            payload = {'value': payload}
+        image = attribute_value(payload)['M']
+        keys = dict((k, image[k]) for k in self.keys if k in image)
+        return {
+            'eventID': self._uuid().replace('-', ''),
+            'eventName': 'INSERT',
+            'eventVersion': '1.1',
+            'eventSource': 'aws:dynamodb',
+            'awsRegion': self.region,
+            'dynamodb': {
+                'ApproximateCreationDateTime': int(self.timestamp(n)),
+                'Keys': keys,
+                'NewImage': image,
+                'SequenceNumber': str(self.SequenceBase + n),
+                'SizeBytes': len(json.dumps(image)),
+                'StreamViewType': 'NEW_AND_OLD_IMAGES'},
+            'eventSourceARN': self.arn}
+
+
+class S3Events(EventGenerator):
+
+    DefaultBatchSize = 1
+
+    @property
+    def bucket(self):
+        return self.arn.split(':')[-1]
+
+    @property
+    def event_name(self):
+        events = self._config.get('events') or ['s3:ObjectCreated:*']
+        name = events[0].split(':', 1)[-1]
+        return name.replace('*', 'Put')
+
+    def record(self, n):
+        payload = self.payload(n)
+        if isinstance(payload, dict):
+            key = payload.get('key', 'incoming/%d.json' % n)
+            body = json.dumps(payload).encode('utf-8')
+        else:
+            key = str(payload)
+            body = key.encode('utf-8')
+        return {
+            'eventVersion': '2.1',
+            'eventSource': 'aws:s3',
+            'awsRegion': self.region or 'us-east-1',
+            'eventTime': self.isoformat(n),
+            'eventName': self.event_name,
+            'userIdentity': {'principalId': 'EXAMPLE'},
+            'requestParameters': {'sourceIPAddress': '127.0.0.1'},
+            'responseElements': {
+                'x-amz-request-id': '%016X' % self._random.getrandbits(64),
+                'x-amz-id-2': 'EXAMPLE'},
+            's3': {
+                's3SchemaVersion': '1.0',
+                'configurationId': 'kappa',
+                'bucket': {
+                    'name': self.bucket,
+                    'ownerIdentity': {'principalId': 'EXAMPLE'},
+                    'arn': self.arn},
+                'object': {
+                    'key': key,
+                    'size': len(body),
+                    'eTag': hashlib.md5(body).hexdigest(),
+                    'sequencer': '%016X' % n}}}
+
+
+class SNSEvents(EventGenerator):
+
+    DefaultBatchSize = 1
+
+    def record(self, n):
+        payload = self.payload(n)
+        message_id = self._uuid()
+        return {
+            'EventSource': 'aws:sns',
+            'EventVersion': '1.0',
+            'EventSubscriptionArn': '%s:%s' % (self.arn, self._uuid()),
+            'Sns': {
+                'Type': 'Notification',
+                'MessageId': message_id,
+                'TopicArn': self.arn,
+                'Subject': None,
+                'Message': payload if isinstance(payload, (str, type(u'')))
+                else json.dumps(payload),
+                'Timestamp': self.isoformat(n),
+                'SignatureVersion': '1',
+                'Signature': 'EXAMPLE',
+                'SigningCertUrl': 'EXAMPLE',
+                'UnsubscribeUrl': 'EXAMPLE',
+                'MessageAttributes': {}}}
+
+
+def load_template(path):
+    with open(path) as fp:
+        return json.load(fp)
+
+
+def select_source(sources, source=None):
+    """
+    Pick the event source config to generate events for: the one at
+    index ``source``, the one whose ARN contains ``source``, or the first
+    one events can be generated for.  A ``source`` that matches nothing
+    is taken to be an ARN.
+    """
+    sources = sources or []
+    if source is None:
+        for config in sources:
+            if _service_name(config) in GeneratorTypes:
+                return config
+        raise ValueError('No event source to generate events for')
+    if source.isdigit():
+        index = int(source)
+        if index >= len(sources):
+            raise ValueError('No event source %d' % index)
+        return sources[index]
+    for config in sources:
+        if source in config['arn']:
+            return config
+    return {'arn': source}
+
+
+def _service_name(config):
+    service_name = config.get('type')
+    if service_name is None:
+        _, _, service_name, _ = config['arn'].split(':', 3)
+    return service_name
+
+
+GeneratorTypes = {}
+
+
+def register_generator(service_name, cls):
+    GeneratorTypes[service_name] = cls
+
+
+def create_generator(config, template=None, seed=None, start_time=None):
+    if template is None and config.get('template'):
+        template = load_template(config['template'])
+    service_name = _service_name(config)
+    if service_name not in GeneratorTypes:
+        msg = 'Cannot generate events for: %s' % config['arn']
+        raise ValueError(msg)
+    return GeneratorTypes[service_name](
+        config, template=template, seed=seed, start_time=start_time)
+
+
+register_generator('kinesis', KinesisEvents)
+register_generator('dynamodb', DynamoDBEvents)
+register_generator('s3', S3Events)
+register_generator('sns', SNSEvents)
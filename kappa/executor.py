@@ -0,0 +1,97 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+Run independent AWS calls concurrently.
+
+boto3 clients block, so overlapping calls means threads.  ``map`` and
+``call`` run their work on a bounded thread pool and hand back the
+results in order, which keeps the calling code as simple as the loop it
+replaces::
+
+    results = kappa.executor.map(lambda p: p.deploy(), policies)
+
+Work that must not overlap (two event sources writing the same bucket's
+notification configuration, say) can share a ``key`` and is then run
+one after the other on the same worker.
+"""
+
+import logging
+import os
+from collections import OrderedDict
+
+from concurrent.futures import ThreadPoolExecutor
+
+import kappa.trace
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = int(os.environ.get('KAPPA_MAX_WORKERS', 8))
+
+
+def _run_serially(func, items):
+    return [func(item) for item in items]
+
+
+def map(func, items, max_workers=None, key=None):
+    """
+    Call ``func`` on each of ``items`` concurrently and return the results
+    in the same order as ``items``.
+
+    At most ``max_workers`` calls are in flight at once.  If ``key`` is
+    given, items for which it returns the same value are run serially.
+    Every call is allowed to finish before the first exception raised by
+    any of them is re-raised.
+    """
+    items = list(items)
+    if max_workers is None:
+        max_workers = DEFAULT_MAX_WORKERS
+    groups = OrderedDict()
+    for index, item in enumerate(items):
+        group_key = key(item) if key else index
+        groups.setdefault(group_key, []).append((index, item))
+    if len(groups) <= 1 or max_workers <= 1:
+        return _run_serially(func, items)
+    results = [None] * len(items)
+    # Spans opened by the workers belong under the caller's span.
+    parent = kappa.trace.current_span()
+
+    def run_group(group_items):
+        with kappa.trace.activate(parent):
+            return _run_serially(func, group_items)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(groups))) as pool:
+        futures = [
+            (group, pool.submit(run_group, [item for _, item in group]))
+            for group in groups.values()]
+    error = None
+    for group, future in futures:
+        try:
+            for (index, _), result in zip(group, future.result()):
+                results[index] = result
+        except Exception as e:
+            LOG.debug('concurrent call failed: %s', e)
+            if error is None:
+                error = e
+    if error is not None:
+        raise error
+    return results
+
+
+def call(*funcs, **kwargs):
+    """
+    Call each of the zero-argument callables ``funcs`` concurrently and
+    return their results in order.  Accepts ``max_workers`` like ``map``.
+    """
+    return map(lambda func: func(), funcs,
+               max_workers=kwargs.get('max_workers'))
@@ -11,6 +11,7 @@
 # ANY KIND, either express or implied. See the License for the specific
 # language governing permissions and limitations under the License.
 
+import hashlib
 import logging
 import os
 import zipfile
@@ -20,14 +21,23 @@ import json
 from botocore.exceptions import ClientError
 
 import kappa.aws
+import kappa.canary
+import kappa.config
+import kappa.deps
+import kappa.emulator
+import kappa.executor
 import kappa.log
+import kappa.trace
 
 LOG = logging.getLogger(__name__)
 
 
 class Function(object):
-    DEFAULT_MEMORY = int(os.getenv('KAPPA_DEFAULT_TIMEOUT', '128'))
+    DEFAULT_MEMORY = int(os.getenv('KAPPA_DEFAULT_MEMORY', '128'))
     DEFAULT_TIMEOUT = int(os.getenv('KAPPA_DEFAULT_TIMEOUT', '3'))
+    POLL_INTERVAL = 5
+    PERMISSION_RETRIES = 5
+    PROVISIONED_CONCURRENCY_TIMEOUT = 900
 
     def __init__(self, context, config):
         self._context = context
@@ -37,6 +47,11 @@ class Function(object):
         self._s3_svc = aws.create_client('s3')
         self._arn = None
         self._log = None
+        self._zipdata = None
+        # Statement ids in the resource policy that belong to event
+        # sources and so must survive permission reconciliation.
+        self.external_statement_ids = set()
+        self.canary_result = None
 
     @property
     def name(self):
@@ -70,6 +85,15 @@ class Function(object):
     def s3(self):
         return self._config.get('s3', None)
 
+    @property
+    def s3_bucket(self):
+        # Lambda only reads code from a bucket in its own region, so
+        # multi-region projects can name one bucket per region.
+        bucket = self.s3['bucket']
+        if '{region}' in bucket:
+            bucket = bucket.format(region=self._context.region)
+        return bucket
+
     @property
     def s3_only(self):
         return self._config.get('s3', {}).get('only', False)
@@ -90,6 +114,29 @@ class Function(object):
     def permissions(self):
         return self._config.get('permissions', list())
 
+    @property
+    def reserved_concurrency(self):
+        return self._config.get('reserved_concurrency', None)
+
+    @property
+    def alias(self):
+        return self._config.get('alias', None)
+
+    @property
+    def provisioned_concurrency(self):
+        return self._config.get('provisioned_concurrency', None)
+
+    @property
+    def canary(self):
+        return self._config.get('canary', None)
+
+    @property
+    def dependencies(self):
+        dependencies = self._config.get('dependencies', None)
+        if dependencies and not isinstance(dependencies, dict):
+            dependencies = {'file': dependencies}
+        return dependencies
+
     @property
     def arn(self):
         if self._arn is None:
@@ -144,55 +191,201 @@ class Function(object):
         else:
             self._zip_lambda_file(zipfile_name, lambda_fn)
 
-    def add_permissions(self):
-        for permission in self.permissions:
+    def _get_policy_statements(self):
+        try:
+            response = self._lambda_svc.get_policy(FunctionName=self.name)
+            LOG.debug(response)
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ResourceNotFoundException':
+                return {}
+            raise
+        policy = json.loads(response['Policy'])
+        return dict((statement['Sid'], statement)
+                    for statement in policy.get('Statement', []))
+
+    def _permission_matches(self, permission, statement):
+        principal = statement.get('Principal', {})
+        if isinstance(principal, dict):
+            principal = list(principal.values())[0] if principal else None
+        wanted = str(permission['principal'])
+        if wanted.isdigit():
+            # Account principals come back as the account's root ARN.
+            wanted = 'arn:aws:iam::%s:root' % wanted
+        condition = statement.get('Condition', {})
+        source_arn = condition.get('ArnLike', {}).get('AWS:SourceArn')
+        source_account = condition.get('StringEquals', {}).get(
+            'AWS:SourceAccount')
+        # Lambda reports actions in its own casing (lambda:InvokeFunction)
+        # whatever casing they were added with.
+        action = statement.get('Action') or ''
+        return (action.lower() == permission['action'].lower() and
+                principal in (wanted, permission['principal']) and
+                source_arn == permission.get('source_arn') and
+                source_account == permission.get('source_account'))
+
+    def _add_permission(self, permission):
+        kwargs = {
+            'FunctionName': self.name,
+            'StatementId': permission['statement_id'],
+            'Action': permission['action'],
+            'Principal': permission['principal']}
+        source_arn = permission.get('source_arn', None)
+        if source_arn:
+            kwargs['SourceArn'] = source_arn
+        source_account = permission.get('source_account', None)
+        if source_account:
+            kwargs['SourceAccount'] = source_account
+        return self._lambda_svc.add_permission(**kwargs)
+
+    def _apply_permission_change(self, change):
+        action, statement_id, permission = change
+        # Concurrent edits of one resource policy can collide, in which
+        # case Lambda asks us to try again.
+        for attempt in range(self.PERMISSION_RETRIES):
             try:
-                kwargs = {
-                    'FunctionName': self.name,
-                    'StatementId': permission['statement_id'],
-                    'Action': permission['action'],
-                    'Principal': permission['principal']}
-                source_arn = permission.get('source_arn', None)
-                if source_arn:
-                    kwargs['SourceArn'] = source_arn
-                source_account = permission.get('source_account', None)
-                if source_account:
-                    kwargs['SourceAccount'] = source_account
-                response = self._lambda_svc.add_permission(**kwargs)
+                if action == 'remove':
+                    LOG.debug('removing permission %s', statement_id)
+                    response = self._lambda_svc.remove_permission(
+                        FunctionName=self.name, StatementId=statement_id)
+                else:
+                    LOG.debug('adding permission %s', statement_id)
+                    response = self._add_permission(permission)
                 LOG.debug(response)
-            except Exception:
-                LOG.exception('Unable to add permission')
+                return
+            except ClientError as e:
+                code = e.response['Error']['Code']
+                if (code not in ('ResourceConflictException',
+                                 'PreconditionFailedException') or
+                        attempt == self.PERMISSION_RETRIES - 1):
+                    raise
+                time.sleep(0.5 * (attempt + 1))
+
+    def permission_changes(self):
+        """
+        Compare the ``permissions`` in the config with the function's
+        resource policy and return the list of ``(action, statement_id,
+        permission)`` changes, where action is ``add`` or ``remove``.
+        Statements owned by event sources are left alone.
+        """
+        current = self._get_policy_statements()
+        wanted = dict((p['statement_id'], p) for p in self.permissions)
+        changes = []
+        for statement_id, statement in sorted(current.items()):
+            if statement_id in self.external_statement_ids:
+                continue
+            permission = wanted.get(statement_id)
+            if permission is None or not self._permission_matches(
+                    permission, statement):
+                changes.append(('remove', statement_id, None))
+        for statement_id, permission in sorted(wanted.items()):
+            statement = current.get(statement_id)
+            if statement is None or not self._permission_matches(
+                    permission, statement):
+                changes.append(('add', statement_id, permission))
+        return changes
+
+    def add_permissions(self):
+        try:
+            changes = self.permission_changes()
+        except Exception:
+            LOG.exception('Unable to read policy of %s', self.name)
+            return
+        if not changes:
+            LOG.debug('permissions of %s are up to date', self.name)
+            return
+        try:
+            # A changed statement is removed and re-added; keying on the
+            # statement id keeps those two steps in order.
+            kappa.executor.map(self._apply_permission_change, changes,
+                               key=lambda change: change[1])
+        except Exception:
+            LOG.exception('Unable to update permissions')
+
+    def set_package(self, zipdata):
+        """
+        Use an already built deployment package instead of zipping
+        ``path`` again, e.g. when the same code is deployed to several
+        regions.
+        """
+        self._zipdata = zipdata
+
+    def _dependency_cache(self):
+        dependencies = self.dependencies
+        local_cache = dependencies.get('local_cache')
+        if local_cache:
+            local_cache = os.path.expanduser(local_cache)
+        return kappa.deps.DependencyCache(
+            dependencies['file'], self.runtime, local_cache=local_cache,
+            offline=dependencies.get('offline', False))
+
+    def dependencies_key(self):
+        if not self.dependencies:
+            return None
+        return self._dependency_cache().key
+
+    def stage(self):
+        """
+        Return the directory to package: ``path`` itself or, if the
+        function has ``dependencies``, a staging directory holding both
+        the installed dependencies and the source.
+        """
+        if not self.dependencies:
+            return self.path
+        with kappa.trace.span('dependencies'):
+            installed = self._dependency_cache().ensure()
+        name = hashlib.sha1(os.path.abspath(self.path).encode(
+            'utf-8')).hexdigest()[:16]
+        staging = os.path.join(kappa.config.cache_dir(), 'staging', name)
+        with kappa.trace.span('stage'):
+            return kappa.deps.stage(self.path, installed, staging)
+
+    def build_package(self):
+        """
+        Zip the function source and return the bytes of the package.
+        """
+        if self._zipdata is not None:
+            return self._zipdata
+        source = self.stage()
+        with kappa.trace.span('zip'):
+            self.zip_lambda_function(self.zipfile_name, source)
+        with kappa.trace.span('read_zip'):
+            with open(self.zipfile_name, 'rb') as fp:
+                return fp.read()
 
     def create(self):
+        with kappa.trace.span('function.create', function=self.name):
+            return self._create()
+
+    def _create(self):
         LOG.debug('creating %s', self.zipfile_name)
-        self.zip_lambda_function(self.zipfile_name, self.path)
-        with open(self.zipfile_name, 'rb') as fp:
-            exec_role = self._context.exec_role_arn
-            LOG.debug('exec_role=%s', exec_role)
-            
-            zipdata = fp.read()
-            if self.s3:
-                bucket = self.s3['bucket']
-                key = self.s3.get('key', self.name)
-
-                try:
-                    LOG.info('uploading to s3://%s/%s', bucket, key)
+        zipdata = self.build_package()
+        exec_role = self._context.exec_role_arn
+        LOG.debug('exec_role=%s', exec_role)
+        if self.s3:
+            bucket = self.s3_bucket
+            key = self.s3.get('key', self.name)
+
+            try:
+                LOG.info('uploading to s3://%s/%s', bucket, key)
+                with kappa.trace.span('s3_upload', bytes=len(zipdata)):
                     response = self._s3_svc.put_object(
                         Bucket=bucket,
                         Key=key,
                         Body=zipdata,
                         ContentType='application/zip')
-                    LOG.debug(response)
-                    code = {'S3Bucket': bucket, 'S3Key': key}
-                except Exception:
-                    LOG.exception('Unable to upload zip file')
-                    return
-            else:
-                code = {'ZipFile': zipdata}
-            
-            if not self.s3_only:
-                try:
-                    LOG.debug('Creating function')
+                LOG.debug(response)
+                code = {'S3Bucket': bucket, 'S3Key': key}
+            except Exception:
+                LOG.exception('Unable to upload zip file')
+                return False
+        else:
+            code = {'ZipFile': zipdata}
+
+        if not self.s3_only:
+            try:
+                LOG.debug('Creating function')
+                with kappa.trace.span('create_function',
+                                      bytes=len(zipdata)):
                     response = self._lambda_svc.create_function(
                         FunctionName=self.name,
                         Code=code,
@@ -202,10 +395,16 @@ class Function(object):
                         Description=self.description,
                         Timeout=self.timeout,
                         MemorySize=self.memory_size)
-                    LOG.debug(response)
-                except Exception:
-                    LOG.exception('Unable to create function')
-        self.add_permissions()
+                LOG.debug(response)
+            except Exception:
+                LOG.exception('Unable to create function')
+                return False
+        with kappa.trace.span('permissions'):
+            self.add_permissions()
+        if not self.s3_only:
+            with kappa.trace.span('concurrency'):
+                self.apply_concurrency()
+        return True
 
     def deploy(self):
         if self.exists():
@@ -214,18 +413,25 @@ class Function(object):
             return self.create()
 
     def update(self):
+        with kappa.trace.span('function.update', function=self.name):
+            return self._update()
+
+    def _update(self):
         LOG.debug('updating %s', self.zipfile_name)
-        self.zip_lambda_function(self.zipfile_name, self.path)
-        with open(self.zipfile_name, 'rb') as fp:
-            try:
-                LOG.debug('updating code')
-                zipdata = fp.read()
+        zipdata = self.build_package()
+        try:
+            LOG.debug('updating code')
+            with kappa.trace.span('update_function_code',
+                                  bytes=len(zipdata)):
                 response = self._lambda_svc.update_function_code(
                     FunctionName=self.name,
                     ZipFile=zipdata)
-                LOG.debug(response)
-                
-                LOG.debug('updating configuration')
+            LOG.debug(response)
+
+            with kappa.trace.span('wait_for_update'):
+                self._wait_for_update()
+            LOG.debug('updating configuration')
+            with kappa.trace.span('update_function_configuration'):
                 response = self._lambda_svc.update_function_configuration(
                     FunctionName=self.name,
                     Role=self._context.exec_role_arn,
@@ -233,9 +439,192 @@ class Function(object):
                     Description=self.description,
                     Timeout=self.timeout,
                     MemorySize=self.memory_size)
-                LOG.debug(response)
-            except Exception:
-                LOG.exception('Unable to update zip file')
+            LOG.debug(response)
+        except Exception:
+            LOG.exception('Unable to update zip file')
+            return False
+        with kappa.trace.span('permissions'):
+            self.add_permissions()
+        with kappa.trace.span('concurrency'):
+            self.apply_concurrency()
+        return True
+
+    def push_code(self, zipdata):
+        """
+        Replace just the code of the function with ``zipdata`` and wait
+        until the update is live.
+        """
+        LOG.debug('pushing %d bytes of code to %s', len(zipdata), self.name)
+        with kappa.trace.span('update_function_code', bytes=len(zipdata)):
+            response = self._lambda_svc.update_function_code(
+                FunctionName=self.name, ZipFile=zipdata)
+        LOG.debug(response)
+        with kappa.trace.span('wait_for_update'):
+            return self._wait_for_update()
+
+    def _wait_for_update(self):
+        # Publishing a version fails while a code or configuration
+        # update is still being applied to $LATEST.
+        while True:
+            response = self._lambda_svc.get_function_configuration(
+                FunctionName=self.name)
+            LOG.debug(response)
+            if response.get('LastUpdateStatus', 'Successful') != 'InProgress':
+                return response
+            LOG.debug('waiting for update of %s to complete', self.name)
+            time.sleep(self.POLL_INTERVAL)
+
+    def set_memory_size(self, memory_size):
+        LOG.debug('setting memory size of %s to %d', self.name, memory_size)
+        response = self._lambda_svc.update_function_configuration(
+            FunctionName=self.name, MemorySize=memory_size)
+        LOG.debug(response)
+        return self._wait_for_update()
+
+    def get_environment(self):
+        response = self._wait_for_update()
+        return response.get('Environment', {}).get('Variables', {})
+
+    def set_environment(self, variables):
+        LOG.debug('setting environment of %s', self.name)
+        response = self._lambda_svc.update_function_configuration(
+            FunctionName=self.name,
+            Environment={'Variables': variables})
+        LOG.debug(response)
+        return self._wait_for_update()
+
+    def force_cold_start(self):
+        # Any configuration change retires the existing execution
+        # environments, so the next invocation is a cold start.
+        variables = dict(self.get_environment())
+        variables['KAPPA_COLD_START'] = str(time.time())
+        return self.set_environment(variables)
+
+    def apply_reserved_concurrency(self):
+        if self.reserved_concurrency is None:
+            return
+        LOG.debug('setting reserved concurrency of %s to %d',
+                  self.name, self.reserved_concurrency)
+        response = self._lambda_svc.put_function_concurrency(
+            FunctionName=self.name,
+            ReservedConcurrentExecutions=self.reserved_concurrency)
+        LOG.debug(response)
+
+    def publish_version(self):
+        self._wait_for_update()
+        LOG.debug('publishing new version of %s', self.name)
+        response = self._lambda_svc.publish_version(
+            FunctionName=self.name,
+            Description=self.description)
+        LOG.debug(response)
+        return response['Version']
+
+    def get_alias(self):
+        try:
+            response = self._lambda_svc.get_alias(
+                FunctionName=self.name, Name=self.alias)
+            LOG.debug(response)
+        except ClientError:
+            LOG.debug('alias %s of %s not found', self.alias, self.name)
+            response = None
+        return response
+
+    def update_alias(self, version, current=None, weights=None):
+        # ``weights`` maps other versions to the fraction of traffic they
+        # get; an empty dict clears any weighted routing.
+        kwargs = {'FunctionName': self.name, 'Name': self.alias,
+                  'FunctionVersion': version}
+        if weights is not None:
+            kwargs['RoutingConfig'] = {'AdditionalVersionWeights': weights}
+        if current or self.get_alias():
+            LOG.debug('pointing alias %s at version %s', self.alias, version)
+            response = self._lambda_svc.update_alias(**kwargs)
+        else:
+            LOG.debug('creating alias %s for version %s', self.alias, version)
+            response = self._lambda_svc.create_alias(**kwargs)
+        LOG.debug(response)
+        return response
+
+    def wait_for_provisioned_concurrency(self, version):
+        deadline = time.time() + self.PROVISIONED_CONCURRENCY_TIMEOUT
+        while True:
+            response = self._lambda_svc.get_provisioned_concurrency_config(
+                FunctionName=self.name, Qualifier=version)
+            LOG.debug(response)
+            status = response['Status']
+            if status != 'IN_PROGRESS':
+                return status == 'READY'
+            if time.time() > deadline:
+                LOG.error('timed out waiting for provisioned concurrency '
+                          'on %s:%s', self.name, version)
+                return False
+            LOG.debug('waiting for provisioned concurrency on %s:%s',
+                      self.name, version)
+            time.sleep(self.POLL_INTERVAL)
+
+    def apply_provisioned_concurrency(self, version):
+        LOG.debug('setting provisioned concurrency of %s:%s to %d',
+                  self.name, version, self.provisioned_concurrency)
+        response = self._lambda_svc.put_provisioned_concurrency_config(
+            FunctionName=self.name, Qualifier=version,
+            ProvisionedConcurrentExecutions=self.provisioned_concurrency)
+        LOG.debug(response)
+        return self.wait_for_provisioned_concurrency(version)
+
+    def _delete_provisioned_concurrency(self, version):
+        try:
+            response = self._lambda_svc.delete_provisioned_concurrency_config(
+                FunctionName=self.name, Qualifier=version)
+            LOG.debug(response)
+        except ClientError:
+            LOG.debug('no provisioned concurrency on %s:%s',
+                      self.name, version)
+
+    def apply_concurrency(self):
+        try:
+            self.apply_reserved_concurrency()
+            if not self.alias:
+                if self.provisioned_concurrency:
+                    LOG.warning('provisioned_concurrency requires an alias')
+                return
+            alias = self.get_alias()
+            previous = alias['FunctionVersion'] if alias else None
+            version = self.publish_version()
+            if self.provisioned_concurrency:
+                # Only move the alias once the new version can take the
+                # traffic without cold starts.
+                if not self.apply_provisioned_concurrency(version):
+                    LOG.error('provisioned concurrency for %s:%s is not '
+                              'ready, leaving alias %s at version %s',
+                              self.name, version, self.alias, previous)
+                    if version != previous:
+                        # Nothing routes to it, but it is still billed.
+                        self._delete_provisioned_concurrency(version)
+                    return
+            if self.canary and previous and previous != version:
+                with kappa.trace.span('canary', version=version):
+                    try:
+                        self.canary_result = kappa.canary.Canary.from_config(
+                            self, self.canary).run(previous, version)
+                    except Exception as e:
+                        LOG.exception('Canary of version %s failed', version)
+                        self.canary_result = {
+                            'decision': 'rolled_back',
+                            'reason': 'canary failed: %s' % e,
+                            'stable': previous,
+                            'version': version,
+                            'stats': {}}
+                if self.canary_result['decision'] != 'promoted':
+                    if self.provisioned_concurrency:
+                        self._delete_provisioned_concurrency(version)
+                    return
+            else:
+                self.update_alias(version, alias)
+            if previous and previous != version and \
+                    self.provisioned_concurrency:
+                self._delete_provisioned_concurrency(previous)
+        except Exception:
+            LOG.exception('Unable to apply concurrency settings')
 
     def delete(self):
         LOG.debug('deleting function %s', self.name)
@@ -287,7 +676,7 @@ class Function(object):
     def invoke_async(self, test_data=None):
         return self._invoke(test_data, 'Event')
 
-    def invoke_local(self, test_data=None):
+    def invoke_local(self, test_data=None, profiler=None):
         import sys
         sys.path.insert(0, self.path)
         module_name = '.'.join(self.handler.split('.')[:-1])
@@ -306,8 +695,31 @@ class Function(object):
             memory_size=self.memory_size,
             timeout=self.timeout)
 
+        if profiler is not None:
+            return profiler.run(func, event, context)
         return func(event, context)
 
+    def invoke_emulated(self, test_data=None):
+        test_data = self._get_test_data(test_data)
+        try:
+            event = json.loads(test_data)
+        except ValueError:
+            event = test_data
+        emulator = self.emulator(concurrency=1)
+        try:
+            return emulator.invoke(event)
+        finally:
+            emulator.shutdown()
+
+    def emulator(self, concurrency=10):
+        if not self.runtime.startswith('python'):
+            raise ValueError(
+                'The local emulator only supports python runtimes')
+        return kappa.emulator.Emulator(
+            self.stage(), self.handler, function_name=self.name,
+            memory_size=self.memory_size, timeout=self.timeout,
+            concurrency=concurrency)
+
 class _FakeLambdaContext(object):
     def __init__(self,
             function_name='FunctionName',
@@ -338,6 +750,6 @@ class _FakeLambdaContext(object):
         self.client_context = None
 
     def get_remaining_time_in_millis(self):
-        time_used = self._get_time()- self._start
-        time_left = self._timeout * 1000 - time_used
+        time_used = self._get_time() - self._start
+        time_left = self._timeout - time_used
         return int(round(time_left * 1000))
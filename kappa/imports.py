@@ -0,0 +1,333 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+What importing the handler costs at cold start.
+
+The handler module is imported from the staged package in a fresh
+interpreter started with ``-X importtime``, which reports the self and
+cumulative time of every module imported.  The worker then invokes the
+handler once with the test data while recording which modules' code
+runs, so modules that are imported but never used can be pointed out.
+
+Results are kept per function, so each analysis is compared with the
+one before it.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import kappa.config
+
+LOG = logging.getLogger(__name__)
+
+StartMarker = 'kappa-imports-start'
+EndMarker = 'kappa-imports-end'
+
+# Run with -c rather than -m so nothing but ``sys`` is imported before the
+# handler; anything already loaded would be missing from the timings.
+WorkerScript = '''
+import sys
+path, handler, event_path, result_path = sys.argv[1:5]
+sys.path.insert(0, path)
+module_name, func_name = handler.rsplit('.', 1)
+result = {'error': None, 'invoke_error': None, 'touched': None}
+sys.stderr.write('%s\\n')
+sys.stderr.flush()
+try:
+    module = __import__(module_name, fromlist=[func_name])
+    func = getattr(module, func_name)
+except Exception as e:
+    func = None
+    result['error'] = '%%s: %%s' %% (e.__class__.__name__, e)
+sys.stderr.write('%s\\n')
+sys.stderr.flush()
+import json
+if func is not None and event_path:
+    with open(event_path) as fp:
+        data = fp.read()
+    try:
+        event = json.loads(data)
+    except ValueError:
+        event = data
+    class Context(object):
+        function_name = module_name
+        function_version = '$LATEST'
+        memory_limit_in_mb = 128
+        aws_request_id = 'kappa-imports'
+        def get_remaining_time_in_millis(self):
+            return 3000
+    touched = set()
+    def profile(frame, event_name, arg):
+        if event_name == 'call':
+            touched.add(frame.f_globals.get('__name__'))
+        elif event_name == 'c_call':
+            touched.add(getattr(arg, '__module__', None))
+    sys.setprofile(profile)
+    try:
+        func(event, Context())
+    except Exception as e:
+        result['invoke_error'] = '%%s: %%s' %% (e.__class__.__name__, e)
+    finally:
+        sys.setprofile(None)
+    result['touched'] = sorted(name for name in touched if name)
+with open(result_path, 'w') as fp:
+    json.dump(result, fp)
+''' % (StartMarker, EndMarker)
+
+
+class ImportNode(object):
+
+    def __init__(self, name, self_us, cumulative_us):
+        self.name = name
+        self.self_us = self_us
+        self.cumulative_us = cumulative_us
+        self.children = []
+
+    def to_dict(self):
+        return {'name': self.name,
+                'self': self.self_us,
+                'cumulative': self.cumulative_us,
+                'children': [c.to_dict() for c in self.children]}
+
+
+def parse_importtime(text):
+    """
+    Parse ``-X importtime`` output into a list of root ImportNodes.
+    Children are listed before their parent, one level of indentation
+    deeper.
+    """
+    pending = {}
+    for line in text.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            # The header line.
+            continue
+        name = fields[2].rstrip()
+        stripped = name.lstrip(' ')
+        # One space separates the column from the name; each level of
+        # nesting adds two more.
+        level = (len(name) - len(stripped) - 1) // 2
+        node = ImportNode(stripped, int(fields[0]), int(fields[1]))
+        node.children = pending.pop(level + 1, [])
+        pending.setdefault(level, []).append(node)
+    roots = []
+    for level in sorted(pending):
+        roots.extend(pending[level])
+    return roots
+
+
+def walk(nodes):
+    for node in nodes:
+        yield node
+        for child in walk(node.children):
+            yield child
+
+
+def rank(nodes):
+    """
+    Sort ``nodes`` and, recursively, their children by cumulative time,
+    most expensive first.
+    """
+    nodes.sort(key=lambda node: -node.cumulative_us)
+    for node in nodes:
+        rank(node.children)
+    return nodes
+
+
+def package_totals(nodes):
+    """
+    Return ``{top level package: self time}`` summed over all modules.
+    """
+    totals = {}
+    for node in walk(nodes):
+        package = node.name.split('.')[0]
+        totals[package] = totals.get(package, 0) + node.self_us
+    return totals
+
+
+def untouched(touched, nodes):
+    """
+    Return the imports in the tree whose code never ran: nodes where
+    neither the module nor anything it imported was ``touched``.  Only
+    the outermost such node is listed, as ``{'name', 'cost'}`` with its
+    cumulative time, most expensive first.
+    """
+    touched = set(touched)
+    result = []
+
+    def visit(node):
+        used = node.name in touched
+        unused_children = []
+        for child in node.children:
+            if visit(child):
+                used = True
+            else:
+                unused_children.append(child)
+        if used:
+            result.extend({'name': child.name, 'cost': child.cumulative_us}
+                          for child in unused_children)
+        return used
+
+    for node in nodes:
+        if not visit(node):
+            result.append({'name': node.name, 'cost': node.cumulative_us})
+    result.sort(key=lambda item: (-item['cost'], item['name']))
+    return result
+
+
+def compare(previous, current):
+    """
+    Return the per package changes between two ``package_totals``,
+    largest first.  ``before``/``after`` are None for packages that were
+    added or removed.
+    """
+    changes = []
+    for name in set(previous) | set(current):
+        before = previous.get(name)
+        after = current.get(name)
+        delta = (after or 0) - (before or 0)
+        if delta:
+            changes.append({'name': name, 'before': before, 'after': after,
+                            'delta': delta})
+    changes.sort(key=lambda change: (-abs(change['delta']), change['name']))
+    return changes
+
+
+class ImportAnalyzer(object):
+    """
+    Measure the import cost of ``function``'s handler.  Every module's
+    time is the minimum over ``repeat`` fresh interpreters, which keeps
+    disk cache and scheduling noise out of the numbers.
+    """
+
+    def __init__(self, function, repeat=3, invoke=True, test_data=None):
+        if not function.runtime.startswith('python'):
+            raise ValueError(
+                'Import analysis only supports python runtimes')
+        if sys.version_info < (3, 7):
+            # The worker runs under this interpreter.
+            raise ValueError('Import timing needs -X importtime, which '
+                             'was added in Python 3.7')
+        self.function = function
+        self.repeat = max(1, repeat)
+        self.invoke = invoke
+        self.test_data = test_data
+
+    @property
+    def history_path(self):
+        name = hashlib.sha1(os.path.abspath(self.function.path).encode(
+            'utf-8')).hexdigest()[:16]
+        return os.path.join(kappa.config.cache_dir(), 'imports',
+                            name + '.json')
+
+    def _run_worker(self, path, event_path, directory):
+        result_path = os.path.join(directory, 'result.json')
+        env = dict(os.environ)
+        env.pop('PYTHONPATH', None)
+        process = subprocess.Popen(
+            [sys.executable, '-X', 'importtime', '-c', WorkerScript, path,
+             self.function.handler, event_path or '', result_path],
+            cwd=path, env=env, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+        stdout, stderr = process.communicate()
+        stderr = stderr.decode('utf-8', 'replace')
+        LOG.debug(stdout)
+        if StartMarker not in stderr or not os.path.exists(result_path):
+            raise RuntimeError('import worker failed: %s' % stderr[-2000:])
+        text = stderr.split(StartMarker, 1)[1].split(EndMarker, 1)[0]
+        with open(result_path) as fp:
+            result = json.load(fp)
+        os.remove(result_path)
+        return parse_importtime(text), result
+
+    def _load_history(self):
+        try:
+            with open(self.history_path) as fp:
+                return json.load(fp)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _store_history(self, data):
+        path = self.history_path
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as fp:
+                json.dump(data, fp)
+        except (IOError, OSError):
+            LOG.debug('unable to write import history %s', path)
+
+    def run(self):
+        """
+        Return a dict with the ranked import ``tree``, the ``total`` and
+        per ``packages`` self times (microseconds), the ``changes`` since
+        the previous analysis and the ``untouched`` modules.
+        """
+        path = self.function.stage()
+        directory = tempfile.mkdtemp(prefix='kappa-imports-')
+        try:
+            event_path = None
+            if self.invoke:
+                event_path = os.path.join(directory, 'event.json')
+                with open(event_path, 'w') as fp:
+                    fp.write(self.function._get_test_data(self.test_data))
+            # Only the first worker invokes the handler; the others are
+            # only there for the timings.
+            runs = [self._run_worker(path, event_path if i == 0 else None,
+                                     directory)
+                    for i in range(self.repeat)]
+        finally:
+            shutil.rmtree(directory)
+        tree, result = runs[0]
+        best = {}
+        for nodes, _ in runs:
+            for node in walk(nodes):
+                previous = best.get(node.name)
+                if previous is None:
+                    best[node.name] = (node.self_us, node.cumulative_us)
+                else:
+                    best[node.name] = (min(previous[0], node.self_us),
+                                       min(previous[1], node.cumulative_us))
+        for node in walk(tree):
+            node.self_us, node.cumulative_us = best[node.name]
+        rank(tree)
+        packages = package_totals(tree)
+        total = sum(node.cumulative_us for node in tree)
+        history = self._load_history()
+        analysis = {
+            'handler': self.function.handler,
+            'error': result['error'],
+            'invoke_error': result['invoke_error'],
+            'total': total,
+            'previous_total': history['total'] if history else None,
+            'tree': [node.to_dict() for node in tree],
+            'packages': sorted(
+                [{'name': name, 'self': value}
+                 for name, value in packages.items()],
+                key=lambda item: -item['self']),
+            'changes': compare(history['packages'], packages)
+            if history else None,
+            'untouched': untouched(result['touched'], tree)
+            if result['touched'] is not None else None}
+        if not result['error']:
+            self._store_history({'total': total, 'packages': packages})
+        return analysis
@@ -0,0 +1,250 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+Per-operation accounting of AWS API calls.
+
+When enabled, every client created by ``kappa.aws`` gets botocore event
+handlers that record call counts, latency, retries, throttles, errors and
+request bytes for each ``service.Operation``.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+import kappa.stats
+
+LOG = logging.getLogger(__name__)
+
+ThrottleCodes = frozenset([
+    'Throttling', 'ThrottlingException', 'ThrottledException',
+    'RequestThrottledException', 'TooManyRequestsException',
+    'ProvisionedThroughputExceededException', 'RequestLimitExceeded',
+    'SlowDown', 'RequestThrottled'])
+
+# Upper bounds (ms) of the latency histogram buckets.
+HistogramBuckets = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+class _OperationStats(object):
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.throttles = 0
+        self.bytes_sent = 0
+        self.latencies = []
+
+    def histogram(self):
+        counts = [0] * (len(HistogramBuckets) + 1)
+        for latency in self.latencies:
+            for i, bound in enumerate(HistogramBuckets):
+                if latency <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+        labels = ['<=%dms' % b for b in HistogramBuckets] + [
+            '>%dms' % HistogramBuckets[-1]]
+        return dict(zip(labels, counts))
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'retries': self.retries,
+            'throttles': self.throttles,
+            'bytes_sent': self.bytes_sent,
+            'total_ms': sum(self.latencies),
+            'latency_ms': kappa.stats.summarize(self.latencies),
+            'histogram': self.histogram(),
+        }
+
+
+class CallRecorder(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._events = []
+        self._start = time.time()
+
+    def _get(self, key):
+        if key not in self._stats:
+            self._stats[key] = _OperationStats()
+        return self._stats[key]
+
+    def attach(self, client):
+        # Each client has its own copy of the event emitter, so handlers
+        # registered here only see calls made through this client.
+        service_name = client.meta.service_model.service_name
+        events = client.meta.events
+
+        def request_created(request, operation_name=None, **kwargs):
+            self._request_created(service_name, request, operation_name)
+
+        events.register('before-call', self._before_call,
+                        unique_id='kappa-instrument-before-call')
+        events.register('after-call', self._after_call,
+                        unique_id='kappa-instrument-after-call')
+        events.register('after-call-error', self._after_call_error,
+                        unique_id='kappa-instrument-after-call-error')
+        events.register('request-created', request_created,
+                        unique_id='kappa-instrument-request-created')
+        events.register('needs-retry', self._needs_retry,
+                        unique_id='kappa-instrument-needs-retry')
+
+    def _key(self, model):
+        return '%s.%s' % (model.service_model.service_name, model.name)
+
+    def _before_call(self, model, context, **kwargs):
+        context['kappa_start'] = time.time()
+
+    def _finish(self, model, context, error, metadata=None):
+        end = time.time()
+        start = context.get('kappa_start', end)
+        key = self._key(model)
+        # Attempts beyond the first.  botocore keeps the attempt number in
+        # the call's context; older versions only report it in the
+        # response metadata.
+        retries = context.get('retries', {}).get('attempt')
+        if retries is not None:
+            retries -= 1
+        else:
+            retries = (metadata or {}).get('RetryAttempts', 0)
+        with self._lock:
+            stats = self._get(key)
+            stats.count += 1
+            stats.retries += retries
+            if error:
+                stats.errors += 1
+            stats.latencies.append((end - start) * 1000.0)
+            self._events.append({
+                'name': key,
+                'start': start,
+                'duration': end - start,
+                'thread': threading.current_thread().ident,
+                'error': error})
+
+    def _after_call(self, model, context, parsed=None, **kwargs):
+        error = bool(parsed and 'Error' in parsed)
+        self._finish(model, context, error,
+                     (parsed or {}).get('ResponseMetadata'))
+
+    def _after_call_error(self, model, context, exception=None, **kwargs):
+        response = getattr(exception, 'response', None) or {}
+        self._finish(model, context, True, response.get('ResponseMetadata'))
+
+    def _request_created(self, service_name, request, operation_name):
+        body = request.body
+        size = 0
+        if body is not None:
+            if hasattr(body, 'seek') and hasattr(body, 'tell'):
+                pos = body.tell()
+                body.seek(0, os.SEEK_END)
+                size = body.tell()
+                body.seek(pos)
+            else:
+                size = len(body)
+        key = '%s.%s' % (service_name, operation_name)
+        with self._lock:
+            self._get(key).bytes_sent += size
+
+    def _needs_retry(self, response=None, operation=None, **kwargs):
+        # Retries are counted once the call finishes; this only sees the
+        # response to each attempt, throttled or not.
+        if operation is None or response is None:
+            return
+        if response[1].get('Error', {}).get('Code') in ThrottleCodes:
+            with self._lock:
+                self._get(self._key(operation)).throttles += 1
+
+    def summary(self):
+        with self._lock:
+            operations = dict((key, stats.to_dict())
+                              for key, stats in self._stats.items())
+        return {
+            'elapsed_ms': (time.time() - self._start) * 1000.0,
+            'calls': sum(op['count'] for op in operations.values()),
+            'api_ms': sum(op['total_ms'] for op in operations.values()),
+            'operations': operations,
+        }
+
+    def trace_events(self):
+        """
+        Return the recorded calls in the Chrome trace-event format.
+        """
+        pid = os.getpid()
+        with self._lock:
+            events = list(self._events)
+        return [{'name': e['name'],
+                 'cat': 'aws,' + e['name'].split('.')[0],
+                 'ph': 'X',
+                 'ts': e['start'] * 1000000.0,
+                 'dur': e['duration'] * 1000000.0,
+                 'pid': pid,
+                 'tid': e['thread'],
+                 'args': {'error': e['error']}} for e in events]
+
+    def write(self, path, fmt='json'):
+        if fmt == 'trace':
+            data = {'traceEvents': self.trace_events(),
+                    'displayTimeUnit': 'ms'}
+        else:
+            data = self.summary()
+        with open(path, 'w') as fp:
+            json.dump(data, fp, indent=2, sort_keys=True)
+
+    def format_summary(self):
+        summary = self.summary()
+        lines = ['%d API calls, %.0f ms in calls, %.0f ms elapsed' % (
+            summary['calls'], summary['api_ms'], summary['elapsed_ms'])]
+        lines.append('%-45s %6s %6s %8s %8s %8s %7s %9s %10s' % (
+            'operation', 'calls', 'errors', 'total ms', 'p50 ms', 'p99 ms',
+            'retries', 'throttles', 'bytes sent'))
+        operations = sorted(summary['operations'].items(),
+                            key=lambda item: -item[1]['total_ms'])
+        for key, op in operations:
+            latency = op['latency_ms']
+            lines.append('%-45s %6d %6d %8.0f %8.1f %8.1f %7d %9d %10d' % (
+                key, op['count'], op['errors'], op['total_ms'],
+                latency.get('p50') or 0, latency.get('p99') or 0,
+                op['retries'], op['throttles'], op['bytes_sent']))
+        return '\n'.join(lines)
+
+
+_recorder = None
+
+
+def enable():
+    """
+    Start recording calls made by clients created from now on and return
+    the recorder.
+    """
+    global _recorder
+    if _recorder is None:
+        _recorder = CallRecorder()
+    return _recorder
+
+
+def disable():
+    global _recorder
+    _recorder = None
+
+
+def get_recorder():
+    return _recorder
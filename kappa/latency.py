@@ -0,0 +1,96 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import base64
+import logging
+
+import kappa.log
+import kappa.stats
+
+LOG = logging.getLogger(__name__)
+
+
+def invoke_with_report(function, test_data=None):
+    """
+    Invoke ``function`` synchronously and return the response along with
+    the parsed REPORT line (or None if the log tail did not include one).
+    """
+    response = function.invoke(test_data=test_data)
+    report = None
+    if 'LogResult' in response:
+        report = kappa.log.parse_report(
+            base64.b64decode(response['LogResult']))
+    return response, report
+
+
+class LatencyProbe(object):
+    """
+    Invoke a function repeatedly in batches and split the REPORT lines
+    into cold starts (those with an ``Init Duration``) and warm starts.
+    With ``force_cold`` the function configuration is touched before
+    each batch so the first invocation of every batch starts cold.
+    """
+
+    def __init__(self, function, invocations=10, batches=1,
+                 force_cold=False, test_data=None):
+        self.function = function
+        self.invocations = invocations
+        self.batches = batches
+        self.force_cold = force_cold
+        self.test_data = test_data
+
+    def _summarize(self, reports):
+        return {
+            'count': len(reports),
+            'init_duration': kappa.stats.summarize(
+                [r['init_duration'] for r in reports
+                 if 'init_duration' in r]),
+            'duration': kappa.stats.summarize(
+                [r['duration'] for r in reports]),
+            'billed_duration': kappa.stats.summarize(
+                [r['billed_duration'] for r in reports]),
+            'max_memory_used': kappa.stats.summarize(
+                [r['max_memory_used'] for r in reports]),
+        }
+
+    def run(self):
+        reports = []
+        errors = 0
+        original = None
+        if self.force_cold:
+            original = self.function.get_environment()
+        try:
+            for batch in range(self.batches):
+                if self.force_cold:
+                    LOG.info('forcing cold start for batch %d', batch)
+                    self.function.force_cold_start()
+                for _ in range(self.invocations):
+                    response, report = invoke_with_report(
+                        self.function, self.test_data)
+                    if 'FunctionError' in response:
+                        errors += 1
+                    if report:
+                        report['batch'] = batch
+                        reports.append(report)
+        finally:
+            if original is not None:
+                self.function.set_environment(original)
+        cold = [r for r in reports if 'init_duration' in r]
+        warm = [r for r in reports if 'init_duration' not in r]
+        return {
+            'function': self.function.name,
+            'errors': errors,
+            'cold': self._summarize(cold),
+            'warm': self._summarize(warm),
+            'reports': reports,
+        }
@@ -11,14 +11,113 @@
 # ANY KIND, either express or implied. See the License for the specific
 # language governing permissions and limitations under the License.
 
+import calendar
+import gzip
+import json
 import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
 
 from botocore.exceptions import ClientError
 
 import kappa.aws
+import kappa.executor
 
 LOG = logging.getLogger(__name__)
 
+# Fields of the REPORT line Lambda writes at the end of every invocation.
+ReportFields = {
+    'Duration': 'duration',
+    'Billed Duration': 'billed_duration',
+    'Init Duration': 'init_duration',
+    'Memory Size': 'memory_size',
+    'Max Memory Used': 'max_memory_used',
+}
+
+ReportFieldRegex = re.compile(r'([A-Za-z ]+): ([0-9.]+) (ms|MB)')
+
+
+def parse_report(log_data):
+    """
+    Find the REPORT line in the log output of an invocation and return
+    its fields as a dict of floats, e.g. ``duration``, ``billed_duration``,
+    ``init_duration`` (cold starts only), ``memory_size`` and
+    ``max_memory_used``.  Returns None if there is no REPORT line.
+    """
+    if isinstance(log_data, bytes):
+        log_data = log_data.decode('utf-8', 'replace')
+    for line in log_data.splitlines():
+        if not line.startswith('REPORT '):
+            continue
+        report = {}
+        for name, value, _ in ReportFieldRegex.findall(line):
+            name = name.strip()
+            if name in ReportFields:
+                report[ReportFields[name]] = float(value)
+        return report
+    return None
+
+# Logs Insights queries over the REPORT lines and error output of a
+# Lambda function.  The aggregation happens server-side.
+ReportStatsQuery = """filter @type = "REPORT"
+| stats count(*) as invocations,
+    avg(@duration) as duration_avg,
+    pct(@duration, 50) as duration_p50,
+    pct(@duration, 90) as duration_p90,
+    pct(@duration, 99) as duration_p99,
+    max(@duration) as duration_max,
+    sum(@billedDuration) as billed_duration_total,
+    count(@initDuration) as cold_starts,
+    avg(@initDuration) as init_duration_avg,
+    pct(@initDuration, 99) as init_duration_p99,
+    max(@initDuration) as init_duration_max,
+    avg(@maxMemoryUsed / 1000 / 1000) as memory_used_avg,
+    max(@maxMemoryUsed / 1000 / 1000) as memory_used_max,
+    max(@memorySize / 1000 / 1000) as memory_size"""
+
+ErrorStatsQuery = """filter @message like /(?i)(error|exception|task timed out)/
+    and @type != "REPORT"
+| stats count(*) as error_lines,
+    sum(strcontains(@message, "Task timed out")) as timeouts"""
+
+QueryDoneStates = frozenset(['Complete', 'Failed', 'Cancelled', 'Timeout'])
+
+RelativeTimeRegex = re.compile(r'^(\d+)([smhdw])$')
+
+RelativeTimeUnits = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+TimeFormats = ['%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%d %H:%M:%S',
+               '%Y-%m-%d %H:%M', '%Y-%m-%d']
+
+
+def parse_time(value, now=None):
+    """
+    Convert ``value`` to milliseconds since the epoch.  Accepts a number
+    of milliseconds, a UTC date/time such as ``2015-01-06T12:30`` or a
+    duration before ``now`` such as ``90m``, ``2h`` or ``7d``.
+    """
+    value = str(value).strip()
+    if now is None:
+        now = time.time()
+    if value == 'now':
+        return int(now * 1000)
+    if value.isdigit():
+        return int(value)
+    match = RelativeTimeRegex.match(value)
+    if match:
+        seconds = int(match.group(1)) * RelativeTimeUnits[match.group(2)]
+        return int((now - seconds) * 1000)
+    for fmt in TimeFormats:
+        try:
+            parsed = datetime.strptime(value.rstrip('Z'), fmt)
+        except ValueError:
+            continue
+        return calendar.timegm(parsed.timetuple()) * 1000
+    raise ValueError('Unrecognized time: %s' % value)
+
 
 class Log(object):
 
@@ -30,7 +129,10 @@ class Log(object):
 
     def _check_for_log_group(self):
         LOG.debug('checking for log group')
-        response = self._log_svc.describe_log_groups()
+        # Groups are listed by name, so if the group exists it is on the
+        # first page of those starting with its name.
+        response = self._log_svc.describe_log_groups(
+            logGroupNamePrefix=self.log_group_name)
         log_group_names = [lg['logGroupName'] for lg in response['logGroups']]
         return self.log_group_name in log_group_names
 
@@ -45,12 +147,118 @@ class Log(object):
         LOG.debug(response)
         return response['logStreams']
 
-    def tail(self):
-        LOG.debug('tailing log group: %s', self.log_group_name)
+    def streams_in_window(self, start_time, end_time):
+        """
+        Return every stream that has events between ``start_time`` and
+        ``end_time`` (milliseconds since the epoch), following nextToken
+        through all pages.
+        """
+        LOG.debug('getting streams for log group: %s', self.log_group_name)
         if not self._check_for_log_group():
             LOG.info(
                 'log group %s has not been created yet', self.log_group_name)
             return []
+        streams = []
+        kwargs = {'logGroupName': self.log_group_name,
+                  'orderBy': 'LastEventTime', 'descending': True}
+        while True:
+            response = self._log_svc.describe_log_streams(**kwargs)
+            LOG.debug(response)
+            for stream in response['logStreams']:
+                last = stream.get('lastEventTimestamp',
+                                  stream.get('lastIngestionTime', 0))
+                if last < start_time:
+                    # Streams come newest first so the rest are older.
+                    return streams
+                if stream.get('firstEventTimestamp', 0) <= end_time:
+                    streams.append(stream)
+            if not response.get('nextToken'):
+                return streams
+            kwargs['nextToken'] = response['nextToken']
+
+    def query(self, query_string, start_time, end_time, poll_interval=1,
+              timeout=300):
+        """
+        Run a Logs Insights query over the window ``start_time`` to
+        ``end_time`` (milliseconds since the epoch), wait for it to finish
+        and return its rows as a list of dicts.
+        """
+        response = self._log_svc.start_query(
+            logGroupName=self.log_group_name,
+            startTime=start_time // 1000,
+            endTime=end_time // 1000,
+            queryString=query_string)
+        LOG.debug(response)
+        query_id = response['queryId']
+        deadline = time.time() + timeout
+        while True:
+            response = self._log_svc.get_query_results(queryId=query_id)
+            LOG.debug(response)
+            if response['status'] in QueryDoneStates:
+                break
+            if time.time() > deadline:
+                self._log_svc.stop_query(queryId=query_id)
+                raise RuntimeError(
+                    'Logs Insights query %s did not finish' % query_id)
+            time.sleep(poll_interval)
+        if response['status'] != 'Complete':
+            raise RuntimeError('Logs Insights query %s: %s' % (
+                query_id, response['status']))
+        return [dict((field['field'], field['value']) for field in row
+                     if not field['field'].startswith('@'))
+                for row in response['results']]
+
+    def stats(self, start_time, end_time):
+        """
+        Return invocation statistics for the window as a dict of floats:
+        duration percentiles, cold starts and init durations, memory use
+        and error and timeout counts.
+        """
+        if not self._check_for_log_group():
+            LOG.info(
+                'log group %s has not been created yet', self.log_group_name)
+            return None
+        reports, errors = kappa.executor.call(
+            lambda: self.query(ReportStatsQuery, start_time, end_time),
+            lambda: self.query(ErrorStatsQuery, start_time, end_time))
+        stats = {}
+        for row in reports[:1] + errors[:1]:
+            for name, value in row.items():
+                try:
+                    stats[name] = float(value)
+                except (TypeError, ValueError):
+                    stats[name] = None
+        return stats
+
+    def events_since(self, start_time):
+        """
+        Return the events of all streams from ``start_time`` (milliseconds
+        since the epoch) onwards, oldest first.
+        """
+        events = []
+        kwargs = {'logGroupName': self.log_group_name,
+                  'startTime': start_time}
+        try:
+            while True:
+                response = self._log_svc.filter_log_events(**kwargs)
+                LOG.debug(response)
+                events += response['events']
+                if not response.get('nextToken'):
+                    break
+                kwargs['nextToken'] = response['nextToken']
+        except ClientError:
+            LOG.debug('log group %s not found', self.log_group_name)
+        return sorted(events, key=lambda e: e['timestamp'])
+
+    def _get_stream_events(self, stream_name):
+        response = self._log_svc.get_log_events(
+            logGroupName=self.log_group_name,
+            logStreamName=stream_name)
+        LOG.debug(response)
+        return response['events']
+
+    def tail(self):
+        LOG.debug('tailing log group: %s', self.log_group_name)
         latest_stream = None
         streams = self.streams()
         for stream in streams:
@@ -58,11 +266,9 @@ class Log(object):
                 latest_stream = stream
             elif stream['lastEventTimestamp'] > latest_stream['lastEventTimestamp']:
                 latest_stream = stream
-        response = self._log_svc.get_log_events(
-            logGroupName=self.log_group_name,
-            logStreamName=latest_stream['logStreamName'])
-        LOG.debug(response)
-        return response['events']
+        if latest_stream is None:
+            return []
+        return self._get_stream_events(latest_stream['logStreamName'])
 
     def delete(self):
         try:
@@ -71,3 +277,154 @@ class Log(object):
             LOG.debug(response)
         except ClientError:
             LOG.debug('unable to delete log group')
+
+
+class LogExporter(object):
+    """
+    Download the events of every stream of a log group within a time
+    window into ``directory``, one gzipped JSON-lines file per stream.
+
+    Streams are fetched concurrently.  Each page of events is appended to
+    its file as it arrives, so memory use is bounded by one page per
+    worker, and the stream's nextForwardToken is then saved in the
+    stream's own checkpoint file, so workers never wait on each other.
+    When the export finishes they are merged into a single checkpoint.
+    Running the same export again picks up every stream from its saved
+    token.  A page written just before an interruption may be written
+    twice.
+    """
+
+    CheckpointName = 'checkpoint.json'
+
+    StreamCheckpointSuffix = '.checkpoint.json'
+
+    def __init__(self, log, directory, start_time, end_time,
+                 max_workers=None):
+        self.log = log
+        self.directory = directory
+        self.start_time = start_time
+        self.end_time = end_time
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._checkpoint = None
+
+    @property
+    def checkpoint_path(self):
+        return os.path.join(self.directory, self.CheckpointName)
+
+    def _stream_checkpoint_paths(self):
+        return [os.path.join(self.directory, name)
+                for name in sorted(os.listdir(self.directory))
+                if name.endswith(self.StreamCheckpointSuffix)]
+
+    def _load_checkpoint(self):
+        checkpoint = {'log_group_name': self.log.log_group_name,
+                      'start_time': self.start_time,
+                      'end_time': self.end_time,
+                      'streams': {}}
+        current = True
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as fp:
+                saved = json.load(fp)
+            if (saved.get('log_group_name'), saved.get('start_time'),
+                    saved.get('end_time')) == (
+                    self.log.log_group_name, self.start_time, self.end_time):
+                checkpoint = saved
+            else:
+                LOG.info('checkpoint in %s is for a different export, '
+                         'starting over', self.directory)
+                current = False
+        for path in self._stream_checkpoint_paths():
+            if current:
+                # Left behind by an interrupted run; newer than the merged
+                # checkpoint.
+                with open(path) as fp:
+                    state = json.load(fp)
+                checkpoint['streams'][state.pop('stream_name')] = state
+            else:
+                os.remove(path)
+        return checkpoint
+
+    def _write_json(self, path, data):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(data, fp, indent=2, sort_keys=True)
+        getattr(os, 'replace', os.rename)(tmp_path, path)
+
+    def _save_checkpoint(self):
+        # Caller holds self._lock.
+        self._write_json(self.checkpoint_path, self._checkpoint)
+
+    def _file_name(self, stream_name):
+        # Lambda stream names look like 2015/01/06/[$LATEST]abcdef...
+        return re.sub(r'[^A-Za-z0-9_.-]+', '_', stream_name) + '.jsonl.gz'
+
+    def _export_stream(self, stream_name):
+        with self._lock:
+            state = self._checkpoint['streams'].setdefault(
+                stream_name, {'file': self._file_name(stream_name),
+                              'next_token': None, 'events': 0,
+                              'done': False})
+            state = dict(state)
+        if state['done']:
+            return state['events']
+        path = os.path.join(self.directory, state['file'])
+        while True:
+            kwargs = {'logGroupName': self.log.log_group_name,
+                      'logStreamName': stream_name,
+                      'startTime': self.start_time,
+                      'endTime': self.end_time,
+                      'startFromHead': True}
+            if state['next_token']:
+                kwargs['nextToken'] = state['next_token']
+            response = self.log._log_svc.get_log_events(**kwargs)
+            events = response['events']
+            if events:
+                # Appending a new gzip member per page keeps the file a
+                # valid gzip stream without holding it open.
+                with gzip.open(path, 'ab') as fp:
+                    for event in events:
+                        line = json.dumps(event, sort_keys=True) + '\n'
+                        fp.write(line.encode('utf-8'))
+            token = response.get('nextForwardToken')
+            # Pages can be empty while more events follow; the stream is
+            # only exhausted when the token stops moving.
+            done = not token or token == state['next_token']
+            state['next_token'] = token
+            state['events'] += len(events)
+            state['done'] = done
+            self._write_json(path + self.StreamCheckpointSuffix,
+                             dict(state, stream_name=stream_name))
+            if done:
+                with self._lock:
+                    self._checkpoint['streams'][stream_name] = dict(state)
+                return state['events']
+
+    def run(self):
+        """
+        Export all streams and return a summary dict with the number of
+        ``streams``, ``events`` and ``bytes`` written.
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self._checkpoint = self._load_checkpoint()
+        streams = self.log.streams_in_window(self.start_time, self.end_time)
+        names = [stream['logStreamName'] for stream in streams]
+        # Streams seen by an interrupted run may have aged out of the
+        # window listing; finish them anyway.
+        names += [name for name in sorted(self._checkpoint['streams'])
+                  if name not in names]
+        with self._lock:
+            self._save_checkpoint()
+        counts = kappa.executor.map(self._export_stream, names,
+                                    max_workers=self.max_workers)
+        with self._lock:
+            self._save_checkpoint()
+        for path in self._stream_checkpoint_paths():
+            os.remove(path)
+        total_bytes = sum(
+            os.path.getsize(os.path.join(self.directory, state['file']))
+            for state in self._checkpoint['streams'].values()
+            if os.path.exists(os.path.join(self.directory, state['file'])))
+        return {'streams': len(names), 'events': sum(counts),
+                'bytes': total_bytes}
@@ -0,0 +1,175 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+Batched retrieval of CloudWatch metrics.
+
+Every metric is described by a query dict; ``get_metric_data`` packs any
+number of them into as few ``GetMetricData`` calls as the API allows.
+"""
+
+import datetime
+import logging
+import re
+
+import kappa.executor
+
+LOG = logging.getLogger(__name__)
+
+# GetMetricData accepts at most this many queries per request.
+MaxQueriesPerRequest = 500
+
+
+def query_id(*parts):
+    """
+    Build a query id from ``parts``.  Ids must start with a lower case
+    letter and contain only letters, digits and underscores.
+    """
+    text = '_'.join(str(part) for part in parts)
+    text = re.sub(r'[^A-Za-z0-9_]', '_', text)
+    return 'q_' + text
+
+
+def metric_query(identifier, metric_name, dimensions, stat, period=60,
+                 namespace='AWS/Lambda'):
+    return {
+        'Id': identifier,
+        'MetricStat': {
+            'Metric': {
+                'Namespace': namespace,
+                'MetricName': metric_name,
+                'Dimensions': [{'Name': name, 'Value': value}
+                               for name, value in sorted(dimensions.items())],
+            },
+            'Period': period,
+            'Stat': stat,
+        },
+        'ReturnData': True,
+    }
+
+
+def _fetch(cloudwatch, queries, start_time, end_time):
+    results = {}
+    kwargs = {'MetricDataQueries': queries,
+              'StartTime': start_time,
+              'EndTime': end_time,
+              'ScanBy': 'TimestampAscending'}
+    while True:
+        response = cloudwatch.get_metric_data(**kwargs)
+        LOG.debug(response)
+        for result in response['MetricDataResults']:
+            series = results.setdefault(
+                result['Id'], {'timestamps': [], 'values': []})
+            series['timestamps'].extend(result['Timestamps'])
+            series['values'].extend(result['Values'])
+        if not response.get('NextToken'):
+            return results
+        kwargs['NextToken'] = response['NextToken']
+
+
+def get_metric_data(cloudwatch, queries, start_time, end_time):
+    """
+    Run ``queries`` over the window and return a dict mapping each query
+    id to ``{'timestamps': [...], 'values': [...]}`` in time order.
+
+    Queries are sent in batches of up to 500, concurrently if there is
+    more than one batch.
+    """
+    batches = [queries[i:i + MaxQueriesPerRequest]
+               for i in range(0, len(queries), MaxQueriesPerRequest)]
+    results = {}
+    for batch in kappa.executor.map(
+            lambda batch: _fetch(cloudwatch, batch, start_time, end_time),
+            batches):
+        results.update(batch)
+    for query in queries:
+        series = results.setdefault(
+            query['Id'], {'timestamps': [], 'values': []})
+        pairs = sorted(zip(series['timestamps'], series['values']),
+                       key=lambda pair: pair[0])
+        series['timestamps'] = [t for t, _ in pairs]
+        series['values'] = [v for _, v in pairs]
+    return results
+
+
+# The per-function metrics reported by ``function_metrics``, as
+# (name, CloudWatch metric, statistic).
+FunctionMetrics = [
+    ('invocations', 'Invocations', 'Sum'),
+    ('duration_p50', 'Duration', 'p50'),
+    ('duration_p90', 'Duration', 'p90'),
+    ('duration_p99', 'Duration', 'p99'),
+    ('errors', 'Errors', 'Sum'),
+    ('throttles', 'Throttles', 'Sum'),
+    ('concurrent_executions', 'ConcurrentExecutions', 'Maximum'),
+    ('iterator_age', 'IteratorAge', 'Maximum'),
+]
+
+SparkChars = u'\u2581\u2582\u2583\u2584\u2585\u2586\u2587\u2588'
+
+
+def function_metrics(cloudwatch, function_names, start_time, end_time,
+                     period=300):
+    """
+    Return ``{function_name: {metric: {'timestamps', 'values'}}}`` for
+    every metric in FunctionMetrics, fetched with as few GetMetricData
+    requests as possible (62 functions fit in one).
+    """
+    queries = []
+    for index, function_name in enumerate(function_names):
+        for name, metric_name, stat in FunctionMetrics:
+            queries.append(metric_query(
+                query_id(index, name), metric_name,
+                {'FunctionName': function_name}, stat, period=period))
+    results = get_metric_data(cloudwatch, queries, start_time, end_time)
+    metrics = {}
+    for index, function_name in enumerate(function_names):
+        metrics[function_name] = dict(
+            (name, results[query_id(index, name)])
+            for name, _, _ in FunctionMetrics)
+    return metrics
+
+
+def summarize(series, stat):
+    """
+    Reduce a series to one number: the total for sums, the highest value
+    for everything else.  None if there are no datapoints.
+    """
+    values = series['values']
+    if not values:
+        return None
+    if stat == 'Sum':
+        return sum(values)
+    return max(values)
+
+
+def sparkline(values, width=None):
+    """
+    Render ``values`` as a line of block characters scaled between their
+    minimum and maximum.  With ``width``, only the last ``width`` values
+    are drawn.
+    """
+    if width is not None:
+        values = values[-width:]
+    if not values:
+        return u''
+    low, high = min(values), max(values)
+    if high == low:
+        return SparkChars[0] * len(values)
+    scale = (len(SparkChars) - 1) / float(high - low)
+    return u''.join(SparkChars[int(round((v - low) * scale))]
+                    for v in values)
+
+
+def to_datetime(timestamp_ms):
+    return datetime.datetime.utcfromtimestamp(timestamp_ms / 1000.0)
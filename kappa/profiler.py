@@ -0,0 +1,238 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+CPU and memory profiles of a handler run in-process.
+
+Two CPU modes are available:
+
+* ``cprofile`` - deterministic profiling of every call with cProfile.
+  Exact call counts, but the overhead inflates the cost of small
+  functions.  Written as a pstats file.
+* ``sample`` - a SIGPROF timer samples the stack every ``interval``
+  seconds of CPU time.  Low overhead; written as collapsed stacks that
+  flamegraph.pl and speedscope read directly.  Unix only.
+
+Either way, peak Python memory allocation is tracked with tracemalloc
+(where available) and compared with the function's ``memory_size``.
+"""
+
+import cProfile
+import logging
+import os
+import pstats
+import signal
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+LOG = logging.getLogger(__name__)
+
+Modes = ('cprofile', 'sample')
+
+DefaultInterval = 0.005
+
+# Warn when the handler's own allocations use this much of memory_size;
+# the runtime and imported modules need the rest.
+MemoryWarningFraction = 0.8
+
+# cProfile records the call that switches it off.
+ProfilerDisable = "<method 'disable' of '_lsprof.Profiler' objects>"
+
+
+def _label(code):
+    return '%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename),
+                           code.co_firstlineno)
+
+
+class _Sampler(object):
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = {}
+        self._root = None
+        self._previous = None
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None and frame is not self._root:
+            stack.append(_label(frame.f_code))
+            frame = frame.f_back
+        if stack:
+            key = ';'.join(reversed(stack))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def start(self, root):
+        if not hasattr(signal, 'setitimer'):
+            raise ValueError('Sampling needs signal.setitimer (Unix only)')
+        # Frames at and above ``root`` belong to kappa, not the handler.
+        self._root = root
+        self._previous = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._previous or signal.SIG_DFL)
+
+    def top(self, count):
+        """
+        Return the ``count`` functions with the most samples of their own,
+        with self and total (inclusive) time estimated from the samples.
+        """
+        own = {}
+        total = {}
+        for stack, samples in self.stacks.items():
+            frames = stack.split(';')
+            own[frames[-1]] = own.get(frames[-1], 0) + samples
+            for name in set(frames):
+                total[name] = total.get(name, 0) + samples
+        rows = [{'function': name,
+                 'calls': None,
+                 'self': own.get(name, 0) * self.interval,
+                 'total': samples * self.interval}
+                for name, samples in total.items()]
+        rows.sort(key=lambda row: (-row['self'], -row['total']))
+        return rows[:count]
+
+    def write(self, path):
+        with open(path, 'w') as fp:
+            for stack in sorted(self.stacks):
+                fp.write('%s %d\n' % (stack, self.stacks[stack]))
+
+
+def _pstats_top(stats, count):
+    rows = []
+    for (filename, line, name), values in stats.stats.items():
+        if name == ProfilerDisable:
+            continue
+        primitive_calls, calls, self_time, total_time, _ = values
+        rows.append({'function': '%s (%s:%d)' % (
+                        name, os.path.basename(filename), line),
+                     'calls': calls,
+                     'self': self_time,
+                     'total': total_time})
+    rows.sort(key=lambda row: (-row['self'], -row['total']))
+    return rows[:count]
+
+
+class Profiler(object):
+    """
+    Run a handler under a CPU profiler and tracemalloc.
+    """
+
+    def __init__(self, mode='cprofile', interval=DefaultInterval, top=20,
+                 memory_size=None, trace_memory=True):
+        if mode not in Modes:
+            raise ValueError('Unknown profiling mode: %s' % mode)
+        self.mode = mode
+        self.interval = interval
+        self.top = top
+        self.memory_size = memory_size
+        self.trace_memory = trace_memory and tracemalloc is not None
+        self._profile = None
+        self._sampler = None
+
+    def _memory_summary(self, peak, snapshot):
+        summary = {'peak_memory': peak,
+                   'memory_size': self.memory_size,
+                   'memory_fraction': None,
+                   'allocations': []}
+        if peak is not None and self.memory_size:
+            fraction = peak / (self.memory_size * 1024.0 * 1024.0)
+            summary['memory_fraction'] = fraction
+            if fraction >= MemoryWarningFraction:
+                LOG.warning('peak allocation %.1f MB is %.0f%% of '
+                            'memory_size %d MB', peak / 1048576.0,
+                            fraction * 100, self.memory_size)
+        if snapshot is not None:
+            for stat in snapshot.statistics('lineno')[:self.top]:
+                frame = stat.traceback[0]
+                summary['allocations'].append({
+                    'location': '%s:%d' % (frame.filename, frame.lineno),
+                    'size': stat.size,
+                    'count': stat.count})
+        return summary
+
+    def run(self, func, *args, **kwargs):
+        """
+        Call ``func`` and return a dict with its ``result`` (or the
+        ``error`` it raised), the wall ``duration`` in seconds, the
+        ``functions`` that took the most time, the ``peak_memory``
+        allocated and the ``allocations`` still live when it returned.
+        """
+        started_tracing = False
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+        if self.trace_memory:
+            tracemalloc.clear_traces()
+        result = error = None
+        start = time.time()
+        try:
+            if self.mode == 'cprofile':
+                self._profile = cProfile.Profile()
+                self._profile.enable()
+                try:
+                    result = func(*args, **kwargs)
+                finally:
+                    self._profile.disable()
+            else:
+                self._sampler = _Sampler(self.interval)
+                self._sampler.start(sys._getframe())
+                try:
+                    result = func(*args, **kwargs)
+                finally:
+                    self._sampler.stop()
+        except Exception as e:
+            LOG.debug('handler raised', exc_info=True)
+            error = '%s: %s' % (e.__class__.__name__, e)
+        duration = time.time() - start
+        peak = snapshot = None
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__)])
+            if started_tracing:
+                tracemalloc.stop()
+        profile = {'mode': self.mode,
+                   'result': result,
+                   'error': error,
+                   'duration': duration,
+                   'functions': self.functions()}
+        if self._sampler:
+            profile['samples'] = sum(self._sampler.stacks.values())
+        profile.update(self._memory_summary(peak, snapshot))
+        return profile
+
+    def functions(self):
+        if self._sampler is not None:
+            return self._sampler.top(self.top)
+        if self._profile is not None:
+            return _pstats_top(pstats.Stats(self._profile), self.top)
+        return []
+
+    def write(self, path):
+        """
+        Write the profile to ``path`` (pstats for cprofile, collapsed
+        stacks for sample) and return the path.
+        """
+        if self._sampler is not None:
+            self._sampler.write(path)
+        elif self._profile is not None:
+            self._profile.dump_stats(path)
+        return path
@@ -0,0 +1,214 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+Timing spans for the phases of a kappa command.
+
+Code marks a phase with ``with kappa.trace.span('zip'):``.  Spans cost
+nothing until tracing is turned on with ``enable()``; the collected spans
+can then be written as Chrome trace-event JSON (``chrome://tracing``,
+Perfetto) or as OpenTelemetry OTLP/JSON.
+"""
+
+import binascii
+import contextlib
+import json
+import os
+import threading
+import time
+
+import kappa.instrument
+
+
+def _random_id(nbytes):
+    return binascii.hexlify(os.urandom(nbytes)).decode('ascii')
+
+
+class Span(object):
+
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.span_id = _random_id(8)
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.thread = threading.current_thread().ident
+        self.start = time.time()
+        self.end = None
+        self.error = None
+
+    @property
+    def duration(self):
+        return (self.end or time.time()) - self.start
+
+
+class Tracer(object):
+
+    def __init__(self):
+        self.trace_id = _random_id(16)
+        self.spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def current(self):
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    @contextlib.contextmanager
+    def activate(self, span):
+        """
+        Make ``span``, opened in another thread, the parent of the spans
+        opened in this one.
+        """
+        stack = self._stack()
+        stack.append(span)
+        try:
+            yield span
+        finally:
+            stack.pop()
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        stack = self._stack()
+        span = Span(name, stack[-1] if stack else None, attributes)
+        stack.append(span)
+        try:
+            yield span
+        except Exception as e:
+            span.error = '%s: %s' % (e.__class__.__name__, e)
+            raise
+        finally:
+            span.end = time.time()
+            stack.pop()
+            with self._lock:
+                self.spans.append(span)
+
+    def chrome_trace(self):
+        pid = os.getpid()
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        events = []
+        for span in spans:
+            args = dict(span.attributes)
+            if span.error:
+                args['error'] = span.error
+            events.append({
+                'name': span.name,
+                'cat': 'kappa',
+                'ph': 'X',
+                'ts': span.start * 1000000.0,
+                'dur': span.duration * 1000000.0,
+                'pid': pid,
+                'tid': span.thread,
+                'args': args})
+        # Show the individual API calls under the phases if they were
+        # being recorded too.
+        recorder = kappa.instrument.get_recorder()
+        if recorder is not None:
+            events.extend(recorder.trace_events())
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def _otlp_attributes(self, attributes):
+        result = []
+        for key, value in sorted(attributes.items()):
+            if isinstance(value, bool):
+                typed = {'boolValue': value}
+            elif isinstance(value, int):
+                typed = {'intValue': str(value)}
+            elif isinstance(value, float):
+                typed = {'doubleValue': value}
+            else:
+                typed = {'stringValue': str(value)}
+            result.append({'key': key, 'value': typed})
+        return result
+
+    def otlp(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        otlp_spans = []
+        for span in spans:
+            otlp_span = {
+                'traceId': self.trace_id,
+                'spanId': span.span_id,
+                'name': span.name,
+                'kind': 1,
+                'startTimeUnixNano': str(int(span.start * 1e9)),
+                'endTimeUnixNano': str(int((span.end or time.time()) * 1e9)),
+                'attributes': self._otlp_attributes(span.attributes),
+                'status': {'code': 2, 'message': span.error}
+                if span.error else {'code': 1},
+            }
+            if span.parent_id:
+                otlp_span['parentSpanId'] = span.parent_id
+            otlp_spans.append(otlp_span)
+        return {'resourceSpans': [{
+            'resource': {'attributes': self._otlp_attributes(
+                {'service.name': 'kappa'})},
+            'scopeSpans': [{
+                'scope': {'name': 'kappa',
+                          'version': kappa.__version__.strip()},
+                'spans': otlp_spans}]}]}
+
+    def write(self, path, fmt='chrome'):
+        if fmt == 'otlp':
+            data = self.otlp()
+        else:
+            data = self.chrome_trace()
+        with open(path, 'w') as fp:
+            json.dump(data, fp, indent=2, sort_keys=True)
+
+
+_tracer = None
+
+
+def enable():
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+    return _tracer
+
+
+def disable():
+    global _tracer
+    _tracer = None
+
+
+def get_tracer():
+    return _tracer
+
+
+@contextlib.contextmanager
+def _null_span():
+    yield None
+
+
+def span(name, **attributes):
+    if _tracer is None:
+        return _null_span()
+    return _tracer.span(name, **attributes)
+
+
+def current_span():
+    if _tracer is None:
+        return None
+    return _tracer.current()
+
+
+def activate(span):
+    if _tracer is None or span is None:
+        return _null_span()
+    return _tracer.activate(span)
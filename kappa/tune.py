@@ -0,0 +1,128 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import logging
+
+import kappa.latency
+import kappa.stats
+
+LOG = logging.getLogger(__name__)
+
+# On-demand x86 pricing in us-east-1.
+PricePerGBSecond = 0.0000166667
+PricePerRequest = 0.0000002
+
+DefaultMemorySizes = [128, 256, 512, 1024, 1536, 2048, 3008]
+
+
+def invocation_cost(billed_duration, memory_size):
+    gb_seconds = (billed_duration / 1000.0) * (memory_size / 1024.0)
+    return gb_seconds * PricePerGBSecond + PricePerRequest
+
+
+class PowerTuner(object):
+    """
+    Run a function at each of a list of memory sizes, invoke it a number
+    of times with its test data and collect the REPORT line of every
+    invocation so the cost and latency of each setting can be compared.
+
+    Changing the memory size starts new execution environments, so the
+    first invocation at each size is a cold start.  It is made before the
+    measured invocations and reported on its own as ``cold_start``.
+    """
+
+    Strategies = ('cost', 'speed', 'balanced')
+
+    def __init__(self, function, memory_sizes=None, invocations=10,
+                 strategy='cost', test_data=None):
+        if strategy not in self.Strategies:
+            raise ValueError('Unknown tuning strategy: %s' % strategy)
+        self.function = function
+        self.memory_sizes = sorted(memory_sizes or DefaultMemorySizes)
+        self.invocations = invocations
+        self.strategy = strategy
+        self.test_data = test_data
+
+    def _invoke(self):
+        response, report = kappa.latency.invoke_with_report(
+            self.function, self.test_data)
+        return report, 'FunctionError' in response
+
+    def measure(self, memory_size):
+        LOG.info('measuring %d MB', memory_size)
+        self.function.set_memory_size(memory_size)
+        cold_start, errors = self._invoke()
+        errors = int(errors)
+        reports = []
+        for _ in range(self.invocations):
+            report, error = self._invoke()
+            if error:
+                errors += 1
+            if report:
+                reports.append(report)
+        durations = [r['duration'] for r in reports]
+        billed = [r['billed_duration'] for r in reports]
+        memory_used = [r['max_memory_used'] for r in reports]
+        costs = [invocation_cost(b, memory_size) for b in billed]
+        return {
+            'memory_size': memory_size,
+            'invocations': self.invocations,
+            'errors': errors,
+            'duration': kappa.stats.summarize(durations),
+            'billed_duration': kappa.stats.summarize(billed),
+            'max_memory_used': max(memory_used) if memory_used else None,
+            'cost': sum(costs) / len(costs) if costs else None,
+            'cold_start': {
+                'duration': cold_start.get('duration'),
+                'init_duration': cold_start.get('init_duration'),
+            } if cold_start else None,
+        }
+
+    def recommend(self, results):
+        candidates = [r for r in results
+                      if r['cost'] is not None and not r['errors']]
+        if not candidates:
+            return None
+        if self.strategy == 'cost':
+            key = lambda r: (r['cost'], r['duration']['p50'])
+        elif self.strategy == 'speed':
+            key = lambda r: (r['duration']['p50'], r['cost'])
+        else:
+            # Normalize both axes against the cheapest and fastest setting
+            # and pick the one with the smallest combined penalty.
+            min_cost = min(r['cost'] for r in candidates)
+            min_duration = min(r['duration']['p50'] for r in candidates)
+            key = lambda r: (r['cost'] / min_cost +
+                             r['duration']['p50'] / max(min_duration, 1))
+        return min(candidates, key=key)['memory_size']
+
+    def run(self, restore=True):
+        original = self.function.memory_size
+        current = self.function.status()
+        if current:
+            original = current['Configuration']['MemorySize']
+        results = []
+        try:
+            for memory_size in self.memory_sizes:
+                results.append(self.measure(memory_size))
+        finally:
+            if restore:
+                LOG.info('restoring memory size to %d MB', original)
+                self.function.set_memory_size(original)
+        return {
+            'function': self.function.name,
+            'strategy': self.strategy,
+            'original_memory_size': original,
+            'results': results,
+            'recommended_memory_size': self.recommend(results),
+        }
@@ -0,0 +1,334 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+Push code-only updates whenever the function source changes.
+
+Changes are picked up with inotify when the optional ``inotify_simple``
+package is installed on Linux, and by polling file modification times
+otherwise.  Bursts of changes (an editor writing several files, a
+``git checkout``) are debounced into one push.
+"""
+
+import base64
+import hashlib
+import io
+import logging
+import os
+import time
+import zipfile
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+LOG = logging.getLogger(__name__)
+
+# Files editors and tools leave next to the source that never belong in
+# the package.
+IgnoredSuffixes = ('.pyc', '.pyo', '.swp', '.swx', '~', '.tmp')
+IgnoredDirs = frozenset(['__pycache__', '.git', '.hg', '.svn'])
+
+# Fixed timestamp for zip entries, so the same files always produce the
+# same archive and the same CodeSha256.
+ZipDateTime = (1980, 1, 1, 0, 0, 0)
+
+
+def _ignored(name):
+    return name.startswith('.#') or name.endswith(IgnoredSuffixes)
+
+
+class SourceTree(object):
+    """
+    The files under ``path`` and a hash of their contents.
+
+    Each file's hash is kept along with the (mtime, size) it was computed
+    for, so a rescan only reads the files that changed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._hashes = {}
+        self._digest = None
+
+    def _walk(self):
+        if not os.path.isdir(self.path):
+            yield os.path.basename(self.path), self.path
+            return
+        for root, dirs, files in os.walk(self.path):
+            dirs[:] = sorted(d for d in dirs if d not in IgnoredDirs)
+            for filename in sorted(files):
+                if _ignored(filename):
+                    continue
+                filepath = os.path.join(root, filename)
+                yield os.path.relpath(filepath, self.path), filepath
+
+    def _file_hash(self, arcname, filepath):
+        st = os.stat(filepath)
+        key = (st.st_mtime, st.st_size)
+        cached = self._hashes.get(arcname)
+        if cached and cached[0] == key:
+            return cached[1]
+        sha = hashlib.sha256()
+        with open(filepath, 'rb') as fp:
+            for chunk in iter(lambda: fp.read(65536), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        self._hashes[arcname] = (key, digest)
+        return digest
+
+    def scan(self):
+        """
+        Return a digest of the names and contents of all files.
+        """
+        sha = hashlib.sha256()
+        seen = set()
+        for arcname, filepath in self._walk():
+            try:
+                file_hash = self._file_hash(arcname, filepath)
+            except (IOError, OSError):
+                # Deleted between listing and reading.
+                continue
+            seen.add(arcname)
+            sha.update(arcname.encode('utf-8') + b'\0')
+            sha.update(file_hash.encode('ascii') + b'\0')
+        for arcname in list(self._hashes):
+            if arcname not in seen:
+                del self._hashes[arcname]
+        self._digest = sha.hexdigest()
+        return self._digest
+
+    def package(self):
+        """
+        Build a deterministic zip of the tree and return its bytes.
+        """
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            for arcname, filepath in self._walk():
+                info = zipfile.ZipInfo(arcname.replace(os.sep, '/'),
+                                       ZipDateTime)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info.external_attr = (
+                    os.stat(filepath).st_mode & 0o777 | 0o100000) << 16
+                with open(filepath, 'rb') as fp:
+                    zf.writestr(info, fp.read())
+        return buf.getvalue()
+
+
+def code_sha256(zipdata):
+    # Same encoding as the CodeSha256 Lambda reports for a function.
+    return base64.b64encode(hashlib.sha256(zipdata).digest()).decode('ascii')
+
+
+class _PollingMonitor(object):
+
+    def __init__(self, path, interval):
+        self.path = path
+        self.interval = interval
+        self._snapshot = self._take()
+
+    def _take(self):
+        snapshot = {}
+        if not os.path.isdir(self.path):
+            paths = [self.path]
+        else:
+            paths = []
+            for root, dirs, files in os.walk(self.path):
+                dirs[:] = [d for d in dirs if d not in IgnoredDirs]
+                paths.extend(os.path.join(root, f) for f in files
+                             if not _ignored(f))
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            snapshot[path] = (st.st_mtime, st.st_size)
+        return snapshot
+
+    def wait(self, timeout):
+        """
+        Return True if anything changed within ``timeout`` seconds.
+        """
+        deadline = time.time() + timeout
+        while True:
+            snapshot = self._take()
+            if snapshot != self._snapshot:
+                self._snapshot = snapshot
+                return True
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+
+class _InotifyMonitor(object):
+
+    def __init__(self, path):
+        flags = inotify_simple.flags
+        self._mask = (flags.CREATE | flags.MODIFY | flags.DELETE |
+                      flags.MOVED_FROM | flags.MOVED_TO | flags.CLOSE_WRITE |
+                      flags.DELETE_SELF)
+        self._inotify = inotify_simple.INotify()
+        self._dirs = {}
+        if os.path.isdir(path):
+            for root, dirs, _ in os.walk(path):
+                dirs[:] = [d for d in dirs if d not in IgnoredDirs]
+                self._add(root)
+        else:
+            self._add(path)
+
+    def _add(self, path):
+        wd = self._inotify.add_watch(path, self._mask)
+        self._dirs[wd] = path
+
+    def wait(self, timeout):
+        changed = False
+        for event in self._inotify.read(timeout=int(timeout * 1000)):
+            if event.name and _ignored(event.name):
+                continue
+            changed = True
+            if event.mask & inotify_simple.flags.ISDIR and \
+                    event.mask & inotify_simple.flags.CREATE and \
+                    event.name not in IgnoredDirs:
+                # New directories need watches of their own.
+                self._add(os.path.join(self._dirs[event.wd], event.name))
+        return changed
+
+    def close(self):
+        self._inotify.close()
+
+
+def monitor(path, poll_interval=0.5, use_inotify=True):
+    if use_inotify and inotify_simple is not None:
+        try:
+            return _InotifyMonitor(path)
+        except OSError:
+            LOG.debug('inotify unavailable, polling %s', path)
+    return _PollingMonitor(path, poll_interval)
+
+
+class Watcher(object):
+    """
+    Watch the source of ``function`` and push code-only updates.
+
+    ``echo`` is called with a line of text for every push and, when
+    ``follow_logs`` is set, for every new log event.  Logs are fetched at
+    most every ``log_interval`` seconds.
+    """
+
+    def __init__(self, function, debounce=0.3, poll_interval=0.5,
+                 follow_logs=False, echo=None, use_inotify=True,
+                 log_interval=2.0):
+        self.function = function
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.follow_logs = follow_logs
+        self.log_interval = log_interval
+        self.echo = echo or LOG.info
+        self.use_inotify = use_inotify
+        self.tree = SourceTree(function.path)
+        self.pushes = 0
+        self._digest = None
+        self._code_sha256 = None
+        self._log_since = None
+        self._next_log_poll = 0
+
+    def _remote_code_sha256(self):
+        status = self.function.status()
+        if status:
+            return status['Configuration'].get('CodeSha256')
+        return None
+
+    def sync(self):
+        """
+        Push the current source if it differs from what was last pushed.
+        Returns True if a push was made.
+        """
+        digest = self.tree.scan()
+        dependencies_key = self.function.dependencies_key()
+        if dependencies_key:
+            digest += dependencies_key
+        if digest == self._digest:
+            LOG.debug('source unchanged')
+            return False
+        start = time.time()
+        if dependencies_key:
+            zipdata = SourceTree(self.function.stage()).package()
+        else:
+            zipdata = self.tree.package()
+        sha = code_sha256(zipdata)
+        if self._code_sha256 is None:
+            self._code_sha256 = self._remote_code_sha256()
+        if sha == self._code_sha256:
+            LOG.debug('package unchanged (%s)', sha)
+            self._digest = digest
+            return False
+        self.function.push_code(zipdata)
+        # Only now, so a failed push is retried on the next sync.
+        self._digest = digest
+        self._code_sha256 = sha
+        if self._log_since is None:
+            self._log_since = int(start * 1000)
+        self.pushes += 1
+        self.echo('pushed {} bytes in {:.1f}s'.format(
+            len(zipdata), time.time() - start))
+        return True
+
+    def _try_sync(self):
+        try:
+            return self.sync()
+        except (ClientError, BotoCoreError) as e:
+            # Keep watching; the push is retried after the next change.
+            LOG.debug('push failed', exc_info=True)
+            self.echo('push failed: {}'.format(e))
+            return False
+
+    def _echo_new_logs(self):
+        if self._log_since is None:
+            return
+        for event in self.function.log.events_since(self._log_since):
+            self._log_since = max(self._log_since, event['timestamp'] + 1)
+            self.echo(event['message'].rstrip())
+
+    def run(self, iterations=None):
+        """
+        Push the source once, then again after every burst of changes.
+        Runs until interrupted, or for ``iterations`` wake-ups.
+        """
+        self._try_sync()
+        watch = monitor(self.function.path, self.poll_interval,
+                        self.use_inotify)
+        try:
+            count = 0
+            while iterations is None or count < iterations:
+                count += 1
+                changed = watch.wait(self.poll_interval)
+                if changed:
+                    # Wait for the burst to settle before packaging.
+                    while watch.wait(self.debounce):
+                        pass
+                    self._try_sync()
+                if self.follow_logs and time.time() >= self._next_log_poll:
+                    self._next_log_poll = time.time() + self.log_interval
+                    try:
+                        self._echo_new_logs()
+                    except (ClientError, BotoCoreError):
+                        LOG.debug('unable to fetch logs', exc_info=True)
+        finally:
+            watch.close()
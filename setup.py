@@ -4,12 +4,17 @@ from setuptools import setup, find_packages
 
 import os
 
+import sys
+
 requires = [
     'boto3>=1.2.1',
     'click==4.0',
     'PyYAML>=3.11'
 ]
 
+if sys.version_info[0] == 2:
+    requires.append('futures>=3.0.0')
+
 
 setup(
     name='kappa',
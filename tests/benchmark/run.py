@@ -0,0 +1,317 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+Benchmarks for packaging, deploy orchestration, log streaming and CLI
+startup.  Everything runs offline against ``tests.unit.fake_aws``.
+
+    python -m tests.benchmark.run --output results.json
+    python tests/benchmark/run.py --quick --only zip,deploy
+
+Results are written as JSON so they can be compared across releases.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+KappaRoot = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+# Run as a script, only this file's directory is on the path.
+if KappaRoot not in sys.path:
+    sys.path.insert(0, KappaRoot)
+
+import kappa
+from kappa.context import Context
+from kappa.event_source import SNSEventSource
+from kappa.function import Function
+from kappa.log import Log
+from tests.unit.fake_aws import FakeBackend
+
+
+def _timed(func, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.time()
+        result = func()
+        timings.append(time.time() - start)
+    return min(timings), sum(timings) / len(timings), result
+
+
+def _write(path, size, rnd, compressible=True):
+    if compressible:
+        line = b'def handler(event, context):\n    return event\n'
+        data = (line * (size // len(line) + 1))[:size]
+    else:
+        data = bytearray(rnd.getrandbits(8) for _ in range(size))
+    with open(path, 'wb') as fp:
+        fp.write(data)
+    return size
+
+
+def make_tree(root, kind, scale):
+    """
+    Build a synthetic Lambda source tree under ``root`` and return its
+    file count and total size.
+    """
+    rnd = random.Random(0)
+    files = 0
+    total = 0
+    if kind == 'small_files':
+        for d in range(20):
+            subdir = os.path.join(root, 'pkg%d' % d)
+            os.makedirs(subdir)
+            for f in range(int(100 * scale)):
+                total += _write(os.path.join(subdir, 'mod%d.py' % f),
+                                1024, rnd)
+                files += 1
+    elif kind == 'large_files':
+        for f in range(5):
+            total += _write(os.path.join(root, 'blob%d.bin' % f),
+                            int(8 * 1024 * 1024 * scale), rnd,
+                            compressible=(f % 2 == 0))
+            files += 1
+    elif kind == 'vendored_wheels':
+        for w in range(int(10 * scale) or 1):
+            pkg = os.path.join(root, 'vendor%d' % w)
+            dist = os.path.join(root, 'vendor%d-1.0.dist-info' % w)
+            os.makedirs(pkg)
+            os.makedirs(dist)
+            for f in range(40):
+                total += _write(os.path.join(pkg, 'm%d.py' % f), 4096, rnd)
+                files += 1
+            total += _write(os.path.join(pkg, '_speedups.so'),
+                            512 * 1024, rnd, compressible=False)
+            for name in ('METADATA', 'RECORD', 'WHEEL'):
+                total += _write(os.path.join(dist, name), 2048, rnd)
+                files += 1
+            files += 1
+    else:
+        raise ValueError('Unknown tree kind: %s' % kind)
+    return files, total
+
+
+def bench_zip(scale, repeat):
+    results = {}
+    backend = FakeBackend()
+    for kind in ('small_files', 'large_files', 'vendored_wheels'):
+        workdir = tempfile.mkdtemp()
+        try:
+            src = os.path.join(workdir, 'src')
+            os.makedirs(src)
+            files, total = make_tree(src, kind, scale)
+            zipfile_name = os.path.join(workdir, 'out.zip')
+            with backend.patch():
+                function = Function(_StubContext(), {'handler': 'x.y'})
+            best, mean, _ = _timed(
+                lambda: function.zip_lambda_function(zipfile_name, src),
+                repeat)
+            results[kind] = {
+                'files': files,
+                'bytes': total,
+                'zip_bytes': os.path.getsize(zipfile_name),
+                'best_seconds': best,
+                'mean_seconds': mean,
+                'mb_per_second': total / (1024.0 * 1024.0) / best,
+                'files_per_second': files / best,
+            }
+        finally:
+            shutil.rmtree(workdir)
+    return results
+
+
+class _StubContext(object):
+
+    name = 'bench'
+    profile = None
+    region = 'us-east-1'
+
+
+def _deploy_config(workdir, permissions, event_sources):
+    src = os.path.join(workdir, 'src')
+    if not os.path.isdir(src):
+        os.makedirs(src)
+        make_tree(src, 'small_files', 0.1)
+    topics = ['arn:aws:sns:us-east-1:123456789012:topic%d' % i
+              for i in range(event_sources)]
+    return {
+        'iam': {
+            'policy': {'name': 'BenchPolicy',
+                       'document': '{"Version": "2012-10-17"}'},
+            'role': {'name': 'BenchRole'}},
+        'lambda': {
+            'name': 'BenchFunction',
+            'handler': 'mod0.handler',
+            'runtime': 'python2.7',
+            'path': src,
+            'zipfile_name': os.path.join(workdir, 'bench.zip'),
+            'permissions': [{
+                'statement_id': 'invoke%d' % i,
+                'action': 'lambda:InvokeFunction',
+                'principal': 'sns.amazonaws.com',
+                'source_arn': topics[i % len(topics)] if topics else None}
+                for i in range(permissions)],
+            'event_sources': [{'arn': arn} for arn in topics]}}, topics
+
+
+def bench_deploy(scale, repeat):
+    results = {}
+    permissions = max(int(10 * scale), 1)
+    event_sources = max(int(5 * scale), 1)
+    workdir = tempfile.mkdtemp()
+    try:
+        for phase in ('create', 'update'):
+            timings = []
+            for _ in range(repeat):
+                SNSEventSource.clear_subscription_index()
+                backend = FakeBackend(page_size=20, consistency_delay=0)
+                config, topics = _deploy_config(
+                    workdir, permissions, event_sources)
+                for arn in topics:
+                    backend.sns.create_topic(arn.split(':')[-1])
+                with backend.patch():
+                    if phase == 'update':
+                        context = Context('bench', config)
+                        context.deploy()
+                        context.add_event_sources()
+                        backend.calls = []
+                        SNSEventSource.clear_subscription_index()
+                    clock_start = backend.clock.time()
+                    start = time.time()
+                    context = Context('bench', config)
+                    context.deploy()
+                    if phase == 'create':
+                        context.add_event_sources()
+                    else:
+                        context.update_event_sources()
+                    elapsed = time.time() - start
+                timings.append(elapsed)
+            results[phase] = {
+                'permissions': permissions,
+                'event_sources': event_sources,
+                'best_seconds': min(timings),
+                'mean_seconds': sum(timings) / len(timings),
+                'slept_seconds': backend.clock.time() - clock_start,
+                'api_calls': len(backend.calls),
+                'api_calls_by_operation': backend.call_counts(),
+            }
+    finally:
+        shutil.rmtree(workdir)
+    return results
+
+
+def bench_tail(scale, repeat):
+    backend = FakeBackend(page_size=10000)
+    streams = max(int(20 * scale), 1)
+    events_per_stream = max(int(5000 * scale), 1)
+    group = '/aws/lambda/BenchFunction'
+    for s in range(streams):
+        backend.logs.put_events(group, 'stream%03d' % s, [
+            {'timestamp': 1420070400000 + s * 1000000 + i,
+             'message': 'event %d of stream %d' % (i, s)}
+            for i in range(events_per_stream)])
+    with backend.patch():
+        log = Log(_StubContext(), group)
+        backend.calls = []
+        best, mean, events = _timed(log.tail, repeat)
+    return {
+        'streams': streams,
+        'events_returned': len(events),
+        'best_seconds': best,
+        'mean_seconds': mean,
+        'events_per_second': len(events) / best if best else None,
+        'api_calls': len(backend.calls) // repeat,
+    }
+
+
+def bench_cli_startup(scale, repeat):
+    commands = {
+        'import_kappa_context': [sys.executable, '-c',
+                                 'import kappa.context'],
+        'kappa_help': [sys.executable,
+                       os.path.join(KappaRoot, 'bin', 'kappa'), '--help'],
+    }
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [KappaRoot] + [p for p in [env.get('PYTHONPATH')] if p])
+    results = {}
+    for name, command in commands.items():
+        timings = []
+        for _ in range(repeat):
+            start = time.time()
+            process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE, env=env)
+            _, stderr = process.communicate()
+            timings.append(time.time() - start)
+            if process.returncode:
+                # The time it takes to crash is not a startup time.
+                raise RuntimeError('%s exited with status %d: %s' % (
+                    name, process.returncode,
+                    stderr.decode('utf-8', 'replace')[-2000:]))
+        results[name] = {
+            'best_seconds': min(timings),
+            'mean_seconds': sum(timings) / len(timings),
+        }
+    return results
+
+
+Benchmarks = {
+    'zip': bench_zip,
+    'deploy': bench_deploy,
+    'tail': bench_tail,
+    'cli_startup': bench_cli_startup,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--output', '-o', help='Write JSON results here')
+    parser.add_argument('--only', help='Comma separated benchmark names')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--quick', action='store_true',
+                        help='Use small inputs, for smoke testing')
+    args = parser.parse_args(argv)
+    names = args.only.split(',') if args.only else sorted(Benchmarks)
+    scale = 0.05 if args.quick else 1.0
+    report = {
+        'kappa_version': kappa.__version__.strip(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'scale': scale,
+        'repeat': args.repeat,
+        'results': {},
+    }
+    for name in names:
+        sys.stderr.write('running %s...\n' % name)
+        report['results'][name] = Benchmarks[name](scale, args.repeat)
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            fp.write(output)
+    else:
+        sys.stdout.write(output + '\n')
+    return report
+
+
+if __name__ == '__main__':
+    main()
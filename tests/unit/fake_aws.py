@@ -0,0 +1,1027 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+A stateful, in-memory stand-in for the parts of Lambda, IAM, S3, SNS,
+CloudWatch Logs and CloudWatch metrics that kappa uses.
+
+Unlike ``mock_aws``, which replays canned responses per method, the fake
+keeps real state so a whole ``Context.deploy``/``status``/``delete`` flow can
+run offline.  It can also model the behavior that makes deploys slow or
+flaky in practice:
+
+* ``page_size`` - list operations return at most this many items and a
+  continuation token.
+* ``consistency_delay`` - a new IAM role cannot be assumed by Lambda, and
+  function updates and provisioned concurrency stay in progress, until
+  this many (virtual) seconds have passed.
+* ``throttle_rate`` - the probability that any call fails with the
+  service's throttling error.
+
+Time is virtual: ``FakeBackend.patch`` replaces ``time.sleep`` with
+``backend.clock.sleep`` so waits cost nothing but still advance the clock.
+
+    backend = FakeBackend(consistency_delay=5)
+    with backend.patch():
+        Context('foo', config).deploy()
+    backend.call_counts()
+"""
+
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+
+import mock
+from botocore.exceptions import ClientError
+from botocore.hooks import HierarchicalEmitter
+
+AccountId = '123456789012'
+
+# Lambda stores policy actions in this casing whatever was passed in.
+LambdaActions = dict((action.lower(), action) for action in [
+    'lambda:InvokeFunction', 'lambda:InvokeAsync', 'lambda:GetFunction',
+    'lambda:*'])
+
+
+def client_error(code, message, operation_name, status=400):
+    return ClientError(
+        {'Error': {'Code': code, 'Message': message},
+         'ResponseMetadata': {'HTTPStatusCode': status}},
+        operation_name)
+
+
+def metadata(status=200):
+    return {'ResponseMetadata': {'HTTPStatusCode': status,
+                                 'RequestId': str(uuid.uuid4())}}
+
+
+def paginate(items, token, page_size, token_name, result_name):
+    start = int(token) if token else 0
+    response = metadata()
+    response[result_name] = items[start:start + page_size]
+    if start + page_size < len(items):
+        response[token_name] = str(start + page_size)
+    return response
+
+
+class FakeClock(object):
+
+    def __init__(self, start=1420070400.0):
+        self.now = start
+        self._lock = threading.Lock()
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        with self._lock:
+            self.now += seconds
+
+
+class FakeService(object):
+
+    service_name = None
+    throttle_code = 'Throttling'
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @property
+    def now(self):
+        return self.backend.clock.time()
+
+
+class FakeIAM(FakeService):
+
+    service_name = 'iam'
+
+    def __init__(self, backend):
+        super(FakeIAM, self).__init__(backend)
+        self.policies = {}
+        self.roles = {}
+
+    def _role(self, name, operation_name):
+        if name not in self.roles:
+            raise client_error('NoSuchEntity',
+                               'Role %s not found' % name, operation_name)
+        return self.roles[name]
+
+    def get_user(self):
+        response = metadata()
+        response['User'] = {
+            'UserName': 'kappa',
+            'Arn': 'arn:aws:iam::%s:user/kappa' % AccountId}
+        return response
+
+    def list_policies(self, Marker=None, Scope='All'):
+        policies = sorted(self.policies.values(),
+                          key=lambda p: p['PolicyName'])
+        response = paginate(policies, Marker, self.backend.page_size,
+                            'Marker', 'Policies')
+        response['IsTruncated'] = 'Marker' in response
+        return response
+
+    def create_policy(self, PolicyName, PolicyDocument, Path='/',
+                      Description=''):
+        if PolicyName in self.policies:
+            raise client_error('EntityAlreadyExists',
+                               'Policy %s exists' % PolicyName,
+                               'CreatePolicy', 409)
+        policy = {
+            'PolicyName': PolicyName,
+            'Path': Path,
+            'Arn': 'arn:aws:iam::%s:policy%s%s' % (
+                AccountId, Path, PolicyName),
+            'Description': Description,
+            'Document': PolicyDocument,
+            'AttachmentCount': 0}
+        self.policies[PolicyName] = policy
+        response = metadata()
+        response['Policy'] = policy
+        return response
+
+    def delete_policy(self, PolicyArn):
+        for name, policy in list(self.policies.items()):
+            if policy['Arn'] == PolicyArn:
+                if policy['AttachmentCount']:
+                    raise client_error(
+                        'DeleteConflict', 'Policy is attached',
+                        'DeletePolicy', 409)
+                del self.policies[name]
+                return metadata()
+        raise client_error('NoSuchEntity', 'Policy not found',
+                           'DeletePolicy', 404)
+
+    def list_roles(self, Marker=None):
+        roles = [dict((k, v) for k, v in role.items()
+                      if not k.startswith('_'))
+                 for role in sorted(self.roles.values(),
+                                    key=lambda r: r['RoleName'])]
+        response = paginate(roles, Marker, self.backend.page_size,
+                            'Marker', 'Roles')
+        response['IsTruncated'] = 'Marker' in response
+        return response
+
+    def get_role(self, RoleName):
+        role = self._role(RoleName, 'GetRole')
+        response = metadata()
+        response['Role'] = dict((k, v) for k, v in role.items()
+                                if not k.startswith('_'))
+        return response
+
+    def create_role(self, RoleName, AssumeRolePolicyDocument, Path='/'):
+        if RoleName in self.roles:
+            raise client_error('EntityAlreadyExists',
+                               'Role %s exists' % RoleName,
+                               'CreateRole', 409)
+        role = {
+            'RoleName': RoleName,
+            'Path': Path,
+            'Arn': 'arn:aws:iam::%s:role%s%s' % (AccountId, Path, RoleName),
+            'AssumeRolePolicyDocument': AssumeRolePolicyDocument,
+            '_created': self.now,
+            '_attached': [],
+            '_inline': {}}
+        self.roles[RoleName] = role
+        return self.get_role(RoleName)
+
+    def put_role_policy(self, RoleName, PolicyName, PolicyDocument):
+        self._role(RoleName, 'PutRolePolicy')['_inline'][PolicyName] = \
+            PolicyDocument
+        return metadata()
+
+    def attach_role_policy(self, RoleName, PolicyArn):
+        role = self._role(RoleName, 'AttachRolePolicy')
+        if PolicyArn not in role['_attached']:
+            role['_attached'].append(PolicyArn)
+            for policy in self.policies.values():
+                if policy['Arn'] == PolicyArn:
+                    policy['AttachmentCount'] += 1
+        return metadata()
+
+    def detach_role_policy(self, RoleName, PolicyArn):
+        role = self._role(RoleName, 'DetachRolePolicy')
+        if PolicyArn not in role['_attached']:
+            raise client_error('NoSuchEntity', 'Policy is not attached',
+                               'DetachRolePolicy', 404)
+        role['_attached'].remove(PolicyArn)
+        for policy in self.policies.values():
+            if policy['Arn'] == PolicyArn:
+                policy['AttachmentCount'] -= 1
+        return metadata()
+
+    def delete_role(self, RoleName):
+        role = self._role(RoleName, 'DeleteRole')
+        if role['_attached']:
+            raise client_error('DeleteConflict', 'Role has policies',
+                               'DeleteRole', 409)
+        del self.roles[RoleName]
+        return metadata()
+
+    def role_assumable(self, role_arn):
+        for role in self.roles.values():
+            if role['Arn'] == role_arn:
+                return (self.now - role['_created'] >=
+                        self.backend.consistency_delay)
+        return False
+
+
+class FakeLambda(FakeService):
+
+    service_name = 'lambda'
+    throttle_code = 'TooManyRequestsException'
+
+    def __init__(self, backend):
+        super(FakeLambda, self).__init__(backend)
+        self.functions = {}
+        self.mappings = {}
+        self._policy_lock = threading.Lock()
+
+    def _function(self, name, operation_name):
+        name = name.split(':function:')[-1].split(':')[0]
+        if name not in self.functions:
+            raise client_error(
+                'ResourceNotFoundException',
+                'Function not found: %s' % name, operation_name, 404)
+        return self.functions[name]
+
+    def _configuration(self, function):
+        config = dict(function['Configuration'])
+        if self.now < function['_updated'] + self.backend.consistency_delay:
+            config['LastUpdateStatus'] = 'InProgress'
+        else:
+            config['LastUpdateStatus'] = 'Successful'
+        return config
+
+    def _check_update(self, function, operation_name):
+        if self._configuration(function)['LastUpdateStatus'] == 'InProgress':
+            raise client_error(
+                'ResourceConflictException',
+                'An update is in progress for resource: %s' % (
+                    function['Configuration']['FunctionArn'],),
+                operation_name, 409)
+
+    def _code_size(self, Code):
+        if 'ZipFile' in Code:
+            data = Code['ZipFile']
+        else:
+            data = self.backend.s3.get_object_data(
+                Code['S3Bucket'], Code['S3Key'])
+        return data
+
+    def create_function(self, FunctionName, Runtime, Role, Handler, Code,
+                        Description='', Timeout=3, MemorySize=128,
+                        **kwargs):
+        if FunctionName in self.functions:
+            raise client_error('ResourceConflictException',
+                               'Function already exist: %s' % FunctionName,
+                               'CreateFunction', 409)
+        if not self.backend.iam.role_assumable(Role):
+            raise client_error(
+                'InvalidParameterValueException',
+                'The role defined for the function cannot be assumed '
+                'by Lambda.', 'CreateFunction')
+        data = self._code_size(Code)
+        arn = 'arn:aws:lambda:%s:%s:function:%s' % (
+            self.backend.region, AccountId, FunctionName)
+        config = {
+            'FunctionName': FunctionName,
+            'FunctionArn': arn,
+            'Runtime': Runtime,
+            'Role': Role,
+            'Handler': Handler,
+            'Description': Description,
+            'Timeout': Timeout,
+            'MemorySize': MemorySize,
+            'CodeSize': len(data),
+            'CodeSha256': base64.b64encode(
+                hashlib.sha256(data).digest()).decode('ascii'),
+            'Version': '$LATEST',
+            'State': 'Active'}
+        config.update(kwargs)
+        self.functions[FunctionName] = {
+            'Configuration': config,
+            '_updated': self.now,
+            '_versions': {},
+            '_aliases': {},
+            '_policy': [],
+            '_provisioned': {}}
+        response = metadata(201)
+        response.update(self._configuration(self.functions[FunctionName]))
+        return response
+
+    def get_function(self, FunctionName):
+        function = self._function(FunctionName, 'GetFunction')
+        response = metadata()
+        response['Configuration'] = self._configuration(function)
+        response['Code'] = {'RepositoryType': 'S3',
+                            'Location': 'https://example.com/code.zip'}
+        return response
+
+    def get_function_configuration(self, FunctionName):
+        function = self._function(FunctionName, 'GetFunctionConfiguration')
+        response = metadata()
+        response.update(self._configuration(function))
+        return response
+
+    def update_function_code(self, FunctionName, ZipFile=None,
+                             S3Bucket=None, S3Key=None, Publish=False):
+        function = self._function(FunctionName, 'UpdateFunctionCode')
+        self._check_update(function, 'UpdateFunctionCode')
+        if ZipFile is not None:
+            data = ZipFile
+        else:
+            data = self.backend.s3.get_object_data(S3Bucket, S3Key)
+        function['Configuration']['CodeSize'] = len(data)
+        function['Configuration']['CodeSha256'] = base64.b64encode(
+            hashlib.sha256(data).digest()).decode('ascii')
+        function['_updated'] = self.now
+        return self.get_function_configuration(FunctionName)
+
+    def update_function_configuration(self, FunctionName, **kwargs):
+        function = self._function(
+            FunctionName, 'UpdateFunctionConfiguration')
+        self._check_update(function, 'UpdateFunctionConfiguration')
+        if 'Role' in kwargs and \
+                not self.backend.iam.role_assumable(kwargs['Role']):
+            raise client_error(
+                'InvalidParameterValueException',
+                'The role defined for the function cannot be assumed '
+                'by Lambda.', 'UpdateFunctionConfiguration')
+        function['Configuration'].update(kwargs)
+        function['_updated'] = self.now
+        return self.get_function_configuration(FunctionName)
+
+    def delete_function(self, FunctionName, Qualifier=None):
+        function = self._function(FunctionName, 'DeleteFunction')
+        del self.functions[function['Configuration']['FunctionName']]
+        for uuid_, mapping in list(self.mappings.items()):
+            if mapping['FunctionArn'] == \
+                    function['Configuration']['FunctionArn']:
+                del self.mappings[uuid_]
+        return metadata(204)
+
+    def add_permission(self, FunctionName, StatementId, Action, Principal,
+                       SourceArn=None, SourceAccount=None, Qualifier=None):
+        with self._policy_lock:
+            return self._add_permission(
+                FunctionName, StatementId, Action, Principal, SourceArn,
+                SourceAccount)
+
+    def _add_permission(self, FunctionName, StatementId, Action, Principal,
+                        SourceArn, SourceAccount):
+        function = self._function(FunctionName, 'AddPermission')
+        if StatementId in [s['Sid'] for s in function['_policy']]:
+            raise client_error(
+                'ResourceConflictException',
+                'The statement id (%s) provided already exists.' % (
+                    StatementId,), 'AddPermission', 409)
+        statement = {
+            'Sid': StatementId,
+            'Effect': 'Allow',
+            'Principal': {'Service': Principal},
+            'Action': LambdaActions.get(Action.lower(), Action),
+            'Resource': function['Configuration']['FunctionArn']}
+        condition = {}
+        if SourceArn:
+            condition['ArnLike'] = {'AWS:SourceArn': SourceArn}
+        if SourceAccount:
+            condition['StringEquals'] = {'AWS:SourceAccount': SourceAccount}
+        if condition:
+            statement['Condition'] = condition
+        function['_policy'].append(statement)
+        response = metadata(201)
+        response['Statement'] = json.dumps(statement)
+        return response
+
+    def remove_permission(self, FunctionName, StatementId, Qualifier=None):
+        function = self._function(FunctionName, 'RemovePermission')
+        with self._policy_lock:
+            sids = [s['Sid'] for s in function['_policy']]
+            if StatementId not in sids:
+                raise client_error(
+                    'ResourceNotFoundException',
+                    'Statement %s is not found in resource policy.' % (
+                        StatementId,), 'RemovePermission', 404)
+            del function['_policy'][sids.index(StatementId)]
+        return metadata(204)
+
+    def get_policy(self, FunctionName, Qualifier=None):
+        function = self._function(FunctionName, 'GetPolicy')
+        if not function['_policy']:
+            raise client_error(
+                'ResourceNotFoundException',
+                'The resource you requested does not exist.',
+                'GetPolicy', 404)
+        response = metadata()
+        response['Policy'] = json.dumps({
+            'Version': '2012-10-17',
+            'Id': 'default',
+            'Statement': function['_policy']})
+        return response
+
+    def publish_version(self, FunctionName, Description='', **kwargs):
+        function = self._function(FunctionName, 'PublishVersion')
+        self._check_update(function, 'PublishVersion')
+        version = str(len(function['_versions']) + 1)
+        config = dict(function['Configuration'])
+        config['Version'] = version
+        config['FunctionArn'] += ':' + version
+        config['Description'] = Description
+        function['_versions'][version] = config
+        response = metadata(201)
+        response.update(config)
+        return response
+
+    def _alias_response(self, function, name, status=200):
+        alias = function['_aliases'][name]
+        response = metadata(status)
+        response.update(alias)
+        return response
+
+    def get_alias(self, FunctionName, Name):
+        function = self._function(FunctionName, 'GetAlias')
+        if Name not in function['_aliases']:
+            raise client_error('ResourceNotFoundException',
+                               'Alias not found: %s' % Name, 'GetAlias', 404)
+        return self._alias_response(function, Name)
+
+    def create_alias(self, FunctionName, Name, FunctionVersion,
+                     Description='', RoutingConfig=None):
+        function = self._function(FunctionName, 'CreateAlias')
+        if Name in function['_aliases']:
+            raise client_error('ResourceConflictException',
+                               'Alias already exists: %s' % Name,
+                               'CreateAlias', 409)
+        function['_aliases'][Name] = {
+            'Name': Name,
+            'AliasArn': '%s:%s' % (
+                function['Configuration']['FunctionArn'], Name),
+            'FunctionVersion': FunctionVersion,
+            'Description': Description,
+            'RoutingConfig': RoutingConfig or {}}
+        return self._alias_response(function, Name, 201)
+
+    def update_alias(self, FunctionName, Name, FunctionVersion=None,
+                     Description=None, RoutingConfig=None):
+        function = self._function(FunctionName, 'UpdateAlias')
+        if Name not in function['_aliases']:
+            raise client_error('ResourceNotFoundException',
+                               'Alias not found: %s' % Name,
+                               'UpdateAlias', 404)
+        alias = function['_aliases'][Name]
+        if FunctionVersion is not None:
+            alias['FunctionVersion'] = FunctionVersion
+        if Description is not None:
+            alias['Description'] = Description
+        if RoutingConfig is not None:
+            alias['RoutingConfig'] = RoutingConfig
+        return self._alias_response(function, Name)
+
+    def put_function_concurrency(self, FunctionName,
+                                 ReservedConcurrentExecutions):
+        function = self._function(FunctionName, 'PutFunctionConcurrency')
+        function['_reserved'] = ReservedConcurrentExecutions
+        response = metadata()
+        response['ReservedConcurrentExecutions'] = \
+            ReservedConcurrentExecutions
+        return response
+
+    def put_provisioned_concurrency_config(
+            self, FunctionName, Qualifier, ProvisionedConcurrentExecutions):
+        function = self._function(
+            FunctionName, 'PutProvisionedConcurrencyConfig')
+        function['_provisioned'][Qualifier] = {
+            'RequestedProvisionedConcurrentExecutions':
+                ProvisionedConcurrentExecutions,
+            '_requested': self.now}
+        return self.get_provisioned_concurrency_config(
+            FunctionName, Qualifier)
+
+    def get_provisioned_concurrency_config(self, FunctionName, Qualifier):
+        function = self._function(
+            FunctionName, 'GetProvisionedConcurrencyConfig')
+        if Qualifier not in function['_provisioned']:
+            raise client_error(
+                'ProvisionedConcurrencyConfigNotFoundException',
+                'No Provisioned Concurrency Config found',
+                'GetProvisionedConcurrencyConfig', 404)
+        config = function['_provisioned'][Qualifier]
+        requested = config['RequestedProvisionedConcurrentExecutions']
+        ready = (self.now - config['_requested'] >=
+                 self.backend.consistency_delay)
+        response = metadata()
+        response['RequestedProvisionedConcurrentExecutions'] = requested
+        response['AvailableProvisionedConcurrentExecutions'] = \
+            requested if ready else 0
+        response['Status'] = 'READY' if ready else 'IN_PROGRESS'
+        return response
+
+    def delete_provisioned_concurrency_config(self, FunctionName, Qualifier):
+        function = self._function(
+            FunctionName, 'DeleteProvisionedConcurrencyConfig')
+        function['_provisioned'].pop(Qualifier, None)
+        return metadata(204)
+
+    def invoke(self, FunctionName, InvocationType='RequestResponse',
+               LogType='None', Payload=b'', Qualifier=None):
+        function = self._function(FunctionName, 'Invoke')
+        config = function['Configuration']
+        response = metadata(200 if InvocationType == 'RequestResponse'
+                            else 202)
+        if LogType == 'Tail':
+            request_id = str(uuid.uuid4())
+            log = ('START RequestId: %s Version: $LATEST\n'
+                   'END RequestId: %s\n'
+                   'REPORT RequestId: %s\tDuration: 1.00 ms\t'
+                   'Billed Duration: 1 ms\tMemory Size: %d MB\t'
+                   'Max Memory Used: 30 MB\t\n') % (
+                       request_id, request_id, request_id,
+                       config['MemorySize'])
+            response['LogResult'] = base64.b64encode(
+                log.encode('utf-8')).decode('ascii')
+        response['Payload'] = mock.Mock()
+        response['Payload'].read.return_value = b'null'
+        return response
+
+    def _mapping_response(self, mapping, status=200):
+        response = metadata(status)
+        response.update(mapping)
+        return response
+
+    def create_event_source_mapping(self, FunctionName, EventSourceArn,
+                                    **kwargs):
+        function = self._function(FunctionName, 'CreateEventSourceMapping')
+        mapping = {
+            'UUID': str(uuid.uuid4()),
+            'FunctionArn': function['Configuration']['FunctionArn'],
+            'EventSourceArn': EventSourceArn,
+            'State': 'Enabled' if kwargs.pop('Enabled', True)
+                     else 'Disabled',
+            'LastModified': self.now}
+        mapping.update(kwargs)
+        self.mappings[mapping['UUID']] = mapping
+        return self._mapping_response(mapping, 202)
+
+    def list_event_source_mappings(self, FunctionName=None,
+                                   EventSourceArn=None, Marker=None):
+        mappings = []
+        for mapping in self.mappings.values():
+            if FunctionName and mapping['FunctionArn'].split(
+                    ':function:')[-1] != FunctionName.split(
+                        ':function:')[-1]:
+                continue
+            if EventSourceArn and mapping['EventSourceArn'] != \
+                    EventSourceArn:
+                continue
+            mappings.append(mapping)
+        return paginate(mappings, Marker, self.backend.page_size,
+                        'NextMarker', 'EventSourceMappings')
+
+    def _mapping(self, UUID, operation_name):
+        if UUID not in self.mappings:
+            raise client_error('ResourceNotFoundException',
+                               'Mapping not found: %s' % UUID,
+                               operation_name, 404)
+        return self.mappings[UUID]
+
+    def get_event_source_mapping(self, UUID):
+        return self._mapping_response(
+            self._mapping(UUID, 'GetEventSourceMapping'))
+
+    def update_event_source_mapping(self, UUID, FunctionName=None,
+                                    **kwargs):
+        mapping = self._mapping(UUID, 'UpdateEventSourceMapping')
+        if 'Enabled' in kwargs:
+            mapping['State'] = 'Enabled' if kwargs.pop('Enabled') \
+                else 'Disabled'
+        mapping.update(kwargs)
+        mapping['LastModified'] = self.now
+        return self._mapping_response(mapping, 202)
+
+    def delete_event_source_mapping(self, UUID):
+        mapping = self._mapping(UUID, 'DeleteEventSourceMapping')
+        del self.mappings[UUID]
+        mapping = dict(mapping, State='Deleting')
+        return self._mapping_response(mapping, 202)
+
+
+class FakeS3(FakeService):
+
+    service_name = 's3'
+    throttle_code = 'SlowDown'
+
+    def __init__(self, backend):
+        super(FakeS3, self).__init__(backend)
+        self.buckets = {}
+
+    def create_bucket(self, Bucket, **kwargs):
+        self.buckets.setdefault(Bucket, {'objects': {}, 'notification': {}})
+        return metadata()
+
+    def _bucket(self, Bucket, operation_name):
+        if Bucket not in self.buckets:
+            raise client_error('NoSuchBucket',
+                               'The specified bucket does not exist',
+                               operation_name, 404)
+        return self.buckets[Bucket]
+
+    def get_object_data(self, Bucket, Key):
+        bucket = self._bucket(Bucket, 'GetObject')
+        if Key not in bucket['objects']:
+            raise client_error('NoSuchKey',
+                               'The specified key does not exist.',
+                               'GetObject', 404)
+        return bucket['objects'][Key]
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        if hasattr(Body, 'read'):
+            Body = Body.read()
+        self._bucket(Bucket, 'PutObject')['objects'][Key] = Body
+        response = metadata()
+        response['ETag'] = '"%s"' % hashlib.md5(Body).hexdigest()
+        return response
+
+    def put_bucket_notification_configuration(self, Bucket,
+                                              NotificationConfiguration):
+        self._bucket(Bucket, 'PutBucketNotificationConfiguration')[
+            'notification'] = NotificationConfiguration
+        return metadata()
+
+    def get_bucket_notification_configuration(self, Bucket):
+        response = metadata()
+        response.update(self._bucket(
+            Bucket, 'GetBucketNotificationConfiguration')['notification'])
+        return response
+
+    def put_bucket_notification(self, Bucket, NotificationConfiguration):
+        self._bucket(Bucket, 'PutBucketNotification')['notification'] = \
+            NotificationConfiguration
+        return metadata()
+
+    def get_bucket_notification(self, Bucket):
+        # The deprecated API only knows about a single CloudFunction.
+        notification = self._bucket(
+            Bucket, 'GetBucketNotification')['notification']
+        response = metadata()
+        configs = notification.get('LambdaFunctionConfigurations', [])
+        if configs:
+            response['CloudFunctionConfiguration'] = {
+                'Id': configs[0]['Id'],
+                'Events': configs[0]['Events'],
+                'CloudFunction': configs[0]['LambdaFunctionArn']}
+        return response
+
+
+class FakeSNS(FakeService):
+
+    service_name = 'sns'
+
+    def __init__(self, backend):
+        super(FakeSNS, self).__init__(backend)
+        self.topics = {}
+
+    def create_topic(self, Name):
+        arn = 'arn:aws:sns:%s:%s:%s' % (self.backend.region, AccountId, Name)
+        self.topics.setdefault(arn, [])
+        response = metadata()
+        response['TopicArn'] = arn
+        return response
+
+    def _topic(self, TopicArn, operation_name):
+        if TopicArn not in self.topics:
+            raise client_error('NotFound', 'Topic does not exist',
+                               operation_name, 404)
+        return self.topics[TopicArn]
+
+    def list_subscriptions_by_topic(self, TopicArn, NextToken=None):
+        return paginate(
+            self._topic(TopicArn, 'ListSubscriptionsByTopic'), NextToken,
+            self.backend.page_size, 'NextToken', 'Subscriptions')
+
+    def subscribe(self, TopicArn, Protocol, Endpoint):
+        subscriptions = self._topic(TopicArn, 'Subscribe')
+        for subscription in subscriptions:
+            if subscription['Endpoint'] == Endpoint and \
+                    subscription['Protocol'] == Protocol:
+                break
+        else:
+            subscription = {
+                'SubscriptionArn': '%s:%s' % (TopicArn, uuid.uuid4()),
+                'Owner': AccountId,
+                'Protocol': Protocol,
+                'Endpoint': Endpoint,
+                'TopicArn': TopicArn}
+            subscriptions.append(subscription)
+        response = metadata()
+        response['SubscriptionArn'] = subscription['SubscriptionArn']
+        return response
+
+    def unsubscribe(self, SubscriptionArn):
+        for subscriptions in self.topics.values():
+            for subscription in list(subscriptions):
+                if subscription['SubscriptionArn'] == SubscriptionArn:
+                    subscriptions.remove(subscription)
+        return metadata()
+
+
+class FakeLogs(FakeService):
+
+    service_name = 'logs'
+    throttle_code = 'ThrottlingException'
+
+    def __init__(self, backend):
+        super(FakeLogs, self).__init__(backend)
+        self.groups = {}
+
+    def put_events(self, log_group_name, log_stream_name, events):
+        """
+        Seed ``events`` (dicts with ``timestamp`` and ``message``) into a
+        stream, creating the group and stream as needed.
+        """
+        group = self.groups.setdefault(log_group_name, {
+            'logGroupName': log_group_name,
+            'creationTime': int(self.now * 1000),
+            '_streams': {}})
+        stream = group['_streams'].setdefault(log_stream_name, {
+            'logStreamName': log_stream_name,
+            'creationTime': int(self.now * 1000),
+            '_events': []})
+        for event in events:
+            event = dict(event)
+            event.setdefault('ingestionTime', event['timestamp'])
+            stream['_events'].append(event)
+        stream['_events'].sort(key=lambda e: e['timestamp'])
+        stream['firstEventTimestamp'] = stream['_events'][0]['timestamp']
+        stream['lastEventTimestamp'] = stream['_events'][-1]['timestamp']
+
+    def _public(self, item):
+        return dict((k, v) for k, v in item.items() if not k.startswith('_'))
+
+    def _group(self, logGroupName, operation_name):
+        if logGroupName not in self.groups:
+            raise client_error(
+                'ResourceNotFoundException',
+                'The specified log group does not exist.',
+                operation_name)
+        return self.groups[logGroupName]
+
+    def describe_log_groups(self, logGroupNamePrefix='', nextToken=None,
+                            limit=None):
+        groups = [self._public(g) for name, g in sorted(self.groups.items())
+                  if name.startswith(logGroupNamePrefix)]
+        return paginate(groups, nextToken, limit or self.backend.page_size,
+                        'nextToken', 'logGroups')
+
+    def describe_log_streams(self, logGroupName, logStreamNamePrefix='',
+                             orderBy='LogStreamName', descending=False,
+                             nextToken=None, limit=None):
+        group = self._group(logGroupName, 'DescribeLogStreams')
+        streams = [self._public(s) for name, s in
+                   sorted(group['_streams'].items())
+                   if name.startswith(logStreamNamePrefix)]
+        if orderBy == 'LastEventTime':
+            streams.sort(key=lambda s: s.get('lastEventTimestamp', 0))
+        if descending:
+            streams.reverse()
+        return paginate(streams, nextToken, limit or self.backend.page_size,
+                        'nextToken', 'logStreams')
+
+    def get_log_events(self, logGroupName, logStreamName, startTime=None,
+                       endTime=None, nextToken=None, limit=None,
+                       startFromHead=False):
+        group = self._group(logGroupName, 'GetLogEvents')
+        if logStreamName not in group['_streams']:
+            raise client_error('ResourceNotFoundException',
+                               'The specified log stream does not exist.',
+                               'GetLogEvents')
+        events = [e for e in group['_streams'][logStreamName]['_events']
+                  if (startTime is None or e['timestamp'] >= startTime) and
+                  (endTime is None or e['timestamp'] < endTime)]
+        limit = limit or self.backend.page_size
+        if nextToken:
+            start = int(nextToken.split('/')[1])
+        elif startFromHead:
+            start = 0
+        else:
+            start = max(len(events) - limit, 0)
+        end = min(start + limit, len(events))
+        response = metadata()
+        response['events'] = events[start:end]
+        response['nextForwardToken'] = 'f/%d' % end
+        response['nextBackwardToken'] = 'b/%d' % max(start - limit, 0)
+        return response
+
+    def filter_log_events(self, logGroupName, startTime=None, endTime=None,
+                          nextToken=None, limit=None, **kwargs):
+        group = self._group(logGroupName, 'FilterLogEvents')
+        events = []
+        for name, stream in sorted(group['_streams'].items()):
+            for event in stream['_events']:
+                if (startTime is None or event['timestamp'] >= startTime) \
+                        and (endTime is None or event['timestamp'] < endTime):
+                    event = dict(event)
+                    event['logStreamName'] = name
+                    events.append(event)
+        events.sort(key=lambda e: e['timestamp'])
+        return paginate(events, nextToken, limit or self.backend.page_size,
+                        'nextToken', 'events')
+
+    def delete_log_group(self, logGroupName):
+        self._group(logGroupName, 'DeleteLogGroup')
+        del self.groups[logGroupName]
+        return metadata()
+
+
+class FakeCloudWatch(FakeService):
+
+    service_name = 'cloudwatch'
+    throttle_code = 'Throttling'
+
+    def __init__(self, backend):
+        super(FakeCloudWatch, self).__init__(backend)
+        self.datapoints = {}
+
+    def _key(self, namespace, metric_name, dimensions, stat):
+        return (namespace, metric_name,
+                tuple(sorted(dimensions.items())), stat)
+
+    def put_datapoints(self, metric_name, dimensions, stat, points,
+                       namespace='AWS/Lambda'):
+        """
+        Seed ``points``, a list of (datetime, value), for one statistic
+        of a metric.
+        """
+        self.datapoints.setdefault(
+            self._key(namespace, metric_name, dimensions, stat),
+            []).extend(points)
+
+    def get_metric_data(self, MetricDataQueries, StartTime, EndTime,
+                        NextToken=None, ScanBy='TimestampDescending'):
+        results = []
+        for query in MetricDataQueries:
+            metric_stat = query['MetricStat']
+            metric = metric_stat['Metric']
+            dimensions = dict((d['Name'], d['Value'])
+                              for d in metric['Dimensions'])
+            points = sorted(
+                (t, v) for t, v in self.datapoints.get(self._key(
+                    metric['Namespace'], metric['MetricName'], dimensions,
+                    metric_stat['Stat']), [])
+                if StartTime <= t < EndTime)
+            if ScanBy == 'TimestampDescending':
+                points.reverse()
+            results.append({'Id': query['Id'],
+                            'Label': metric['MetricName'],
+                            'Timestamps': [t for t, _ in points],
+                            'Values': [v for _, v in points],
+                            'StatusCode': 'Complete'})
+        response = metadata()
+        response['MetricDataResults'] = results
+        return response
+
+
+class FakeClient(object):
+    """
+    Wraps a fake service so every call is counted and may be throttled.
+    """
+
+    def __init__(self, backend, service):
+        self._backend = backend
+        self._service = service
+        self.meta = mock.Mock()
+        self.meta.region_name = backend.region
+        self.meta.service_model.service_name = service.service_name
+        self.meta.events = HierarchicalEmitter()
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        method = getattr(self._service, name)
+
+        def call(*args, **kwargs):
+            self._backend.record(self._service.service_name, name)
+            if self._backend.should_throttle():
+                raise client_error(self._service.throttle_code,
+                                   'Rate exceeded', name, 429)
+            return method(*args, **kwargs)
+
+        return call
+
+
+class FakeAWS(object):
+
+    def __init__(self, backend):
+        self._backend = backend
+
+    def create_client(self, client_name):
+        return FakeClient(self._backend, self._backend.services[client_name])
+
+
+class FakeBackend(object):
+
+    def __init__(self, region='us-east-1', page_size=50,
+                 consistency_delay=0, throttle_rate=0.0, seed=0,
+                 clock=None):
+        self.region = region
+        self.page_size = page_size
+        self.consistency_delay = consistency_delay
+        self.throttle_rate = throttle_rate
+        self.clock = clock or FakeClock()
+        self.calls = []
+        self._random = random.Random(seed)
+        self.iam = FakeIAM(self)
+        self.awslambda = FakeLambda(self)
+        self.s3 = FakeS3(self)
+        self.sns = FakeSNS(self)
+        self.logs = FakeLogs(self)
+        self.cloudwatch = FakeCloudWatch(self)
+        self.services = dict(
+            (s.service_name, s) for s in
+            [self.iam, self.awslambda, self.s3, self.sns, self.logs,
+             self.cloudwatch])
+
+    def record(self, service_name, operation_name):
+        self.calls.append((service_name, operation_name))
+
+    def should_throttle(self):
+        return (self.throttle_rate > 0 and
+                self._random.random() < self.throttle_rate)
+
+    def call_counts(self):
+        counts = {}
+        for service_name, operation_name in self.calls:
+            key = '%s.%s' % (service_name, operation_name)
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def get_aws(self, context):
+        return FakeAWS(self)
+
+    def patch(self):
+        """
+        Return a context manager that routes ``kappa.aws.get_aws`` to this
+        backend and makes ``time.sleep`` advance the virtual clock instead
+        of blocking.
+        """
+        return _Patch([
+            mock.patch('kappa.aws.get_aws', self.get_aws),
+            mock.patch.object(time, 'sleep', self.clock.sleep)])
+
+
+class FakeRegions(object):
+    """
+    One ``FakeBackend`` per region for multi-region deploys.  IAM is a
+    global service so all regions share the first region's IAM state,
+    and they share one virtual clock.
+    """
+
+    def __init__(self, regions, **kwargs):
+        self.clock = kwargs.pop('clock', None) or FakeClock()
+        self.backends = {}
+        self.default_region = regions[0]
+        iam = None
+        for region in regions:
+            backend = FakeBackend(region=region, clock=self.clock, **kwargs)
+            if iam is None:
+                iam = backend.iam
+            backend.iam = backend.services['iam'] = iam
+            self.backends[region] = backend
+
+    def get_aws(self, context):
+        region = context.region or self.default_region
+        return self.backends[region].get_aws(context)
+
+    def patch(self):
+        return _Patch([
+            mock.patch('kappa.aws.get_aws', self.get_aws),
+            mock.patch.object(time, 'sleep', self.clock.sleep)])
+
+
+class _Patch(object):
+
+    def __init__(self, patches):
+        self._patches = patches
+
+    def __enter__(self):
+        for patch in self._patches:
+            patch.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        for patch in reversed(self._patches):
+            patch.stop()
@@ -69,3 +69,25 @@ logs_describe_log_groups = [{'ResponseMetadata': {'HTTPStatusCode': 200,
 logs_describe_log_streams = [{u'logStreams': [{u'firstEventTimestamp': 1417042749449, u'lastEventTimestamp': 1417042749547, u'creationTime': 1417042748263, u'uploadSequenceToken': u'49540114640150833041490484409222729829873988799393975922', u'logStreamName': u'1cc48e4e613246b7974094323259d600', u'lastIngestionTime': 1417042750483, u'arn': u'arn:aws:logs:us-east-1:0123456789012:log-group:/aws/lambda/KinesisSample:log-stream:1cc48e4e613246b7974094323259d600', u'storedBytes': 712}, {u'firstEventTimestamp': 1417272406988, u'lastEventTimestamp': 1417272407088, u'creationTime': 1417272405690, u'uploadSequenceToken': u'49540113907504451034164105858363493278561872472363261986', u'logStreamName': u'2782a5ff88824c85a9639480d1ed7bbe', u'lastIngestionTime': 1417272408043, u'arn': u'arn:aws:logs:us-east-1:0123456789012:log-group:/aws/lambda/KinesisSample:log-stream:2782a5ff88824c85a9639480d1ed7bbe', u'storedBytes': 712}, {u'firstEventTimestamp': 1420569035842, u'lastEventTimestamp': 1420569035941, u'creationTime': 1420569034614, u'uploadSequenceToken': u'49540113907883563702539166025438885323514410026454245426', u'logStreamName': u'2d62991a479b4ebf9486176122b72a55', u'lastIngestionTime': 1420569036909, u'arn': u'arn:aws:logs:us-east-1:0123456789012:log-group:/aws/lambda/KinesisSample:log-stream:2d62991a479b4ebf9486176122b72a55', u'storedBytes': 709}, {u'firstEventTimestamp': 1418244027421, u'lastEventTimestamp': 1418244027541, u'creationTime': 1418244026907, u'uploadSequenceToken': u'49540113964795065449189116778452984186276757901477438642', u'logStreamName': u'4f44ffa128d6405591ca83b2b0f9dd2d', u'lastIngestionTime': 1418244028484, u'arn': u'arn:aws:logs:us-east-1:0123456789012:log-group:/aws/lambda/KinesisSample:log-stream:4f44ffa128d6405591ca83b2b0f9dd2d', u'storedBytes': 1010}, {u'firstEventTimestamp': 1418242565524, u'lastEventTimestamp': 1418242565641, u'creationTime': 1418242564196, u'uploadSequenceToken': u'49540113095132904942090446312687285178819573422397343074', u'logStreamName': u'69c5ac87e7e6415985116e8cb44e538e', u'lastIngestionTime': 1418242566558, u'arn': u'arn:aws:logs:us-east-1:0123456789012:log-group:/aws/lambda/KinesisSample:log-stream:69c5ac87e7e6415985116e8cb44e538e', u'storedBytes': 713}, {u'firstEventTimestamp': 1417213193378, u'lastEventTimestamp': 1417213193478, u'creationTime': 1417213192095, u'uploadSequenceToken': u'49540113336360065754596187770479764234792559857643841394', u'logStreamName': u'f68e3d87b8a14cdba338f6926f7cf50a', u'lastIngestionTime': 1417213194421, u'arn': u'arn:aws:logs:us-east-1:0123456789012:log-group:/aws/lambda/KinesisSample:log-stream:f68e3d87b8a14cdba338f6926f7cf50a', u'storedBytes': 711}], 'ResponseMetadata': {'HTTPStatusCode': 200, 'RequestId': '2a6d4941-969b-11e4-947f-19d1c72ede7e'}}]
 
 logs_get_log_events = [{'ResponseMetadata': {'HTTPStatusCode': 200, 'RequestId': '2a7deb71-969b-11e4-914b-8f1f3d7b023d'}, u'nextForwardToken': u'f/31679748107442531967654742688057700554200447759088287749', u'events': [{u'ingestionTime': 1420569036909, u'timestamp': 1420569035842, u'message': u'2015-01-06T18:30:35.841Z\tko2sss03iq7l2pdk\tLoading event\n'}, {u'ingestionTime': 1420569036909, u'timestamp': 1420569035899, u'message': u'START RequestId: 23007242-95d2-11e4-a10e-7b2ab60a7770\n'}, {u'ingestionTime': 1420569036909, u'timestamp': 1420569035940, u'message': u'2015-01-06T18:30:35.940Z\t23007242-95d2-11e4-a10e-7b2ab60a7770\t{\n  "Records": [\n    {\n      "kinesis": {\n        "partitionKey": "partitionKey-3",\n        "kinesisSchemaVersion": "1.0",\n        "data": "SGVsbG8sIHRoaXMgaXMgYSB0ZXN0IDEyMy4=",\n        "sequenceNumber": "49545115243490985018280067714973144582180062593244200961"\n      },\n      "eventSource": "aws:kinesis",\n      "eventID": "shardId-000000000000:49545115243490985018280067714973144582180062593244200961",\n      "invokeIdentityArn": "arn:aws:iam::0123456789012:role/testLEBRole",\n      "eventVersion": "1.0",\n      "eventName": "aws:kinesis:record",\n      "eventSourceARN": "arn:aws:kinesis:us-east-1:35667example:stream/examplestream",\n      "awsRegion": "us-east-1"\n    }\n  ]\n}\n'}, {u'ingestionTime': 1420569036909, u'timestamp': 1420569035940, u'message': u'2015-01-06T18:30:35.940Z\t23007242-95d2-11e4-a10e-7b2ab60a7770\tDecoded payload: Hello, this is a test 123.\n'}, {u'ingestionTime': 1420569036909, u'timestamp': 1420569035941, u'message': u'END RequestId: 23007242-95d2-11e4-a10e-7b2ab60a7770\n'}, {u'ingestionTime': 1420569036909, u'timestamp': 1420569035941, u'message': u'REPORT RequestId: 23007242-95d2-11e4-a10e-7b2ab60a7770\tDuration: 98.51 ms\tBilled Duration: 100 ms \tMemory Size: 128 MB\tMax Memory Used: 26 MB\t\n'}], u'nextBackwardToken': u'b/31679748105234758193000210997045664445208259969996226560'}]
+
+sns_list_subscriptions_by_topic = [{'ResponseMetadata': {'HTTPStatusCode': 200, 'RequestId': '3f1a7c6e-1d2b-5b8e-9a3c-0e7d2f6b4a11'}, u'NextToken': u'AAGy3uWk1vbKhQq1o4xtR7pMmYpaQ3i', u'Subscriptions': [{u'Owner': u'123456789012', u'Endpoint': u'arn:aws:lambda:us-east-1:123456789012:function:OtherFunction', u'Protocol': u'lambda', u'TopicArn': u'arn:aws:sns:us-east-1:123456789012:lambda_topic', u'SubscriptionArn': u'arn:aws:sns:us-east-1:123456789012:lambda_topic:6d0c3b0e-6f0a-4a8e-a4f5-2f1c1c0b7a10'}]}, {'ResponseMetadata': {'HTTPStatusCode': 200, 'RequestId': '6a0e2d33-5e0b-5c8d-8e5f-8a7c4b4e2c02'}, u'Subscriptions': [{u'Owner': u'123456789012', u'Endpoint': u'arn:aws:lambda:us-east-1:123456789012:function:FooBarFunction', u'Protocol': u'lambda', u'TopicArn': u'arn:aws:sns:us-east-1:123456789012:lambda_topic', u'SubscriptionArn': u'arn:aws:sns:us-east-1:123456789012:lambda_topic:0b8a3c55-7f1e-4d64-9bd0-6f3f9c3a2e77'}]}]
+
+sns_subscribe = [{'ResponseMetadata': {'HTTPStatusCode': 200, 'RequestId': '9c1f2e0d-2f54-5d8a-b1a5-1f0d6a3b9e41'}, u'SubscriptionArn': u'arn:aws:sns:us-east-1:123456789012:lambda_topic:4e2f0a91-3c5d-4b7e-8f60-9d1e2c3b4a5f'}]
+
+sns_unsubscribe = [{'ResponseMetadata': {'HTTPStatusCode': 200, 'RequestId': 'b7e3c1a2-0d4f-5e6a-9b8c-7a6d5e4f3c2b'}}]
+
+lambda_get_function_configuration = [{'ResponseMetadata': {'HTTPStatusCode': 200, 'RequestId': 'e2b7c5f1-4a3d-4c9e-8f21-6d0a9b8c7e10'}, u'FunctionName': u'FooBarFunction', u'FunctionArn': u'arn:aws:lambda:us-east-1:123456789012:function:FooBarFunction', u'State': u'Active', u'LastUpdateStatus': u'Successful', u'MemorySize': 128, u'Timeout': 3}]
+
+lambda_put_function_concurrency = [{'ResponseMetadata': {'HTTPStatusCode': 200, 'RequestId': '0c5e8f2a-7b1d-4e3f-9a6c-2d4b8e1f0a33'}, u'ReservedConcurrentExecutions': 50}]
+
+lambda_publish_version = [{'ResponseMetadata': {'HTTPStatusCode': 201, 'RequestId': '5a9d3e7b-2c4f-4b8a-a1e6-7f0c9d2b3e44'}, u'FunctionName': u'FooBarFunction', u'FunctionArn': u'arn:aws:lambda:us-east-1:123456789012:function:FooBarFunction:2', u'Version': u'2'}]
+
+lambda_get_alias = [{'ResponseMetadata': {'HTTPStatusCode': 200, 'RequestId': '8b2f6c1e-3d5a-4e7b-9c0f-1a2b3c4d5e55'}, u'AliasArn': u'arn:aws:lambda:us-east-1:123456789012:function:FooBarFunction:live', u'Name': u'live', u'FunctionVersion': u'1'}]
+
+lambda_update_alias = [{'ResponseMetadata': {'HTTPStatusCode': 200, 'RequestId': '1d4e7a2b-6c8f-4a3e-b5d9-0e1f2a3b4c66'}, u'AliasArn': u'arn:aws:lambda:us-east-1:123456789012:function:FooBarFunction:live', u'Name': u'live', u'FunctionVersion': u'2'}]
+
+lambda_put_provisioned_concurrency_config = [{'ResponseMetadata': {'HTTPStatusCode': 202, 'RequestId': '9e3a5c7b-1f2d-4b6e-8a0c-3d5e7f9a1b77'}, u'RequestedProvisionedConcurrentExecutions': 10, u'Status': u'IN_PROGRESS'}]
+
+lambda_get_provisioned_concurrency_config = [{'ResponseMetadata': {'HTTPStatusCode': 200, 'RequestId': '4f6b8d0e-2a3c-4e5f-9b1d-6c8e0a2b4d88'}, u'RequestedProvisionedConcurrentExecutions': 10, u'AvailableProvisionedConcurrentExecutions': 4, u'Status': u'IN_PROGRESS'}, {'ResponseMetadata': {'HTTPStatusCode': 200, 'RequestId': '7a9c1e3f-5b6d-4f8a-a2c4-9e1f3b5d7f99'}, u'RequestedProvisionedConcurrentExecutions': 10, u'AvailableProvisionedConcurrentExecutions': 10, u'Status': u'READY'}]
+
+lambda_delete_provisioned_concurrency_config = [{'ResponseMetadata': {'HTTPStatusCode': 204, 'RequestId': '2c4e6a8b-0d1f-4a3c-b5e7-8f0a2c4e6b00'}}]
@@ -0,0 +1,61 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import unittest
+
+import mock
+
+import kappa.aws
+import kappa.executor
+
+
+class TestClientPool(unittest.TestCase):
+
+    def setUp(self):
+        self.session_patch = mock.patch('boto3.session.Session')
+        self.session_class = self.session_patch.start()
+        self.session_class.side_effect = lambda **kw: mock.Mock(
+            client=mock.Mock(side_effect=lambda *a, **kw: mock.Mock()))
+
+    def tearDown(self):
+        self.session_patch.stop()
+
+    def test_clients_keyed_by_profile_region_service(self):
+        pool = kappa.aws.ClientPool(max_pool_connections=32)
+        east = pool.get_client('lambda', 'dev', 'us-east-1')
+        self.assertIs(pool.get_client('lambda', 'dev', 'us-east-1'), east)
+        self.assertIsNot(pool.get_client('lambda', 'dev', 'eu-west-1'), east)
+        self.assertIsNot(pool.get_client('lambda', 'prod', 'us-east-1'), east)
+        self.assertIsNot(pool.get_client('iam', 'dev', 'us-east-1'), east)
+        # One session per profile, shared by every region.
+        self.assertEqual(self.session_class.call_count, 2)
+        config = pool._sessions['dev'].client.call_args[1]['config']
+        self.assertEqual(config.max_pool_connections, 32)
+
+    def test_concurrent_get_client(self):
+        pool = kappa.aws.ClientPool()
+        clients = kappa.executor.map(
+            lambda _: pool.get_client('s3', None, 'us-west-2'), range(20),
+            max_workers=8)
+        self.assertTrue(all(c is clients[0] for c in clients))
+        self.assertEqual(pool._sessions[None].client.call_count, 1)
+
+    def test_get_aws_uses_context(self):
+        context = mock.Mock(profile='dev', region='ap-south-1')
+        pool = kappa.aws.configure()
+        try:
+            client = kappa.aws.get_aws(context).create_client('sns')
+            self.assertIs(pool.get_client('sns', 'dev', 'ap-south-1'),
+                          client)
+        finally:
+            kappa.aws.configure()
@@ -0,0 +1,110 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import unittest
+
+import mock
+
+from kappa.canary import Canary
+from tests.unit.fake_aws import FakeClock
+
+
+def metric_response(series):
+    # series maps (name, version) -> list of values
+    def get_metric_data(MetricDataQueries, **kwargs):
+        results = []
+        for query in MetricDataQueries:
+            _, name, version = query['Id'].split('_', 2)
+            values = series.get((name, version), [])
+            results.append({'Id': query['Id'], 'Values': values,
+                            'Timestamps': list(range(len(values)))})
+        return {'MetricDataResults': results}
+    return get_metric_data
+
+
+class TestCanary(unittest.TestCase):
+
+    def setUp(self):
+        self.function = mock.Mock()
+        self.function.name = 'foo'
+        self.function.alias = 'live'
+        self.cloudwatch = mock.Mock()
+        get_aws = mock.Mock()
+        get_aws.return_value.create_client.return_value = self.cloudwatch
+        self.aws_patch = mock.patch('kappa.aws.get_aws', get_aws)
+        self.aws_patch.start()
+        clock = FakeClock()
+        self.time_patch = mock.patch('time.time', clock.time)
+        self.sleep_patch = mock.patch('time.sleep', clock.sleep)
+        self.time_patch.start()
+        self.sleep_patch.start()
+
+    def tearDown(self):
+        self.sleep_patch.stop()
+        self.time_patch.stop()
+        self.aws_patch.stop()
+
+    def run_canary(self, series, **kwargs):
+        self.cloudwatch.get_metric_data.side_effect = metric_response(series)
+        canary = Canary(self.function, weight=10, window=300, interval=60,
+                        **kwargs)
+        return canary.run('1', '2')
+
+    def test_promote(self):
+        result = self.run_canary({
+            ('invocations', '1'): [500], ('errors', '1'): [5],
+            ('p99', '1'): [100.0, 120.0],
+            ('invocations', '2'): [50], ('errors', '2'): [0],
+            ('p99', '2'): [110.0]})
+        self.assertEqual(result['decision'], 'promoted')
+        calls = self.function.update_alias.call_args_list
+        self.assertEqual(calls[0], mock.call(
+            '1', current=True, weights={'2': 0.1}))
+        self.assertEqual(calls[-1], mock.call('2', current=True, weights={}))
+        # One GetMetricData call per interval for all six series.
+        self.assertEqual(self.cloudwatch.get_metric_data.call_count, 5)
+
+    def test_latency_regression_rolls_back_early(self):
+        result = self.run_canary({
+            ('invocations', '1'): [500], ('p99', '1'): [100.0],
+            ('invocations', '2'): [50], ('p99', '2'): [200.0]})
+        self.assertEqual(result['decision'], 'rolled_back')
+        self.assertIn('p99', result['reason'])
+        self.assertEqual(self.function.update_alias.call_args_list[-1],
+                         mock.call('1', current=True, weights={}))
+        self.assertEqual(self.cloudwatch.get_metric_data.call_count, 1)
+
+    def test_errors_roll_back(self):
+        result = self.run_canary({
+            ('invocations', '1'): [1000], ('errors', '1'): [1],
+            ('invocations', '2'): [100], ('errors', '2'): [10]})
+        self.assertEqual(result['decision'], 'rolled_back')
+        self.assertIn('error rate', result['reason'])
+
+    def test_no_data(self):
+        series = {('invocations', '1'): [1000], ('invocations', '2'): [3]}
+        self.assertEqual(self.run_canary(series)['decision'], 'rolled_back')
+        self.assertEqual(self.run_canary(
+            series, on_no_data='promote')['decision'], 'promoted')
+
+    def test_failure_resets_alias(self):
+        self.cloudwatch.get_metric_data.side_effect = RuntimeError('boom')
+        canary = Canary(self.function, weight=10, window=300, interval=60)
+        self.assertRaises(RuntimeError, canary.run, '1', '2')
+        self.assertEqual(self.function.update_alias.call_args_list[-1],
+                         mock.call('1', current=True, weights={}))
+
+    def test_invalid_settings(self):
+        self.assertRaises(ValueError, Canary, self.function, weight=100)
+        self.assertRaises(ValueError, Canary, self.function, weight=0)
+        self.assertRaises(ValueError, Canary, self.function, interval=90)
@@ -0,0 +1,125 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+import yaml
+from click.testing import CliRunner
+
+from kappa.context import Context
+from tests.unit.fake_aws import FakeBackend
+from tests.unit.test_context import make_config
+
+CliPath = os.path.join(os.path.dirname(__file__), '..', '..', 'bin', 'kappa')
+
+
+def load_cli():
+    # bin/kappa has no .py suffix, so it is loaded by path.
+    try:
+        import importlib.util
+        from importlib.machinery import SourceFileLoader
+    except ImportError:
+        import imp
+        return imp.load_source('kappa_cli', CliPath)
+    loader = SourceFileLoader('kappa_cli', CliPath)
+    module = importlib.util.module_from_spec(
+        importlib.util.spec_from_loader('kappa_cli', loader))
+    loader.exec_module(module)
+    return module
+
+
+class TestCli(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.path = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.path, 'src'))
+        with open(os.path.join(self.path, 'src', 'foo.py'), 'w') as fp:
+            fp.write('def handler(event, context):\n    return event\n')
+        self.env_patch = mock.patch.dict(os.environ, {
+            'KAPPA_CACHE_DIR': os.path.join(self.path, 'cache'),
+            'AWS_DEFAULT_REGION': 'us-east-1'})
+        self.env_patch.start()
+        self.cli = load_cli().cli
+
+    def tearDown(self):
+        # The CLI changes to the directory of the config file.
+        os.chdir(self.cwd)
+        self.env_patch.stop()
+        shutil.rmtree(self.path)
+
+    def write_config(self, config):
+        path = os.path.join(self.path, 'kappa.yaml')
+        with open(path, 'w') as fp:
+            yaml.safe_dump(config, fp)
+        return path
+
+    def test_status(self):
+        stream_arn = 'arn:aws:kinesis:us-east-1:123456789012:stream/foo'
+        config = make_config(self.path)
+        config['lambda']['event_sources'] = [{'arn': stream_arn}]
+        backend = FakeBackend()
+        backend.cloudwatch.put_datapoints(
+            'IteratorAge', {'FunctionName': 'FooFunction'}, 'Maximum',
+            [(datetime.datetime.utcnow() - datetime.timedelta(minutes=2),
+              1500.0)])
+        with backend.patch():
+            context = Context('foo', config)
+            context.deploy()
+            context.add_event_sources()
+            result = CliRunner().invoke(
+                self.cli, ['--config', self.write_config(config), 'status'],
+                obj={})
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('FooPolicy (arn:aws:iam::', result.output)
+        self.assertIn('FooFunction (arn:aws:lambda:', result.output)
+        self.assertIn('%s: Enabled (iterator age 1500 ms)' % stream_arn,
+                      result.output)
+
+    def write_test_data(self, config):
+        test_data = os.path.join(self.path, 'input.json')
+        with open(test_data, 'w') as fp:
+            fp.write('{"foo": "bar"}')
+        config['lambda']['test_data'] = test_data
+        return self.write_config(config)
+
+    def test_invoke_emulate_test_data(self):
+        config = make_config(self.path)
+        del config['lambda']['event_sources']
+        path = self.write_test_data(config)
+        with FakeBackend().patch():
+            result = CliRunner().invoke(
+                self.cli, ['--config', path, 'invoke', '--emulate'], obj={})
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('{"foo": "bar"}', result.output)
+
+    def test_invoke_repeat_sends_test_data(self):
+        config = make_config(self.path)
+        del config['lambda']['event_sources']
+        path = self.write_test_data(config)
+        backend = FakeBackend()
+        with backend.patch():
+            Context('foo', config).deploy()
+            with mock.patch.object(backend.awslambda, 'invoke',
+                                   wraps=backend.awslambda.invoke) as invoke:
+                result = CliRunner().invoke(
+                    self.cli, ['--config', path, 'invoke', '--repeat', '3'],
+                    obj={})
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual([c[1]['Payload'] for c in invoke.call_args_list],
+                         ['{"foo": "bar"}'] * 3)
@@ -0,0 +1,136 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+import kappa.config
+from kappa.config import ConfigError
+
+
+Common = """
+region: us-east-1
+lambda:
+  handler: foo.handler
+  memory_size: 128
+  permissions:
+    - statement_id: sns_invoke
+      action: lambda:InvokeFunction
+      principal: sns.amazonaws.com
+"""
+
+Project = """
+include: common.yaml
+lambda:
+  timeout: 10
+environments:
+  prod:
+    region: eu-west-1
+    lambda:
+      memory_size: 1024
+"""
+
+
+class TestConfig(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.env_patch = mock.patch.dict(
+            os.environ, {'KAPPA_CACHE_DIR': os.path.join(self.path, 'cache')})
+        self.env_patch.start()
+        os.environ.pop('KAPPA_ENV', None)
+        self.write('common.yaml', Common)
+        self.config_path = self.write('kappa.yaml', Project)
+
+    def tearDown(self):
+        self.env_patch.stop()
+        shutil.rmtree(self.path)
+
+    def write(self, name, data):
+        path = os.path.join(self.path, name)
+        with open(path, 'w') as fp:
+            fp.write(data)
+        return path
+
+    def test_find_config(self):
+        subdir = os.path.join(self.path, 'src', 'pkg')
+        os.makedirs(subdir)
+        self.assertEqual(kappa.config.find_config(start=subdir),
+                         self.config_path)
+        self.assertIsNone(kappa.config.find_config('other.yaml',
+                                                   start=subdir))
+
+    def test_include_and_environment(self):
+        config = kappa.config.load(self.config_path)
+        self.assertEqual(config['region'], 'us-east-1')
+        self.assertEqual(config['lambda']['memory_size'], 128)
+        self.assertEqual(config['lambda']['timeout'], 10)
+        self.assertNotIn('environments', config)
+        config = kappa.config.load(self.config_path, env='prod')
+        self.assertEqual(config['region'], 'eu-west-1')
+        self.assertEqual(config['lambda']['memory_size'], 1024)
+        self.assertEqual(config['lambda']['handler'], 'foo.handler')
+        self.assertRaises(ConfigError, kappa.config.load, self.config_path,
+                          env='staging')
+
+    def test_cache(self):
+        kappa.config.load(self.config_path)
+        with mock.patch('yaml.load') as yaml_load:
+            config = kappa.config.load(self.config_path)
+            self.assertFalse(yaml_load.called)
+        self.assertEqual(config['lambda']['timeout'], 10)
+        # Touching an included file invalidates the cached copy.
+        self.write('common.yaml', Common.replace('128', '256'))
+        stat = os.stat(self.config_path)
+        os.utime(os.path.join(self.path, 'common.yaml'),
+                 (stat.st_atime, stat.st_mtime + 10))
+        config = kappa.config.load(self.config_path)
+        self.assertEqual(config['lambda']['memory_size'], 256)
+
+    def test_validation(self):
+        path = self.write('bad.yaml', """
+lambda:
+  handler: nodot
+  memory_size: 64
+  event_sources:
+    - arn: arn:aws:ec2:us-east-1:123456789012:instance/i-1
+    - batch_size: 10
+      parallelization_factor: 20
+  permissions:
+    - statement_id: foo
+""")
+        try:
+            kappa.config.load(path)
+        except ConfigError as e:
+            errors = e.errors
+        else:
+            self.fail('ConfigError not raised')
+        self.assertEqual(len(errors), 7)
+        self.assertIn("lambda.handler: expected module.function, got 'nodot'",
+                      errors)
+        self.assertIn("lambda.event_sources[0]: unsupported event source "
+                      "type 'ec2'", errors)
+        self.assertIn("lambda.event_sources[1]: missing required key 'arn'",
+                      errors)
+        self.assertIn("lambda.event_sources[1].parallelization_factor: must "
+                      "be between 1 and 10", errors)
+        self.assertIn("lambda.permissions[0]: missing required key "
+                      "'principal'", errors)
+
+    def test_missing_handler(self):
+        path = self.write('bad.yaml', 'lambda:\n  name: foo\n')
+        self.assertRaises(ConfigError, kappa.config.load, path)
@@ -0,0 +1,288 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from kappa.context import Context
+from kappa.event_source import SNSEventSource
+from tests.unit.fake_aws import FakeBackend, FakeRegions
+
+
+def make_config(path):
+    return {
+        'iam': {
+            'policy': {
+                'name': 'FooPolicy',
+                'document': '{"Version": "2012-10-17", "Statement": []}'},
+            'role': {'name': 'FooRole'}},
+        'lambda': {
+            'name': 'FooFunction',
+            'handler': 'foo.handler',
+            'runtime': 'python2.7',
+            'path': os.path.join(path, 'src'),
+            'zipfile_name': os.path.join(path, 'FooFunction.zip'),
+            'permissions': [{
+                'statement_id': 'sns_invoke',
+                'action': 'lambda:InvokeFunction',
+                'principal': 'sns.amazonaws.com',
+                'source_arn': 'arn:aws:sns:us-east-1:123456789012:foo'}],
+            'event_sources': [
+                {'arn': 'arn:aws:sns:us-east-1:123456789012:foo'}]}}
+
+
+class TestContext(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.path, 'src'))
+        with open(os.path.join(self.path, 'src', 'foo.py'), 'w') as fp:
+            fp.write('def handler(event, context):\n    return event\n')
+        SNSEventSource.clear_subscription_index()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        SNSEventSource.clear_subscription_index()
+
+    def test_deploy_status_delete(self):
+        backend = FakeBackend(page_size=2)
+        backend.sns.create_topic('foo')
+        with backend.patch():
+            context = Context('foo', make_config(self.path))
+            context.deploy()
+            context.add_event_sources()
+            self.assertIn('FooFunction', backend.awslambda.functions)
+            function = backend.awslambda.functions['FooFunction']
+            self.assertEqual(function['_policy'][0]['Sid'], 'sns_invoke')
+            status = context.status()
+            self.assertEqual(
+                status['function']['Configuration']['FunctionName'],
+                'FooFunction')
+            self.assertEqual(status['role']['Role']['RoleName'], 'FooRole')
+            self.assertTrue(status['event_sources'][0])
+            context.delete()
+        self.assertEqual(backend.awslambda.functions, {})
+        self.assertEqual(backend.iam.roles, {})
+        self.assertEqual(backend.iam.policies, {})
+        self.assertEqual(
+            backend.sns.topics['arn:aws:sns:us-east-1:123456789012:foo'], [])
+
+    def test_redeploy_updates(self):
+        backend = FakeBackend()
+        backend.sns.create_topic('foo')
+        with backend.patch():
+            Context('foo', make_config(self.path)).deploy()
+            backend.calls = []
+            Context('foo', make_config(self.path)).deploy()
+        counts = backend.call_counts()
+        self.assertEqual(counts.get('lambda.create_function', 0), 0)
+        self.assertEqual(counts['lambda.update_function_code'], 1)
+
+    def test_throttling(self):
+        backend = FakeBackend(throttle_rate=1.0)
+        with backend.patch():
+            context = Context('foo', make_config(self.path))
+            self.assertIsNone(context.function.status())
+        self.assertEqual(backend.call_counts()['lambda.get_function'], 1)
+
+    def test_deploy_regions(self):
+        regions = ['us-east-1', 'eu-west-1', 'ap-southeast-2']
+        fake = FakeRegions(regions)
+        config = make_config(self.path)
+        config['regions'] = regions
+        del config['lambda']['event_sources']
+        with fake.patch():
+            context = Context('foo', config)
+            results = context.deploy_regions()
+        self.assertEqual([r['region'] for r in results], regions)
+        self.assertEqual([r['status'] for r in results], ['ok'] * 3)
+        for region in regions:
+            backend = fake.backends[region]
+            function = backend.awslambda.functions['FooFunction']
+            self.assertIn(region, function['Configuration']['FunctionArn'])
+            self.assertEqual(backend.call_counts()['lambda.create_function'], 1)
+        # IAM is global and only deployed once.
+        counts = fake.backends['us-east-1'].call_counts()
+        self.assertEqual(counts['iam.create_role'], 1)
+
+    def test_provisioned_concurrency_not_ready(self):
+        config = make_config(self.path)
+        del config['lambda']['event_sources']
+        config['lambda']['alias'] = 'live'
+        config['lambda']['provisioned_concurrency'] = 5
+        backend = FakeBackend()
+        with backend.patch():
+            Context('foo', config).deploy()
+            function = backend.awslambda.functions['FooFunction']
+            self.assertEqual(sorted(function['_provisioned']), ['1'])
+            with open(os.path.join(self.path, 'src', 'foo.py'), 'a') as fp:
+                fp.write('# changed\n')
+            failed = dict(Status='FAILED', StatusReason='out of capacity')
+            with mock.patch.object(
+                    backend.awslambda, 'get_provisioned_concurrency_config',
+                    return_value=failed):
+                Context('foo', config).deploy()
+        self.assertEqual(function['_aliases']['live']['FunctionVersion'],
+                         '1')
+        self.assertEqual(sorted(function['_provisioned']), ['1'])
+
+    def test_first_of_regions_is_default(self):
+        fake = FakeRegions(['us-east-1', 'eu-west-1'])
+        config = make_config(self.path)
+        config['regions'] = ['eu-west-1', 'us-east-1']
+        del config['lambda']['event_sources']
+        with fake.patch():
+            Context('foo', config).for_region('eu-west-1').deploy()
+            context = Context('foo', config)
+            self.assertEqual(context.region, 'eu-west-1')
+            status = context.function.status()
+        self.assertIn('eu-west-1', status['Configuration']['FunctionArn'])
+
+    def test_deploy_regions_code_only_reports_failure(self):
+        regions = ['us-east-1', 'eu-west-1']
+        fake = FakeRegions(regions)
+        config = make_config(self.path)
+        config['regions'] = regions
+        del config['lambda']['event_sources']
+        with fake.patch():
+            Context('foo', config).for_region('us-east-1').deploy()
+            results = Context('foo', config).deploy_regions(code_only=True)
+        self.assertEqual([r['status'] for r in results], ['ok', 'failed'])
+
+    def test_permissions_reconciled(self):
+        backend = FakeBackend()
+        backend.sns.create_topic('foo')
+        config = make_config(self.path)
+
+        def deploy():
+            context = Context('foo', config)
+            # As registered by a CloudWatch Events source.
+            context.function.external_statement_ids.add(
+                'kappa-events-nightly')
+            context.deploy()
+        with backend.patch():
+            deploy()
+            function = backend.awslambda.functions['FooFunction']
+            function['_policy'].append({
+                'Sid': 'kappa-events-nightly', 'Effect': 'Allow',
+                'Principal': {'Service': 'events.amazonaws.com'},
+                'Action': 'lambda:InvokeFunction'})
+            backend.calls = []
+            deploy()
+            counts = backend.call_counts()
+            self.assertEqual(counts['lambda.get_policy'], 1)
+            self.assertNotIn('lambda.add_permission', counts)
+            self.assertNotIn('lambda.remove_permission', counts)
+
+            config['lambda']['permissions'] = [
+                {'statement_id': 's3_invoke',
+                 'action': 'lambda:InvokeFunction',
+                 'principal': 's3.amazonaws.com',
+                 'source_arn': 'arn:aws:s3:::bucket'},
+                {'statement_id': 'sns_invoke',
+                 'action': 'lambda:InvokeFunction',
+                 'principal': 'sns.amazonaws.com',
+                 'source_arn': 'arn:aws:sns:us-east-1:123456789012:bar'}]
+            backend.calls = []
+            deploy()
+            counts = backend.call_counts()
+        self.assertEqual(counts['lambda.add_permission'], 2)
+        self.assertEqual(counts['lambda.remove_permission'], 1)
+        statements = dict((s['Sid'], s) for s in function['_policy'])
+        self.assertEqual(sorted(statements), [
+            'kappa-events-nightly', 's3_invoke', 'sns_invoke'])
+        self.assertEqual(
+            statements['sns_invoke']['Condition']['ArnLike'],
+            {'AWS:SourceArn': 'arn:aws:sns:us-east-1:123456789012:bar'})
+
+    def test_permissions_action_casing(self):
+        backend = FakeBackend()
+        backend.sns.create_topic('foo')
+        config = make_config(self.path)
+        # As written by the samples and the init template.
+        config['lambda']['permissions'][0]['action'] = \
+            'lambda:invokeFunction'
+        with backend.patch():
+            Context('foo', config).deploy()
+            function = backend.awslambda.functions['FooFunction']
+            self.assertEqual(function['_policy'][0]['Action'],
+                             'lambda:InvokeFunction')
+            backend.calls = []
+            Context('foo', config).deploy()
+        counts = backend.call_counts()
+        self.assertNotIn('lambda.add_permission', counts)
+        self.assertNotIn('lambda.remove_permission', counts)
+
+    def test_stream_settings(self):
+        stream_arn = 'arn:aws:kinesis:us-east-1:123456789012:stream/foo'
+        config = make_config(self.path)
+        config['lambda']['event_sources'] = [{
+            'arn': stream_arn, 'batch_size': 500,
+            'parallelization_factor': 4,
+            'bisect_batch_on_function_error': True,
+            'maximum_retry_attempts': 3}]
+        backend = FakeBackend()
+        backend.cloudwatch.put_datapoints(
+            'IteratorAge', {'FunctionName': 'FooFunction'}, 'Maximum',
+            [(datetime.datetime.utcnow() - datetime.timedelta(minutes=2),
+              1500.0)])
+        with backend.patch():
+            context = Context('foo', config)
+            context.deploy()
+            context.add_event_sources()
+            mapping = list(backend.awslambda.mappings.values())[0]
+            self.assertEqual(mapping['ParallelizationFactor'], 4)
+            self.assertTrue(mapping['BisectBatchOnFunctionError'])
+            self.assertNotIn('TumblingWindowInSeconds', mapping)
+
+            backend.calls = []
+            context.update_event_sources()
+            self.assertNotIn('lambda.update_event_source_mapping',
+                             backend.call_counts())
+
+            config['lambda']['event_sources'][0]['parallelization_factor'] = 8
+            context = Context('foo', config)
+            with mock.patch.object(
+                    backend.awslambda, 'update_event_source_mapping',
+                    wraps=backend.awslambda.update_event_source_mapping) \
+                    as update:
+                context.update_event_sources()
+            self.assertEqual(update.call_args[1], {
+                'UUID': mapping['UUID'], 'FunctionName': 'FooFunction',
+                'ParallelizationFactor': 8})
+            self.assertEqual(mapping['ParallelizationFactor'], 8)
+
+            status = context.status()
+        self.assertEqual(status['event_sources'][0]['IteratorAge'], 1500.0)
+
+    def test_invoke_emulated_test_data(self):
+        config = make_config(self.path)
+        with FakeBackend().patch():
+            context = Context('foo', config)
+            response = context.invoke_emulated()
+            self.assertIsNone(response['error'])
+            self.assertIsNone(response['result'])
+            test_data = os.path.join(self.path, 'input.json')
+            with open(test_data, 'w') as fp:
+                fp.write('{"foo": "bar"}')
+            config['lambda']['test_data'] = test_data
+            context = Context('foo', config)
+            response = context.invoke_emulated()
+            self.assertEqual(response['result'], {'foo': 'bar'})
+            response = context.invoke_emulated('[1, 2]')
+            self.assertEqual(response['result'], [1, 2])
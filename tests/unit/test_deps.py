@@ -0,0 +1,110 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+import zipfile
+
+import mock
+
+import kappa.deps
+from kappa.context import Context
+from kappa.deps import DependencyCache, DependencyError
+from tests.unit.fake_aws import FakeBackend
+from tests.unit.test_context import make_config
+
+
+def fake_pip(command):
+    target = command[command.index('--target') + 1]
+    os.makedirs(os.path.join(target, 'requests'))
+    with open(os.path.join(target, 'requests', '__init__.py'), 'w') as fp:
+        fp.write('# vendored\n')
+
+
+class TestDependencies(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.env_patch = mock.patch.dict(
+            os.environ, {'KAPPA_CACHE_DIR': os.path.join(self.path, 'cache')})
+        self.env_patch.start()
+        self.lockfile = os.path.join(self.path, 'requirements.txt')
+        with open(self.lockfile, 'w') as fp:
+            fp.write('requests==2.9.1\n')
+        os.mkdir(os.path.join(self.path, 'src'))
+        with open(os.path.join(self.path, 'src', 'foo.py'), 'w') as fp:
+            fp.write('import requests\n')
+
+    def tearDown(self):
+        self.env_patch.stop()
+        shutil.rmtree(self.path)
+
+    def test_installs_once_per_lockfile(self):
+        cache = DependencyCache(self.lockfile, 'python2.7',
+                                local_cache='/wheels', offline=True)
+        with mock.patch('subprocess.check_call',
+                        side_effect=fake_pip) as check_call:
+            path = cache.ensure()
+            self.assertEqual(cache.ensure(), path)
+            self.assertEqual(
+                DependencyCache(self.lockfile, 'python2.7').ensure(), path)
+        self.assertEqual(check_call.call_count, 1)
+        command = check_call.call_args[0][0]
+        self.assertIn('--no-index', command)
+        self.assertEqual(command[command.index('--find-links') + 1],
+                         '/wheels')
+        # Wheels are picked for Lambda's platform and python version.
+        self.assertEqual(command[command.index('--python-version') + 1],
+                         '2.7')
+        self.assertEqual(command[command.index('--platform') + 1],
+                         kappa.deps.LambdaPlatform)
+        self.assertIn('--only-binary=:all:', command)
+        self.assertNotEqual(
+            DependencyCache(self.lockfile, 'python3.8').key, cache.key)
+
+    def test_failed_install_is_not_cached(self):
+        cache = DependencyCache(self.lockfile, 'python2.7')
+        error = subprocess.CalledProcessError(1, 'pip')
+        with mock.patch('subprocess.check_call', side_effect=error):
+            self.assertRaises(DependencyError, cache.ensure)
+        self.assertEqual(os.listdir(cache.root), [])
+
+    def test_stage_links_files(self):
+        with mock.patch('subprocess.check_call', side_effect=fake_pip):
+            installed = DependencyCache(self.lockfile, 'python2.7').ensure()
+        staging = kappa.deps.stage(os.path.join(self.path, 'src'), installed,
+                                   os.path.join(self.path, 'staging'))
+        staged = os.path.join(staging, 'requests', '__init__.py')
+        self.assertEqual(
+            os.stat(staged).st_ino,
+            os.stat(os.path.join(installed, 'requests', '__init__.py')).st_ino)
+        self.assertTrue(os.path.exists(os.path.join(staging, 'foo.py')))
+        self.assertFalse(os.path.exists(
+            os.path.join(staging, kappa.deps.CompleteMarker)))
+
+    def test_deploy_packages_dependencies(self):
+        config = make_config(self.path)
+        del config['lambda']['event_sources']
+        config['lambda']['dependencies'] = self.lockfile
+        backend = FakeBackend()
+        with backend.patch():
+            with mock.patch('subprocess.check_call', side_effect=fake_pip):
+                context = Context('foo', config)
+                context.deploy()
+        with zipfile.ZipFile(config['lambda']['zipfile_name']) as zf:
+            names = zf.namelist()
+        self.assertIn('foo.py', names)
+        self.assertIn('requests/__init__.py', names)
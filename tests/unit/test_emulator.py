@@ -0,0 +1,94 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import base64
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from urllib.request import Request, urlopen
+except ImportError:
+    from urllib2 import Request, urlopen
+
+from kappa.emulator import Emulator, EmulatorServer
+from kappa.log import parse_report
+
+Handler = """
+import time
+
+def handler(event, context):
+    print('got %s' % event['action'])
+    if event['action'] == 'fail':
+        raise ValueError('bad action')
+    if event['action'] == 'sleep':
+        time.sleep(5)
+    return {'action': event['action'],
+            'remaining': context.get_remaining_time_in_millis()}
+"""
+
+
+class TestEmulator(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        with open(os.path.join(self.path, 'foo.py'), 'w') as fp:
+            fp.write(Handler)
+        self.emulator = Emulator(self.path, 'foo.handler',
+                                 function_name='FooBarFunction',
+                                 memory_size=128, timeout=1)
+
+    def tearDown(self):
+        self.emulator.shutdown()
+        shutil.rmtree(self.path)
+
+    def test_invoke(self):
+        response = self.emulator.invoke({'action': 'echo'})
+        self.assertEqual(response['result']['action'], 'echo')
+        self.assertTrue(0 < response['result']['remaining'] <= 1000)
+        self.assertIn('got echo', response['log'])
+        report = parse_report(response['log'])
+        self.assertIn('init_duration', report)
+        self.assertEqual(report['memory_size'], 128)
+        # The second invocation reuses the warm worker.
+        response = self.emulator.invoke({'action': 'again'})
+        self.assertNotIn('init_duration', parse_report(response['log']))
+
+    def test_error(self):
+        response = self.emulator.invoke({'action': 'fail'})
+        self.assertEqual(response['error']['errorType'], 'ValueError')
+        self.assertIn('got fail', response['log'])
+
+    def test_timeout(self):
+        response = self.emulator.invoke({'action': 'sleep'})
+        self.assertIn('Task timed out', response['error']['errorMessage'])
+        self.assertIn('Task timed out', response['log'])
+        response = self.emulator.invoke({'action': 'echo'})
+        self.assertEqual(response['result']['action'], 'echo')
+
+    def test_server(self):
+        server = EmulatorServer(self.emulator, port=0).start()
+        try:
+            url = '%s/2015-03-31/functions/FooBarFunction/invocations' % (
+                server.endpoint_url,)
+            request = Request(url, json.dumps({'action': 'http'}).encode(),
+                              {'X-Amz-Log-Type': 'Tail'})
+            response = urlopen(request)
+            self.assertEqual(json.loads(response.read().decode())['action'],
+                             'http')
+            log = base64.b64decode(response.headers['X-Amz-Log-Result'])
+            self.assertIn(b'REPORT RequestId', log)
+        finally:
+            server.stop()
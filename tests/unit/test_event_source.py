@@ -0,0 +1,187 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import unittest
+
+import mock
+from botocore.exceptions import ClientError
+
+from kappa.event_source import SNSEventSource, SQSEventSource
+from kappa.event_source import KinesisEventSource, CloudWatchEventSource
+from kappa.event_source import create_event_source
+from tests.unit.mock_aws import get_aws
+
+TopicArn = 'arn:aws:sns:us-east-1:123456789012:lambda_topic'
+
+SNSConfig = {'arn': TopicArn}
+
+
+def mock_function(name):
+    function = mock.Mock()
+    function.name = name
+    function.arn = 'arn:aws:lambda:us-east-1:123456789012:function:%s' % name
+    return function
+
+
+class TestSNSEventSource(unittest.TestCase):
+
+    def setUp(self):
+        self.aws_patch = mock.patch('kappa.aws.get_aws', get_aws)
+        self.mock_aws = self.aws_patch.start()
+        SNSEventSource.clear_subscription_index()
+
+    def tearDown(self):
+        self.aws_patch.stop()
+        SNSEventSource.clear_subscription_index()
+
+    def test_exists_second_page(self):
+        mock_context = mock.Mock()
+        event_source = SNSEventSource(mock_context, SNSConfig)
+        subscription = event_source.exists(mock_function('FooBarFunction'))
+        self.assertEqual(
+            subscription['SubscriptionArn'],
+            TopicArn + ':0b8a3c55-7f1e-4d64-9bd0-6f3f9c3a2e77')
+        self.assertEqual(
+            event_source._sns.list_subscriptions_by_topic.call_count, 2)
+
+    def test_index_shared(self):
+        mock_context = mock.Mock()
+        first = SNSEventSource(mock_context, SNSConfig)
+        second = SNSEventSource(mock_context, SNSConfig)
+        self.assertTrue(first.exists(mock_function('OtherFunction')))
+        self.assertTrue(second.exists(mock_function('FooBarFunction')))
+        self.assertEqual(
+            second._sns.list_subscriptions_by_topic.call_count, 0)
+
+    def test_add_existing(self):
+        mock_context = mock.Mock()
+        event_source = SNSEventSource(mock_context, SNSConfig)
+        event_source.add(mock_function('FooBarFunction'))
+        self.assertEqual(event_source._sns.subscribe.call_count, 0)
+
+    def test_add_and_remove(self):
+        mock_context = mock.Mock()
+        event_source = SNSEventSource(mock_context, SNSConfig)
+        function = mock_function('NewFunction')
+        event_source.add(function)
+        self.assertEqual(event_source._sns.subscribe.call_count, 1)
+        self.assertTrue(event_source.exists(function))
+        event_source.remove(function)
+        self.assertEqual(event_source._sns.unsubscribe.call_count, 1)
+        self.assertIsNone(event_source.exists(function))
+        self.assertEqual(
+            event_source._sns.list_subscriptions_by_topic.call_count, 2)
+
+
+class TestCreateEventSource(unittest.TestCase):
+
+    def setUp(self):
+        self.aws_patch = mock.patch('kappa.aws.get_aws', get_aws)
+        self.mock_aws = self.aws_patch.start()
+
+    def tearDown(self):
+        self.aws_patch.stop()
+
+    def test_dispatch(self):
+        mock_context = mock.Mock()
+        arns = {
+            'arn:aws:kinesis:us-east-1:123456789012:stream/foo':
+                KinesisEventSource,
+            'arn:aws:sqs:us-east-1:123456789012:foo': SQSEventSource,
+            'arn:aws:events:us-east-1:123456789012:rule/foo':
+                CloudWatchEventSource,
+            TopicArn: SNSEventSource}
+        for arn, cls in arns.items():
+            event_source = create_event_source(mock_context, {'arn': arn})
+            self.assertIsInstance(event_source, cls)
+
+    def test_unknown(self):
+        mock_context = mock.Mock()
+        self.assertRaises(
+            ValueError, create_event_source, mock_context,
+            {'arn': 'arn:aws:foo:us-east-1:123456789012:bar'})
+
+    def test_cloudwatch_status(self):
+        arn = 'arn:aws:events:us-east-1:123456789012:rule/foo'
+        event_source = create_event_source(mock.Mock(), {'arn': arn})
+        function = mock_function('FooBarFunction')
+        event_source._events = mock.Mock()
+        event_source._events.list_targets_by_rule.return_value = {
+            'Targets': [{'Id': '1', 'Arn': function.arn}]}
+        event_source._events.describe_rule.return_value = {
+            'Name': 'foo', 'Arn': arn, 'State': 'ENABLED'}
+        status = event_source.status(function)
+        self.assertEqual(status['EventSourceArn'], arn)
+        self.assertEqual(status['State'], 'Enabled')
+        event_source._events.list_targets_by_rule.return_value = {
+            'Targets': []}
+        self.assertIsNone(event_source.status(function))
+
+    def test_cloudwatch_permission_conflicts(self):
+        arn = 'arn:aws:events:us-east-1:123456789012:rule/foo'
+        function = mock_function('FooBarFunction')
+
+        def conflict(message, code='ResourceConflictException'):
+            return ClientError({'Error': {'Code': code, 'Message': message}},
+                               'AddPermission')
+
+        def add(*errors):
+            event_source = create_event_source(
+                mock.Mock(), {'arn': arn, 'schedule': 'rate(1 hour)'})
+            event_source._events = mock.Mock()
+            event_source._events.put_rule.return_value = {'RuleArn': arn}
+            event_source._lambda = mock.Mock()
+            event_source._lambda.add_permission.side_effect = list(errors)
+            with mock.patch('time.sleep'):
+                event_source.add(function)
+            return (event_source._lambda.add_permission.call_count,
+                    event_source._events.put_targets.called)
+
+        # A concurrent edit of the policy is retried.
+        self.assertEqual(add(conflict('The policy was updated concurrently'),
+                             {}), (2, True))
+        # The statement is already there.
+        self.assertEqual(add(conflict(
+            'The statement id (kappa-events-foo) provided already exists.')),
+            (1, True))
+        # Anything else stops the rule from targeting the function.
+        self.assertEqual(add(conflict('denied', 'AccessDeniedException')),
+                         (1, False))
+
+    def test_sqs_batching(self):
+        mock_context = mock.Mock()
+        event_source = create_event_source(
+            mock_context,
+            {'arn': 'arn:aws:sqs:us-east-1:123456789012:foo',
+             'batch_size': 100, 'batching_window': 5})
+        args = event_source._create_args(mock_function('FooBarFunction'))
+        self.assertEqual(args['BatchSize'], 100)
+        self.assertEqual(args['MaximumBatchingWindowInSeconds'], 5)
+        self.assertNotIn('StartingPosition', args)
+
+    def test_stream_update_only_changes(self):
+        mock_context = mock.Mock()
+        event_source = create_event_source(
+            mock_context,
+            {'arn': 'arn:aws:dynamodb:us-east-1:123456789012:table/foo/'
+                    'stream/2015-01-01T00:00:00.000',
+             'batch_size': 100, 'maximum_record_age': 3600,
+             'tumbling_window': 60, 'enabled': False})
+        current = {'BatchSize': 100, 'State': 'Enabled',
+                   'MaximumRecordAgeInSeconds': 3600,
+                   'TumblingWindowInSeconds': 30}
+        args = event_source._update_args(
+            mock_function('FooBarFunction'), current)
+        self.assertEqual(args, {'FunctionName': 'FooBarFunction',
+                                'Enabled': False,
+                                'TumblingWindowInSeconds': 60})
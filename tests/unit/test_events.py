@@ -0,0 +1,105 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import base64
+import io
+import json
+import unittest
+
+import kappa.events
+
+StreamArn = 'arn:aws:kinesis:us-west-2:123456789012:stream/foo'
+TableStreamArn = ('arn:aws:dynamodb:us-east-1:123456789012:table/foo/'
+                  'stream/2015-01-01T00:00:00.000')
+
+
+class TestEvents(unittest.TestCase):
+
+    def test_kinesis(self):
+        generator = kappa.events.create_generator(
+            {'arn': StreamArn, 'batch_size': 3},
+            template={'user': 'u{n}', 'n': '{n}', 'other': '{other}'},
+            seed=1, start_time=0)
+        fp = io.BytesIO()
+        self.assertEqual(generator.write(fp, 7), 3)
+        events = [json.loads(line.decode('utf-8'))
+                  for line in fp.getvalue().splitlines()]
+        self.assertEqual([len(e['Records']) for e in events], [3, 3, 1])
+        records = [r for e in events for r in e['Records']]
+        self.assertEqual(records[0]['awsRegion'], 'us-west-2')
+        self.assertEqual(records[0]['eventSourceARN'], StreamArn)
+        sequence = [int(r['kinesis']['sequenceNumber']) for r in records]
+        self.assertEqual(sequence, sorted(set(sequence)))
+        data = json.loads(base64.b64decode(
+            records[6]['kinesis']['data']).decode('utf-8'))
+        self.assertEqual(data, {'user': 'u6', 'n': 6, 'other': '{other}'})
+
+    def test_repeatable(self):
+        def generate():
+            generator = kappa.events.create_generator(
+                {'arn': StreamArn}, seed=42, start_time=0)
+            return list(generator.events(5))
+        self.assertEqual(generate(), generate())
+
+    def test_dynamodb(self):
+        generator = kappa.events.create_generator(
+            {'arn': TableStreamArn, 'keys': ['pk']},
+            template={'pk': 'id-{n}', 'count': '{n}', 'ok': True,
+                      'tags': ['a'], 'none': None},
+            start_time=0)
+        record = next(generator.events(1))['Records'][0]
+        self.assertEqual(record['eventSource'], 'aws:dynamodb')
+        self.assertEqual(record['dynamodb']['Keys'], {'pk': {'S': 'id-0'}})
+        self.assertEqual(record['dynamodb']['NewImage'], {
+            'pk': {'S': 'id-0'}, 'count': {'N': '0'}, 'ok': {'BOOL': True},
+            'tags': {'L': [{'S': 'a'}]}, 'none': {'NULL': True}})
+
+    def test_s3_and_sns(self):
+        generator = kappa.events.create_generator(
+            {'arn': 'arn:aws:s3:::bucket', 'events': ['s3:ObjectCreated:*']},
+            template={'key': 'in/{n:03d}.json'})
+        events = list(generator.events(2))
+        self.assertEqual(len(events), 2)
+        record = events[1]['Records'][0]
+        self.assertEqual(record['eventName'], 'ObjectCreated:Put')
+        self.assertEqual(record['s3']['bucket']['name'], 'bucket')
+        self.assertEqual(record['s3']['object']['key'], 'in/001.json')
+
+        generator = kappa.events.create_generator(
+            {'arn': 'arn:aws:sns:us-east-1:123456789012:topic'},
+            template='hello {n}')
+        record = next(generator.events(1))['Records'][0]
+        self.assertEqual(record['Sns']['Message'], 'hello 0')
+
+        # A JSON body in a string keeps its braces.
+        generator = kappa.events.create_generator(
+            {'arn': 'arn:aws:sns:us-east-1:123456789012:topic'},
+            template='{"id": {n}, "tags": {}, "x": "{ y }"}')
+        record = next(generator.events(1))['Records'][0]
+        self.assertEqual(record['Sns']['Message'],
+                         '{"id": 0, "tags": {}, "x": "{ y }"}')
+
+    def test_select_source(self):
+        sources = [{'arn': 'arn:aws:events:us-east-1:123456789012:rule/r'},
+                   {'arn': StreamArn},
+                   {'arn': 'arn:aws:s3:::bucket'}]
+        select = kappa.events.select_source
+        self.assertEqual(select(sources), sources[1])
+        self.assertEqual(select(sources, '2'), sources[2])
+        self.assertEqual(select(sources, 'bucket'), sources[2])
+        self.assertEqual(select(sources, TableStreamArn),
+                         {'arn': TableStreamArn})
+        self.assertRaises(ValueError, select, sources, '3')
+        self.assertRaises(ValueError, select, sources[:1])
+        self.assertRaises(ValueError, kappa.events.create_generator,
+                          sources[0])
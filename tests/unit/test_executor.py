@@ -0,0 +1,75 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import threading
+import time
+import unittest
+
+import kappa.executor
+
+
+class TestExecutor(unittest.TestCase):
+
+    def test_map_keeps_order(self):
+        def slow_square(n):
+            time.sleep(0.01 * (5 - n))
+            return n * n
+        self.assertEqual(kappa.executor.map(slow_square, range(5)),
+                         [0, 1, 4, 9, 16])
+
+    def test_map_overlaps_calls(self):
+        barrier = threading.Event()
+        seen = []
+
+        def wait(n):
+            seen.append(n)
+            if len(seen) == 3:
+                barrier.set()
+            # Only returns True if all three calls were in flight at once.
+            return barrier.wait(2)
+        self.assertEqual(kappa.executor.map(wait, range(3), max_workers=3),
+                         [True, True, True])
+
+    def test_map_serializes_keys(self):
+        active = {}
+        overlaps = []
+        lock = threading.Lock()
+
+        def work(item):
+            bucket, n = item
+            with lock:
+                if active.get(bucket):
+                    overlaps.append(item)
+                active[bucket] = True
+            time.sleep(0.01)
+            with lock:
+                active[bucket] = False
+            return n
+        items = [('a', 1), ('b', 2), ('a', 3), ('b', 4)]
+        results = kappa.executor.map(work, items, key=lambda i: i[0])
+        self.assertEqual(results, [1, 2, 3, 4])
+        self.assertEqual(overlaps, [])
+
+    def test_map_raises_after_all_finish(self):
+        finished = []
+
+        def work(n):
+            if n == 0:
+                raise ValueError('boom')
+            time.sleep(0.01)
+            finished.append(n)
+        self.assertRaises(ValueError, kappa.executor.map, work, range(4))
+        self.assertEqual(sorted(finished), [1, 2, 3])
+
+    def test_call(self):
+        self.assertEqual(kappa.executor.call(lambda: 1, lambda: 2), [1, 2])
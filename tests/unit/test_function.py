@@ -0,0 +1,76 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import unittest
+
+import mock
+
+from kappa.function import Function
+from tests.unit.mock_aws import get_aws
+
+Config1 = {
+    'name': 'FooBarFunction',
+    'handler': 'FooBarFunction.handler',
+    'reserved_concurrency': 50,
+    'alias': 'live',
+    'provisioned_concurrency': 10}
+
+Config2 = {
+    'name': 'FooBarFunction',
+    'handler': 'FooBarFunction.handler'}
+
+
+class TestFunction(unittest.TestCase):
+
+    def setUp(self):
+        self.aws_patch = mock.patch('kappa.aws.get_aws', get_aws)
+        self.mock_aws = self.aws_patch.start()
+        self.sleep_patch = mock.patch('time.sleep')
+        self.sleep_patch.start()
+
+    def tearDown(self):
+        self.aws_patch.stop()
+        self.sleep_patch.stop()
+
+    def test_properties(self):
+        mock_context = mock.Mock()
+        function = Function(mock_context, Config1)
+        self.assertEqual(function.reserved_concurrency, 50)
+        self.assertEqual(function.alias, 'live')
+        self.assertEqual(function.provisioned_concurrency, 10)
+
+    def test_apply_concurrency(self):
+        mock_context = mock.Mock()
+        function = Function(mock_context, Config1)
+        function.apply_concurrency()
+        lambda_svc = function._lambda_svc
+        lambda_svc.put_function_concurrency.assert_called_once_with(
+            FunctionName='FooBarFunction', ReservedConcurrentExecutions=50)
+        lambda_svc.put_provisioned_concurrency_config.assert_called_once_with(
+            FunctionName='FooBarFunction', Qualifier='2',
+            ProvisionedConcurrentExecutions=10)
+        self.assertEqual(
+            lambda_svc.get_provisioned_concurrency_config.call_count, 2)
+        lambda_svc.update_alias.assert_called_once_with(
+            FunctionName='FooBarFunction', Name='live', FunctionVersion='2')
+        lambda_svc.delete_provisioned_concurrency_config.\
+            assert_called_once_with(
+                FunctionName='FooBarFunction', Qualifier='1')
+
+    def test_no_concurrency(self):
+        mock_context = mock.Mock()
+        function = Function(mock_context, Config2)
+        function.apply_concurrency()
+        self.assertEqual(
+            function._lambda_svc.put_function_concurrency.call_count, 0)
+        self.assertEqual(function._lambda_svc.publish_version.call_count, 0)
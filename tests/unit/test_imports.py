@@ -0,0 +1,116 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import mock
+
+import kappa.imports
+
+ImportTime = """\
+import time: self [us] | cumulative | imported package
+import time:       100 |        100 |     helpers.util
+import time:       200 |        300 |   helpers
+import time:        50 |         50 |   fastjson
+import time:      1000 |       1350 | handler
+import time:       400 |        400 | boto_stub
+"""
+
+
+class TestImports(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_parse_and_rank(self):
+        tree = kappa.imports.rank(kappa.imports.parse_importtime(ImportTime))
+        self.assertEqual([n.name for n in tree], ['handler', 'boto_stub'])
+        handler = tree[0]
+        self.assertEqual((handler.self_us, handler.cumulative_us),
+                         (1000, 1350))
+        self.assertEqual([n.name for n in handler.children],
+                         ['helpers', 'fastjson'])
+        self.assertEqual(handler.children[0].children[0].name,
+                         'helpers.util')
+        self.assertEqual(kappa.imports.package_totals(tree),
+                         {'handler': 1000, 'helpers': 300, 'fastjson': 50,
+                          'boto_stub': 400})
+
+    def test_untouched(self):
+        tree = kappa.imports.parse_importtime(ImportTime)
+        self.assertEqual(
+            kappa.imports.untouched(['handler', 'helpers.util'], tree),
+            [{'name': 'boto_stub', 'cost': 400},
+             {'name': 'fastjson', 'cost': 50}])
+
+    def test_compare(self):
+        changes = kappa.imports.compare(
+            {'a': 100, 'b': 50, 'c': 10}, {'a': 400, 'c': 10, 'd': 20})
+        self.assertEqual(changes, [
+            {'name': 'a', 'before': 100, 'after': 400, 'delta': 300},
+            {'name': 'b', 'before': 50, 'after': None, 'delta': -50},
+            {'name': 'd', 'before': None, 'after': 20, 'delta': 20}])
+
+    @unittest.skipIf(sys.version_info < (3, 7), 'needs -X importtime')
+    def test_analyze(self):
+        source = os.path.join(self.path, 'src')
+        os.mkdir(source)
+        with open(os.path.join(source, 'foo.py'), 'w') as fp:
+            fp.write('import colorsys\nimport fractions\n\n'
+                     'def handler(event, context):\n'
+                     '    return colorsys.rgb_to_hsv(*event)\n')
+        function = mock.Mock(path=source, handler='foo.handler',
+                             runtime='python3.8')
+        function.stage.return_value = source
+        function._get_test_data.return_value = '[0.1, 0.2, 0.3]'
+        with mock.patch.dict(os.environ, {
+                'KAPPA_CACHE_DIR': os.path.join(self.path, 'cache')}):
+            analyzer = kappa.imports.ImportAnalyzer(function, repeat=2)
+            analysis = analyzer.run()
+            self.assertIsNone(analysis['error'])
+            self.assertIsNone(analysis['invoke_error'])
+            self.assertIsNone(analysis['changes'])
+            self.assertEqual(analysis['tree'][0]['name'], 'foo')
+            children = [c['name'] for c in analysis['tree'][0]['children']]
+            self.assertIn('colorsys', children)
+            self.assertIn('fractions', children)
+            self.assertEqual([m['name'] for m in analysis['untouched']],
+                             ['fractions'])
+            self.assertEqual(analyzer.run()['previous_total'],
+                             analysis['total'])
+
+    @unittest.skipIf(sys.version_info < (3, 7), 'needs -X importtime')
+    def test_handler_invoked_once(self):
+        source = os.path.join(self.path, 'src')
+        os.mkdir(source)
+        calls = os.path.join(self.path, 'calls')
+        with open(os.path.join(source, 'foo.py'), 'w') as fp:
+            fp.write('def handler(event, context):\n'
+                     '    with open(%r, "a") as fp:\n'
+                     '        fp.write("x")\n' % calls)
+        function = mock.Mock(path=source, handler='foo.handler',
+                             runtime='python3.8')
+        function.stage.return_value = source
+        function._get_test_data.return_value = 'null'
+        with mock.patch.dict(os.environ, {
+                'KAPPA_CACHE_DIR': os.path.join(self.path, 'cache')}):
+            kappa.imports.ImportAnalyzer(function, repeat=3).run()
+        with open(calls) as fp:
+            self.assertEqual(fp.read(), 'x')
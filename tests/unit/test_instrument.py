@@ -0,0 +1,90 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import unittest
+
+import boto3
+import mock
+from botocore.awsrequest import AWSResponse
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+from kappa.instrument import CallRecorder
+
+
+def make_client():
+    return boto3.session.Session(
+        aws_access_key_id='foo', aws_secret_access_key='bar',
+        region_name='us-east-1').client('lambda')
+
+
+class TestCallRecorder(unittest.TestCase):
+
+    def test_counts_and_errors(self):
+        client = make_client()
+        recorder = CallRecorder()
+        recorder.attach(client)
+        stubber = Stubber(client)
+        stubber.add_response('get_function', {}, {'FunctionName': 'foo'})
+        stubber.add_client_error('get_function', 'ResourceNotFoundException')
+        with stubber:
+            client.get_function(FunctionName='foo')
+            self.assertRaises(ClientError, client.get_function,
+                              FunctionName='foo')
+        op = recorder.summary()['operations']['lambda.GetFunction']
+        self.assertEqual(op['count'], 2)
+        self.assertEqual(op['errors'], 1)
+        self.assertEqual(sum(op['histogram'].values()), 2)
+        events = recorder.trace_events()
+        self.assertEqual(len(events), 2)
+        self.assertEqual(events[0]['ph'], 'X')
+
+    def respond(self, client, responses):
+        # Answer each HTTP request with the next (status, error code), so
+        # botocore's own retry handling runs.
+        responses = list(responses)
+
+        def before_send(request, **kwargs):
+            status, code = responses.pop(0)
+            body = b'{}'
+            if code:
+                body = ('{"__type": "%s", "message": "x"}' % code).encode()
+            raw = mock.Mock(stream=mock.Mock(return_value=[body]))
+            return AWSResponse(request.url, status, {}, raw)
+        client.meta.events.register('before-send', before_send)
+
+    def test_retries_and_throttles(self):
+        client = make_client()
+        recorder = CallRecorder()
+        recorder.attach(client)
+        self.respond(client, [(429, 'TooManyRequestsException'),
+                              (429, 'TooManyRequestsException'),
+                              (200, None)])
+        with mock.patch('time.sleep'):
+            client.get_function(FunctionName='foo')
+        op = recorder.summary()['operations']['lambda.GetFunction']
+        self.assertEqual(op['count'], 1)
+        self.assertEqual(op['retries'], 2)
+        self.assertEqual(op['throttles'], 2)
+
+    def test_no_retries_for_client_errors(self):
+        client = make_client()
+        recorder = CallRecorder()
+        recorder.attach(client)
+        self.respond(client, [(404, 'ResourceNotFoundException')])
+        self.assertRaises(ClientError, client.get_function,
+                          FunctionName='foo')
+        op = recorder.summary()['operations']['lambda.GetFunction']
+        self.assertEqual(op['errors'], 1)
+        self.assertEqual(op['retries'], 0)
+        self.assertEqual(op['throttles'], 0)
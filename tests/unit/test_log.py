@@ -11,11 +11,17 @@
 # ANY KIND, either express or implied. See the License for the specific
 # language governing permissions and limitations under the License.
 
+import gzip
+import json
+import os
+import shutil
+import tempfile
 import unittest
 
 import mock
 
-from kappa.log import Log
+from kappa.log import Log, LogExporter, parse_time
+from tests.unit.fake_aws import FakeBackend
 from tests.unit.mock_aws import get_aws
 
 
@@ -42,3 +48,139 @@ class TestLog(unittest.TestCase):
         self.assertEqual(events[0]['ingestionTime'], 1420569036909)
         self.assertIn('RequestId: 23007242-95d2-11e4-a10e-7b2ab60a7770',
                       events[-1]['message'])
+
+
+class TestLogStats(unittest.TestCase):
+
+    def test_stats(self):
+        with mock.patch('kappa.aws.get_aws', get_aws):
+            log = Log(mock.Mock(), '/aws/lambda/foo')
+        svc = log._log_svc = mock.Mock()
+        svc.describe_log_groups.return_value = {
+            'logGroups': [{'logGroupName': '/aws/lambda/foo'}]}
+        svc.start_query.side_effect = [{'queryId': 'q1'}, {'queryId': 'q2'}]
+        results = {
+            'q1': [[{'field': 'invocations', 'value': '1200'},
+                    {'field': 'duration_p99', 'value': '812.5'},
+                    {'field': 'init_duration_avg', 'value': ''}]],
+            'q2': [[{'field': 'error_lines', 'value': '3'}]]}
+        polls = []
+
+        def get_query_results(queryId):
+            polls.append(queryId)
+            if polls.count(queryId) == 1:
+                return {'status': 'Running', 'results': []}
+            return {'status': 'Complete', 'results': results[queryId]}
+        svc.get_query_results.side_effect = get_query_results
+        with mock.patch('time.sleep'):
+            stats = log.stats(1420070400000, 1420156800000)
+        self.assertEqual(stats, {'invocations': 1200.0,
+                                 'duration_p99': 812.5,
+                                 'init_duration_avg': None,
+                                 'error_lines': 3.0})
+        kwargs = svc.start_query.call_args_list[0][1]
+        self.assertEqual(kwargs['startTime'], 1420070400)
+        self.assertEqual(kwargs['endTime'], 1420156800)
+
+    def test_failed_query(self):
+        with mock.patch('kappa.aws.get_aws', get_aws):
+            log = Log(mock.Mock(), '/aws/lambda/foo')
+        svc = log._log_svc = mock.Mock()
+        svc.start_query.return_value = {'queryId': 'q1'}
+        svc.get_query_results.return_value = {'status': 'Failed',
+                                               'results': []}
+        self.assertRaises(RuntimeError, log.query, 'fields @message', 0, 1)
+
+
+class TestLogExport(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.backend = FakeBackend(page_size=7)
+        for s in range(5):
+            self.backend.logs.put_events('/aws/lambda/foo', 'stream%d' % s, [
+                {'timestamp': 1000 * s + i, 'message': 'event %d' % i}
+                for i in range(20)])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self, stream_name):
+        path = os.path.join(self.directory, stream_name + '.jsonl.gz')
+        with gzip.open(path, 'rb') as fp:
+            return [json.loads(line.decode('utf-8')) for line in fp]
+
+    def test_export_window(self):
+        with self.backend.patch():
+            log = Log(mock.Mock(), '/aws/lambda/foo')
+            summary = LogExporter(log, self.directory, 1000, 3010).run()
+        # stream0 ends before the window and stream4 starts after it.
+        self.assertEqual(summary['streams'], 3)
+        self.assertEqual(summary['events'], 20 + 20 + 10)
+        events = self.read('stream3')
+        self.assertEqual([e['timestamp'] for e in events],
+                         list(range(3000, 3010)))
+
+    def test_resume(self):
+        with self.backend.patch():
+            log = Log(mock.Mock(), '/aws/lambda/foo')
+            get_log_events = log._log_svc.get_log_events
+            calls = []
+
+            def flaky(**kwargs):
+                calls.append(kwargs)
+                if len(calls) == 4:
+                    raise RuntimeError('connection reset')
+                return get_log_events(**kwargs)
+            log._log_svc.get_log_events = flaky
+            exporter = LogExporter(log, self.directory, 0, 10000,
+                                   max_workers=1)
+            self.assertRaises(RuntimeError, exporter.run)
+            # Progress is kept in per-stream checkpoints until the export
+            # finishes.
+            self.assertTrue(os.path.exists(os.path.join(
+                self.directory, 'stream4.jsonl.gz.checkpoint.json')))
+            log._log_svc.get_log_events = get_log_events
+            summary = LogExporter(log, self.directory, 0, 10000).run()
+        self.assertEqual(summary['events'], 100)
+        for s in range(5):
+            messages = [e['message'] for e in self.read('stream%d' % s)]
+            self.assertEqual(messages, ['event %d' % i for i in range(20)])
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted(
+            ['checkpoint.json'] +
+            ['stream%d.jsonl.gz' % s for s in range(5)]))
+
+    def test_empty_page_before_events(self):
+        with self.backend.patch():
+            log = Log(mock.Mock(), '/aws/lambda/foo')
+            get_log_events = log._log_svc.get_log_events
+
+            def gappy(**kwargs):
+                if 'nextToken' not in kwargs:
+                    # An empty first page that still points further on.
+                    response = get_log_events(**kwargs)
+                    response['events'] = []
+                    response['nextForwardToken'] = 'f/0'
+                    return response
+                return get_log_events(**kwargs)
+            log._log_svc.get_log_events = gappy
+            summary = LogExporter(log, self.directory, 0, 10000).run()
+        self.assertEqual(summary['events'], 100)
+        self.assertEqual(len(self.read('stream2')), 20)
+
+    def test_log_group_beyond_first_page(self):
+        for name in ('a', 'b', 'c', 'zz'):
+            self.backend.logs.put_events('/aws/lambda/%s' % name, 'stream',
+                                         [{'timestamp': 0, 'message': 'x'}])
+        self.backend.page_size = 2
+        with self.backend.patch():
+            self.assertTrue(Log(mock.Mock(),
+                                '/aws/lambda/foo')._check_for_log_group())
+            self.assertFalse(Log(mock.Mock(),
+                                 '/aws/lambda/fo')._check_for_log_group())
+
+    def test_parse_time(self):
+        self.assertEqual(parse_time('1420070400000'), 1420070400000)
+        self.assertEqual(parse_time('2015-01-01T00:00'), 1420070400000)
+        self.assertEqual(parse_time('2h', now=1420077600), 1420070400000)
+        self.assertRaises(ValueError, parse_time, 'yesterday')
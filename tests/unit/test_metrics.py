@@ -0,0 +1,86 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import datetime
+import unittest
+
+import mock
+
+import kappa.metrics
+from tests.unit.fake_aws import FakeBackend
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_batching_and_paging(self):
+        queries = [kappa.metrics.metric_query(
+            kappa.metrics.query_id('inv', i), 'Invocations',
+            {'FunctionName': 'f%d' % i}, 'Sum') for i in range(1200)]
+        pages = {}
+
+        def get_metric_data(MetricDataQueries, NextToken=None, **kwargs):
+            self.assertLessEqual(len(MetricDataQueries), 500)
+            first = MetricDataQueries[0]['Id']
+            # Every batch comes back in two pages, newest point last.
+            pages[first] = pages.get(first, 0) + 1
+            timestamp = 2 if NextToken else 1
+            response = {'MetricDataResults': [
+                {'Id': q['Id'], 'Timestamps': [timestamp],
+                 'Values': [float(timestamp)]} for q in MetricDataQueries]}
+            if not NextToken:
+                response['NextToken'] = 'more'
+            return response
+        cloudwatch = mock.Mock()
+        cloudwatch.get_metric_data.side_effect = get_metric_data
+        results = kappa.metrics.get_metric_data(cloudwatch, queries, 0, 1)
+        self.assertEqual(cloudwatch.get_metric_data.call_count, 6)
+        self.assertEqual(len(results), 1200)
+        self.assertEqual(results['q_inv_1199'],
+                         {'timestamps': [1, 2], 'values': [1.0, 2.0]})
+
+    def test_query_id(self):
+        self.assertEqual(kappa.metrics.query_id('p99', '$LATEST'),
+                         'q_p99__LATEST')
+
+    def test_function_metrics(self):
+        backend = FakeBackend()
+        now = datetime.datetime(2015, 1, 1, 12)
+        points = [(now - datetime.timedelta(minutes=m), float(m))
+                  for m in (5, 10, 15)]
+        backend.cloudwatch.put_datapoints(
+            'Invocations', {'FunctionName': 'f1'}, 'Sum', points)
+        backend.cloudwatch.put_datapoints(
+            'Duration', {'FunctionName': 'f1'}, 'p99', points)
+        names = ['f%d' % i for i in range(63)]
+        cloudwatch = backend.get_aws(None).create_client('cloudwatch')
+        results = kappa.metrics.function_metrics(
+            cloudwatch, names, now - datetime.timedelta(hours=1), now)
+        # 63 functions x 8 metrics need two requests.
+        self.assertEqual(
+            backend.call_counts()['cloudwatch.get_metric_data'], 2)
+        self.assertEqual(sorted(results), sorted(names))
+        invocations = results['f1']['invocations']
+        self.assertEqual(invocations['values'], [15.0, 10.0, 5.0])
+        self.assertEqual(kappa.metrics.summarize(invocations, 'Sum'), 30.0)
+        self.assertEqual(kappa.metrics.summarize(
+            results['f1']['duration_p99'], 'p99'), 15.0)
+        self.assertIsNone(kappa.metrics.summarize(
+            results['f2']['errors'], 'Sum'))
+
+    def test_sparkline(self):
+        self.assertEqual(kappa.metrics.sparkline([0, 7, 14]),
+                         u'\u2581\u2585\u2588')
+        self.assertEqual(kappa.metrics.sparkline([3, 3]), u'\u2581\u2581')
+        self.assertEqual(kappa.metrics.sparkline([1, 2, 3], width=2),
+                         u'\u2581\u2588')
+        self.assertEqual(kappa.metrics.sparkline([]), u'')
@@ -0,0 +1,92 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import os
+import pstats
+import shutil
+import tempfile
+import time
+import unittest
+
+import kappa.profiler
+from kappa.profiler import Profiler
+
+
+def busy(seconds):
+    deadline = time.time() + seconds
+    count = 0
+    while time.time() < deadline:
+        count += 1
+    return count
+
+
+def allocate(size):
+    data = bytearray(size)
+    return len(data)
+
+
+def fail():
+    raise ValueError('bad event')
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_cprofile(self):
+        profiler = Profiler(mode='cprofile', top=5)
+        profile = profiler.run(busy, 0.05)
+        self.assertGreater(profile['result'], 0)
+        self.assertIsNone(profile['error'])
+        names = [row['function'] for row in profile['functions']]
+        self.assertTrue(any(name.startswith('busy (test_profiler.py')
+                            for name in names))
+        path = profiler.write(os.path.join(self.path, 'out.pstats'))
+        stats = pstats.Stats(path)
+        self.assertTrue(any(key[2] == 'busy' for key in stats.stats))
+
+    @unittest.skipUnless(hasattr(kappa.profiler.signal, 'setitimer'),
+                         'needs setitimer')
+    def test_sample(self):
+        profiler = Profiler(mode='sample', interval=0.001)
+        profile = profiler.run(busy, 0.2)
+        self.assertGreater(profile['samples'], 0)
+        self.assertTrue(profile['functions'][0]['function'].startswith(
+            'busy (test_profiler.py'))
+        path = profiler.write(os.path.join(self.path, 'out.collapsed'))
+        with open(path) as fp:
+            lines = fp.read().splitlines()
+        # Collapsed stacks start at the handler, not in the profiler.
+        for line in lines:
+            stack, count = line.rsplit(' ', 1)
+            self.assertTrue(stack.startswith('busy '))
+            self.assertGreater(int(count), 0)
+
+    @unittest.skipIf(kappa.profiler.tracemalloc is None, 'needs tracemalloc')
+    def test_memory(self):
+        profile = Profiler(memory_size=128).run(allocate, 16 * 1024 * 1024)
+        self.assertGreaterEqual(profile['peak_memory'], 16 * 1024 * 1024)
+        self.assertGreater(profile['memory_fraction'], 0.12)
+        self.assertLess(profile['memory_fraction'], 0.8)
+
+    def test_error(self):
+        profile = Profiler().run(fail)
+        self.assertIsNone(profile['result'])
+        self.assertEqual(profile['error'], 'ValueError: bad event')
+
+    def test_unknown_mode(self):
+        self.assertRaises(ValueError, Profiler, mode='perf')
@@ -0,0 +1,85 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import kappa.executor
+import kappa.trace
+from kappa.context import Context
+from tests.unit.fake_aws import FakeBackend
+from tests.unit.test_context import make_config
+
+
+class TestTrace(unittest.TestCase):
+
+    def tearDown(self):
+        kappa.trace.disable()
+
+    def test_disabled(self):
+        with kappa.trace.span('foo') as span:
+            self.assertIsNone(span)
+
+    def test_nested_spans(self):
+        tracer = kappa.trace.enable()
+        with kappa.trace.span('outer', project='foo') as outer:
+            with kappa.trace.span('inner') as inner:
+                pass
+        self.assertEqual(inner.parent_id, outer.span_id)
+        self.assertIsNone(outer.parent_id)
+        events = tracer.chrome_trace()['traceEvents']
+        self.assertEqual([e['name'] for e in events], ['outer', 'inner'])
+        self.assertEqual(events[0]['args'], {'project': 'foo'})
+        spans = tracer.otlp()['resourceSpans'][0]['scopeSpans'][0]['spans']
+        self.assertEqual(spans[1]['parentSpanId'], spans[0]['spanId'])
+        self.assertEqual(len(spans[0]['traceId']), 32)
+
+    def test_spans_in_workers(self):
+        kappa.trace.enable()
+
+        def work(item):
+            with kappa.trace.span('work', item=item) as span:
+                return span
+        with kappa.trace.span('outer') as outer:
+            spans = kappa.executor.map(work, range(4), max_workers=4)
+        self.assertEqual([s.parent_id for s in spans], [outer.span_id] * 4)
+        self.assertIsNone(kappa.trace.current_span())
+
+    def test_error(self):
+        tracer = kappa.trace.enable()
+        try:
+            with kappa.trace.span('broken'):
+                raise ValueError('boom')
+        except ValueError:
+            pass
+        self.assertEqual(tracer.spans[0].error, 'ValueError: boom')
+
+    def test_deploy_phases(self):
+        path = tempfile.mkdtemp()
+        try:
+            os.mkdir(os.path.join(path, 'src'))
+            with open(os.path.join(path, 'src', 'foo.py'), 'w') as fp:
+                fp.write('def handler(event, context):\n    return event\n')
+            tracer = kappa.trace.enable()
+            backend = FakeBackend()
+            with backend.patch():
+                Context('foo', make_config(path)).deploy()
+        finally:
+            shutil.rmtree(path)
+        names = set(span.name for span in tracer.spans)
+        for name in ('deploy', 'policies', 'role', 'propagation_wait',
+                     'function.create', 'zip', 'create_function',
+                     'permissions'):
+            self.assertIn(name, names)
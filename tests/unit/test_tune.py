@@ -0,0 +1,127 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import base64
+import unittest
+
+import mock
+
+from kappa.log import parse_report
+from kappa.latency import LatencyProbe
+from kappa.tune import PowerTuner
+
+Report = ('START RequestId: 1f7c Version: $LATEST\n'
+          'END RequestId: 1f7c\n'
+          'REPORT RequestId: 1f7c\tDuration: %.2f ms\t'
+          'Billed Duration: %d ms\tMemory Size: %d MB\t'
+          'Max Memory Used: 40 MB\tInit Duration: 150.12 ms\t\n')
+
+# Simulated duration (ms) at each memory size.
+Durations = {128: 900.0, 256: 420.0, 512: 200.0, 1024: 190.0}
+
+
+def mock_function():
+    function = mock.Mock()
+    function.name = 'FooBarFunction'
+    function.memory_size = 128
+    function.status.return_value = {'Configuration': {'MemorySize': 256}}
+    state = {}
+
+    def set_memory_size(memory_size):
+        state['memory_size'] = memory_size
+        state['cold'] = True
+
+    def invoke(test_data=None):
+        memory_size = state['memory_size']
+        duration = Durations[memory_size]
+        log = Report % (duration, int(duration) + 1, memory_size)
+        if state['cold']:
+            # Cold starts are slow at every memory size.
+            log = log.replace('Duration: %.2f ms' % duration,
+                              'Duration: 5000.00 ms', 1)
+            state['cold'] = False
+        else:
+            log = log.replace('\tInit Duration: 150.12 ms', '')
+        return {'LogResult': base64.b64encode(log.encode('utf-8'))}
+
+    function.set_memory_size.side_effect = set_memory_size
+    function.invoke.side_effect = invoke
+    return function
+
+
+class TestTune(unittest.TestCase):
+
+    def test_parse_report(self):
+        report = parse_report(Report % (12.5, 13, 128))
+        self.assertEqual(report['duration'], 12.5)
+        self.assertEqual(report['billed_duration'], 13)
+        self.assertEqual(report['memory_size'], 128)
+        self.assertEqual(report['max_memory_used'], 40)
+        self.assertEqual(report['init_duration'], 150.12)
+        self.assertIsNone(parse_report('no report here'))
+
+    def test_cost_strategy(self):
+        function = mock_function()
+        tuner = PowerTuner(function, sorted(Durations), invocations=3)
+        result = tuner.run()
+        self.assertEqual(len(result['results']), 4)
+        self.assertEqual(result['recommended_memory_size'], 512)
+        # One discarded cold start per memory size.
+        self.assertEqual(function.invoke.call_count, 16)
+        first = result['results'][0]
+        self.assertEqual(first['duration']['max'], 900.0)
+        self.assertEqual(first['cold_start'], {'duration': 5000.0,
+                                               'init_duration': 150.12})
+        function.set_memory_size.assert_called_with(256)
+
+    def test_speed_strategy(self):
+        function = mock_function()
+        tuner = PowerTuner(function, sorted(Durations), invocations=1,
+                           strategy='speed')
+        result = tuner.run(restore=False)
+        self.assertEqual(result['recommended_memory_size'], 1024)
+        function.set_memory_size.assert_called_with(1024)
+
+    def test_bad_strategy(self):
+        self.assertRaises(ValueError, PowerTuner, mock.Mock(),
+                          strategy='fastest')
+
+
+class TestLatencyProbe(unittest.TestCase):
+
+    def test_cold_and_warm(self):
+        function = mock.Mock()
+        function.name = 'FooBarFunction'
+        function.get_environment.return_value = {'STAGE': 'dev'}
+        state = {'cold': True}
+
+        def force_cold_start():
+            state['cold'] = True
+
+        def invoke(test_data=None):
+            log = Report % (20.0, 21, 128)
+            if not state['cold']:
+                log = log.replace('\tInit Duration: 150.12 ms', '')
+            state['cold'] = False
+            return {'LogResult': base64.b64encode(log.encode('utf-8'))}
+
+        function.force_cold_start.side_effect = force_cold_start
+        function.invoke.side_effect = invoke
+        probe = LatencyProbe(function, invocations=4, batches=3,
+                             force_cold=True)
+        result = probe.run()
+        self.assertEqual(result['cold']['count'], 3)
+        self.assertEqual(result['warm']['count'], 9)
+        self.assertEqual(result['cold']['init_duration']['p50'], 150.12)
+        self.assertEqual(function.force_cold_start.call_count, 3)
+        function.set_environment.assert_called_once_with({'STAGE': 'dev'})
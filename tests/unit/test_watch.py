@@ -0,0 +1,128 @@
+# Copyright (c) 2015 Mitch Garnaat http://garnaat.org/
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+# http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import mock
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+from kappa.context import Context
+from kappa.watch import SourceTree, Watcher, code_sha256, monitor
+from tests.unit.fake_aws import FakeBackend
+from tests.unit.test_context import make_config
+
+
+class TestWatch(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.src = os.path.join(self.path, 'src')
+        os.mkdir(self.src)
+        self.write('foo.py', 'def handler(event, context):\n    return 1\n')
+        self.write('foo.pyc', 'ignored')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write(self, name, data):
+        with open(os.path.join(self.src, name), 'w') as fp:
+            fp.write(data)
+
+    def test_package_is_deterministic(self):
+        tree = SourceTree(self.src)
+        first = tree.package()
+        os.utime(os.path.join(self.src, 'foo.py'), (0, 0))
+        self.assertEqual(SourceTree(self.src).package(), first)
+
+    def test_sync(self):
+        backend = FakeBackend()
+        config = make_config(self.path)
+        del config['lambda']['event_sources']
+        with backend.patch():
+            context = Context('foo', config)
+            context.deploy()
+            watcher = Watcher(context.function)
+            # The deployed zip has real timestamps, so the first sync
+            # pushes the deterministic package once.
+            self.assertTrue(watcher.sync())
+            self.assertFalse(watcher.sync())
+            self.write('foo.pyc', 'still ignored')
+            self.assertFalse(watcher.sync())
+            self.write('foo.py', 'def handler(event, context):\n'
+                                 '    return 2\n')
+            self.assertTrue(watcher.sync())
+            function = backend.awslambda.functions['FooFunction']
+            self.assertEqual(function['Configuration']['CodeSha256'],
+                             code_sha256(SourceTree(self.src).package()))
+            # A new watcher sees the live code already matches.
+            self.assertFalse(Watcher(context.function).sync())
+        self.assertEqual(watcher.pushes, 2)
+
+    def test_failed_push_is_retried(self):
+        backend = FakeBackend()
+        config = make_config(self.path)
+        del config['lambda']['event_sources']
+        lines = []
+        with backend.patch():
+            context = Context('foo', config)
+            context.deploy()
+            watcher = Watcher(context.function, echo=lines.append,
+                              use_inotify=False)
+            error = ClientError({'Error': {'Code': 'ResourceConflictException',
+                                           'Message': 'update in progress'}},
+                                'UpdateFunctionCode')
+            with mock.patch.object(context.function, 'push_code',
+                                   side_effect=error):
+                watcher.run(iterations=1)
+            self.assertIn('push failed', lines[0])
+            self.assertEqual(watcher.pushes, 0)
+            # Errors below the API, such as a lost connection, too.
+            error = EndpointConnectionError(endpoint_url='https://lambda')
+            with mock.patch.object(context.function, 'push_code',
+                                   side_effect=error):
+                watcher.run(iterations=1)
+            self.assertIn('Could not connect', lines[1])
+            self.assertEqual(watcher.pushes, 0)
+            # The same source is pushed once the error clears.
+            self.assertTrue(watcher.sync())
+        self.assertEqual(watcher.pushes, 1)
+
+    def test_follow_logs(self):
+        backend = FakeBackend()
+        config = make_config(self.path)
+        del config['lambda']['event_sources']
+        lines = []
+        with backend.patch():
+            context = Context('foo', config)
+            context.deploy()
+            watcher = Watcher(context.function, echo=lines.append)
+            watcher.sync()
+            now = int(time.time() * 1000)
+            backend.logs.put_events('/aws/lambda/FooFunction', 's1', [
+                {'timestamp': now - 60000, 'message': 'old\n'},
+                {'timestamp': now + 1, 'message': 'new\n'}])
+            watcher._echo_new_logs()
+            watcher._echo_new_logs()
+        self.assertEqual(lines[1:], ['new'])
+
+    def test_polling_monitor(self):
+        watch = monitor(self.src, poll_interval=0.01, use_inotify=False)
+        self.assertFalse(watch.wait(0.02))
+        self.write('bar.py', 'x = 1\n')
+        self.assertTrue(watch.wait(0.02))
+        self.write('bar.py~', 'backup')
+        self.assertFalse(watch.wait(0.02))